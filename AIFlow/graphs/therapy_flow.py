@@ -1,119 +1,211 @@
+from langgraph.config import get_stream_writer
 from langgraph.graph import StateGraph, END
-from litellm import completion
-from AIFlow.tools.emotions_analyzer import emotion_tool
-from AIFlow.tools.crisis_detector import crisis_tool
-from AIFlow.tools.journal_tool import journal_tool
-from AIFlow.memory.state import TherapyState
+from AIFlow.tools.llm_client import GENERATOR, astream, complete
+import asyncio
+import os
+import threading
+from AIFlow.tools.emotions_analyzer import emotion_tool, aemotion_tool
+from AIFlow.tools.crisis_detector import adetect_crisis, contains_crisis_language, detect_crisis
+from AIFlow.tools.journal_tool import (
+    journal_tool,
+    astream_journal_tool,
+    journal_intent_tool,
+    ajournal_intent_tool,
+)
+from AIFlow.tools.turn_analyzer import turn_analysis_tool, aturn_analysis_tool
+from AIFlow.tools.local_classifier import (
+    local_emotion_tool,
+    alocal_emotion_tool,
+    local_journal_intent_tool,
+    alocal_journal_intent_tool,
+)
+from AIFlow.memory.state import PROMPT_HISTORY_MESSAGES, TherapyState
+from AIFlow.monitoring.metrics import timed_node
 from AIFlow.guardrails.input_moderation import (
+    ResponseStreamGate,
     contains_dangerous_response,
-    contains_unsafe_content,
-    detect_prompt_injection,
+    scan_input,
 )
 from AIFlow.guardrails.pii_detection import detect_pii
 from langchain_core.messages import HumanMessage, AIMessage
+from AIFlow.memory.prompt_builder import build_therapy_prompt, update_thread_summary
 from AIFlow.memory.memory_manager import (
+    DEFAULT_THREAD_ID,
     append_to_memory,
+    aappend_to_memory,
+    get_checkpointer,
     get_memory,
+    aget_memory,
+    get_thread_summary,
+    aget_thread_summary,
     save_to_long_term_memory,
+    asave_to_long_term_memory,
     search_long_term_memory,
+    asearch_long_term_memory,
+)
+
+# Set THERAPY_GRAPH_DEBUG=1 to get LangGraph's per-step state dumps.
+GRAPH_DEBUG = os.getenv("THERAPY_GRAPH_DEBUG", "false").lower() in ("1", "true", "yes")
+# "parallel": separate emotion/crisis/journal classifiers run concurrently.
+# "combined": a single structured turn-analysis call classifies all three.
+# "local":    emotion and journal intent come from an embedding classifier
+#             (LLM only when it isn't confident); crisis is checked as in "parallel".
+CLASSIFIER_MODE = os.getenv("THERAPY_CLASSIFIER", "parallel")
+
+CRISIS_MESSAGE = (
+    "I'm here for you. It sounds like you're going through something very difficult. "
+    "Please know you're not alone. If you're in immediate danger or need urgent help, "
+    "contact a mental health professional or crisis helpline in your area."
 )
+BLOCKED_MESSAGE = "Your input contains unsafe content and has been blocked."
+INJECTION_MESSAGE = "Your input appears to contain prompt injection and has been blocked."
+PII_MESSAGE = "Your message contains sensitive personal information. Please remove or rephrase it."
+
+
+def _prompt_context(state: TherapyState, relevant_memories: list, summary):
+    prompt = build_therapy_prompt(
+        state["emotion"], state["input"], state["messages"], relevant_memories, summary
+    )
+    update_thread_summary(
+        state["user_id"], _thread_id(state), state["messages"], prompt.window_start, summary
+    )
+    return prompt.messages
 
 
+def _thread_id(state: TherapyState) -> str:
+    return state.get("thread_id") or DEFAULT_THREAD_ID
+
+
+async def _astream_completion(messages: list):
+    async for chunk in astream(GENERATOR, messages):
+        delta = chunk.choices[0].delta.content
+        if delta:
+            yield delta
+
+
+async def _stream_response(node: str, deltas) -> str:
+    """
+    Forward generated text to LangGraph's custom stream as it arrives and
+    return the full response. Text passes through ResponseStreamGate, so
+    nothing the output validator would block reaches the client.
+    """
+    writer = get_stream_writer()
+    gate = ResponseStreamGate()
+    async for delta in deltas:
+        released = gate.feed(delta)
+        if released:
+            writer({"type": "token", "node": node, "delta": released})
+    released = gate.close()
+    if released:
+        writer({"type": "token", "node": node, "delta": released})
+    return gate.text
+
+
+# With a checkpointer the conversation's recent messages are already in the
+# state; they are only loaded from memory_logs for a thread it hasn't seen.
+def restore_history_node(state: TherapyState) -> TherapyState:
+    if state.get("messages"):
+        return {}
+    return {"messages": get_memory(state, limit=PROMPT_HISTORY_MESSAGES)}
+
+
+async def arestore_history_node(state: TherapyState) -> TherapyState:
+    if state.get("messages"):
+        return {}
+    return {"messages": await aget_memory(state, limit=PROMPT_HISTORY_MESSAGES)}
+
+
+# Generator nodes only produce the response; it is written to short-term
+# memory by commit_response_node once output validation has passed.
 def therapy_node(state: TherapyState) -> TherapyState:
     user_input = state["input"]
-    history = get_memory(state, from_db=False)
-    memory_msgs = [
-        {
-            "role": "user" if isinstance(m, HumanMessage) else "assistant",
-            "content": m.content,
-        }
-        for m in history
-    ]
-
-    memory_msgs.insert(
-        0,
-        {
-            "role": "system",
-            "content": f"You are a compassionate therapist. The user currently feels {state['emotion']}.",
-        },
-    )
-    memory_msgs.append({"role": "user", "content": user_input})
 
     relevant_docs = search_long_term_memory(state["user_id"], user_input)
     relevant_memories = [doc.page_content for doc in relevant_docs]
+    summary = get_thread_summary(state["user_id"], _thread_id(state))
 
-    prompt = [
-        {
-            "role": "system",
-            "content": f"You are a compassionate therapist. The user currently feels {state['emotion']}.",
-        }
-    ]
-
-    if relevant_memories:
-        memory_str = "\n\n".join(relevant_memories)
-        prompt.append(
-            {
-                "role": "system",
-                "content": f"The user previously shared the following relevant context:\n{memory_str}",
-            }
-        )
-
-    prompt += memory_msgs
-    prompt.append({"role": "user", "content": user_input})
+    prompt = _prompt_context(state, relevant_memories, summary)
 
     # === 4. Generate response ===
-    response = completion(model="gemini/gemini-2.0-flash", messages=prompt)
+    response = complete(GENERATOR, prompt)
     ai_message = response["choices"][0]["message"]["content"]
 
-    # === 5. Save to short-term memory ===
-    state = append_to_memory(state, HumanMessage(content=user_input), role="user")
-    state = append_to_memory(state, AIMessage(content=ai_message), role="assistant")
+    return {"response": ai_message, "relevant_memories": relevant_memories}
 
-    return {
-        **state,
-        "response": ai_message,
-        "relevant_memories": relevant_memories,
-    }
 
+async def atherapy_node(state: TherapyState) -> TherapyState:
+    user_input = state["input"]
 
-# Emotion detection node
+    relevant_docs, summary = await asyncio.gather(
+        asearch_long_term_memory(state["user_id"], user_input),
+        aget_thread_summary(state["user_id"], _thread_id(state)),
+    )
+    relevant_memories = [doc.page_content for doc in relevant_docs]
+
+    prompt = _prompt_context(state, relevant_memories, summary)
+    ai_message = await _stream_response(
+        "chat", _astream_completion(prompt)
+    )
+
+    return {"response": ai_message, "relevant_memories": relevant_memories}
+
+
+# Emotion, crisis and journal-intent classification run in parallel, so each
+# of these nodes returns only the key it owns.
 def emotion_node(state: TherapyState) -> TherapyState:
-    emotion = emotion_tool(state["input"])
-    return {**state, "emotion": emotion}
+    return {"emotion": emotion_tool(state["input"])}
+
+
+async def aemotion_node(state: TherapyState) -> TherapyState:
+    return {"emotion": await aemotion_tool(state["input"])}
 
 
 # Crisis detection logic
-def crisis_check_node(state: TherapyState) -> str:
-    is_crisis = crisis_tool(state["input"])
-    return "crisis" if is_crisis else "safe"
+def crisis_check_node(state: TherapyState) -> TherapyState:
+    verdict = detect_crisis(state["input"])
+    return {"is_crisis": verdict.crisis, "crisis_tier": verdict.tier}
+
+
+async def acrisis_check_node(state: TherapyState) -> TherapyState:
+    verdict = await adetect_crisis(state["input"])
+    return {"is_crisis": verdict.crisis, "crisis_tier": verdict.tier}
 
 
 # Emergency response
 def crisis_node(state: TherapyState) -> TherapyState:
-    message = (
-        "I'm here for you. It sounds like you're going through something very difficult. "
-        "Please know you're not alone. If you're in immediate danger or need urgent help, "
-        "contact a mental health professional or crisis helpline in your area."
-    )
     state = append_to_memory(state, HumanMessage(content=state["input"]), role="user")
-    state = append_to_memory(state, AIMessage(content=message), role="assistant")
-    return {**state, "response": message}
+    state = append_to_memory(state, AIMessage(content=CRISIS_MESSAGE), role="assistant")
+    return {"messages": state["messages"], "response": CRISIS_MESSAGE}
+
+
+async def acrisis_node(state: TherapyState) -> TherapyState:
+    state = await aappend_to_memory(state, HumanMessage(content=state["input"]), role="user")
+    state = await aappend_to_memory(state, AIMessage(content=CRISIS_MESSAGE), role="assistant")
+    return {"messages": state["messages"], "response": CRISIS_MESSAGE}
 
 
 def journal_intent_node(state: TherapyState) -> TherapyState:
-    user_input = state["input"]
-    response = completion(
-        model="gemini/gemini-2.0-flash-lite",
-        messages=[
-            {
-                "role": "system",
-                "content": "You classify if a user message is a journal entry or a request for therapy chat. Reply ONLY with 'journal' or 'chat'.",
-            },
-            {"role": "user", "content": f"Message: {user_input}"},
-        ],
-    )
-    result = response["choices"][0]["message"]["content"].strip().lower()
-    return {**state, "mode": result}
+    return {"mode": journal_intent_tool(state["input"])}
+
+
+async def ajournal_intent_node(state: TherapyState) -> TherapyState:
+    return {"mode": await ajournal_intent_tool(state["input"])}
+
+
+def local_emotion_node(state: TherapyState) -> TherapyState:
+    return {"emotion": local_emotion_tool(state["input"])}
+
+
+async def alocal_emotion_node(state: TherapyState) -> TherapyState:
+    return {"emotion": await alocal_emotion_tool(state["input"])}
+
+
+def local_journal_intent_node(state: TherapyState) -> TherapyState:
+    return {"mode": local_journal_intent_tool(state["input"])}
+
+
+async def alocal_journal_intent_node(state: TherapyState) -> TherapyState:
+    return {"mode": await alocal_journal_intent_tool(state["input"])}
 
 
 def is_journal_entry(state: TherapyState) -> bool:
@@ -123,6 +215,45 @@ def is_journal_entry(state: TherapyState) -> bool:
     return state["mode"] == "journal"
 
 
+def _turn_analysis_update(analysis, text: str) -> TherapyState:
+    # The lexical crisis screen still applies when one call classifies everything.
+    lexical_crisis = contains_crisis_language(text)
+    return {
+        "emotion": analysis.emotion,
+        "is_crisis": analysis.crisis or lexical_crisis,
+        "crisis_tier": "lexical" if lexical_crisis else "llm",
+        "mode": analysis.mode,
+        "classifier_confidence": analysis.confidence,
+    }
+
+
+def turn_analysis_node(state: TherapyState) -> TherapyState:
+    return _turn_analysis_update(turn_analysis_tool(state["input"]), state["input"])
+
+
+async def aturn_analysis_node(state: TherapyState) -> TherapyState:
+    return _turn_analysis_update(await aturn_analysis_tool(state["input"]), state["input"])
+
+
+CLASSIFIER_NODES = {
+    "parallel": ["analyze_emotion", "check_crisis", "check_journal"],
+    "combined": ["analyze_turn"],
+    "local": ["analyze_emotion", "check_crisis", "check_journal"],
+}
+
+
+def join_classifiers(state: TherapyState) -> TherapyState:
+    """Fan-in point: runs once all classifiers have written their results."""
+    return {}
+
+
+def route_after_classification(state: TherapyState) -> str:
+    # Crisis always takes precedence over journaling or chat.
+    if state.get("is_crisis"):
+        return "crisis"
+    return "journal" if is_journal_entry(state) else "chat"
+
+
 # 🪞 Journal Response Node
 def journal_node(state: TherapyState) -> TherapyState:
     entry = state["input"]
@@ -131,11 +262,30 @@ def journal_node(state: TherapyState) -> TherapyState:
     save_to_long_term_memory(
         state["user_id"], content=entry, metadata={"type": "journal"}
     )
+    return {"response": reflection}
 
-    # Store in short-term memory
-    state = append_to_memory(state, HumanMessage(content=entry), role="user")
-    state = append_to_memory(state, AIMessage(content=reflection), role="assistant")
-    return {**state, "response": reflection}
+
+async def ajournal_node(state: TherapyState) -> TherapyState:
+    entry = state["input"]
+    reflection = await _stream_response("journal", astream_journal_tool(entry))
+
+    await asave_to_long_term_memory(
+        state["user_id"], content=entry, metadata={"type": "journal"}
+    )
+    return {"response": reflection}
+
+
+def commit_response_node(state: TherapyState) -> TherapyState:
+    """Store the user input and the validated response in short-term memory."""
+    state = append_to_memory(state, HumanMessage(content=state["input"]), role="user")
+    state = append_to_memory(state, AIMessage(content=state["response"]), role="assistant")
+    return {"messages": state["messages"]}
+
+
+async def acommit_response_node(state: TherapyState) -> TherapyState:
+    state = await aappend_to_memory(state, HumanMessage(content=state["input"]), role="user")
+    state = await aappend_to_memory(state, AIMessage(content=state["response"]), role="assistant")
+    return {"messages": state["messages"]}
 
 
 # def input_moderation_node(state: TherapyState) -> str:
@@ -151,23 +301,40 @@ def response_validation_node(state: TherapyState) -> str:
     return "unsafe" if contains_dangerous_response(state["response"]) else "safe"
 
 # 1. Check input safety
-def input_moderation_check(state: TherapyState) -> str:
-    if contains_unsafe_content(state["input"]):
-        return {**state, "attack": "blocked"}
-    if detect_prompt_injection(state["input"]):
-        return {**state, "attack": "injected"}
-    return {**state, "attack": "safe"}
+def input_moderation_check(state: TherapyState) -> TherapyState:
+    # One scan covers moderation, injection and PII; the matches are kept so
+    # the PII check and the client can see why an input was blocked.
+    matches = scan_input(state["input"])
+    categories = {m.category for m in matches}
+    # Someone describing suicidal thoughts or self-harm needs the crisis
+    # response, not a "blocked" message.
+    if "unsafe" in categories and not contains_crisis_language(state["input"]):
+        attack = "blocked"
+    elif "injection" in categories:
+        attack = "injected"
+    else:
+        attack = "safe"
+    return {"attack": attack, "guardrail_matches": [m.to_dict() for m in matches]}
 
 # 2. Handle unsafe or injected input
 def handle_blocked_input(state: TherapyState) -> TherapyState:
-    msg = "Your input contains unsafe content and has been blocked."
-    state = append_to_memory(state, AIMessage(content=msg), role="assistant")
-    return {**state, "response": msg}
+    state = append_to_memory(state, AIMessage(content=BLOCKED_MESSAGE), role="assistant")
+    return {"messages": state["messages"], "response": BLOCKED_MESSAGE}
+
+
+async def ahandle_blocked_input(state: TherapyState) -> TherapyState:
+    state = await aappend_to_memory(state, AIMessage(content=BLOCKED_MESSAGE), role="assistant")
+    return {"messages": state["messages"], "response": BLOCKED_MESSAGE}
+
 
 def handle_prompt_injection(state: TherapyState) -> TherapyState:
-    msg = "Your input appears to contain prompt injection and has been blocked."
-    state = append_to_memory(state, AIMessage(content=msg), role="assistant")
-    return {**state, "response": msg}
+    state = append_to_memory(state, AIMessage(content=INJECTION_MESSAGE), role="assistant")
+    return {"messages": state["messages"], "response": INJECTION_MESSAGE}
+
+
+async def ahandle_prompt_injection(state: TherapyState) -> TherapyState:
+    state = await aappend_to_memory(state, AIMessage(content=INJECTION_MESSAGE), role="assistant")
+    return {"messages": state["messages"], "response": INJECTION_MESSAGE}
 
 
 def output_validation_node(state: TherapyState) -> TherapyState:
@@ -176,58 +343,120 @@ def output_validation_node(state: TherapyState) -> TherapyState:
     """
     response_status = response_validation_node(state)
     if response_status == "unsafe":
+        state = append_to_memory(state, HumanMessage(content=state["input"]), role="user")
         state = append_to_memory(
             state,
             AIMessage(content="The AI response was flagged as unsafe."),
             role="assistant",
         )
-        return {**state, "response": "Response blocked due to safety concerns."}
+        return {"messages": state["messages"], "response": "Response blocked due to safety concerns."}
 
-    return state
+    return {}
+
+
+async def aoutput_validation_node(state: TherapyState) -> TherapyState:
+    """
+    Async variant of output_validation_node.
+    """
+    if response_validation_node(state) == "unsafe":
+        state = await aappend_to_memory(state, HumanMessage(content=state["input"]), role="user")
+        state = await aappend_to_memory(
+            state,
+            AIMessage(content="The AI response was flagged as unsafe."),
+            role="assistant",
+        )
+        return {"messages": state["messages"], "response": "Response blocked due to safety concerns."}
+
+    return {}
 
 
 def pii_detection_node(state: TherapyState) -> TherapyState:
-    pii_found = detect_pii(state["input"])
+    matches = state.get("guardrail_matches")
+    if matches is None:
+        pii_found = detect_pii(state["input"])
+    else:
+        pii_found = any(m["category"] == "pii" for m in matches)
     if pii_found:
-        return {**state, "attack": "pii_found"}
-    return state
+        return {"attack": "pii_found"}
+    return {}
 
 def handle_pii(state: TherapyState) -> TherapyState:
     state = append_to_memory(
         state,
-        AIMessage(content="Your message contains sensitive personal information. Please remove or rephrase it."),
+        AIMessage(content=PII_MESSAGE),
         role="assistant"
     )
-    return {**state, "response": "Input blocked due to PII."}
+    return {"messages": state["messages"], "response": "Input blocked due to PII."}
+
+
+async def ahandle_pii(state: TherapyState) -> TherapyState:
+    state = await aappend_to_memory(state, AIMessage(content=PII_MESSAGE), role="assistant")
+    return {"messages": state["messages"], "response": "Input blocked due to PII."}
 
 
 
 # Define the graph
-def build_therapy_graph():
+def build_therapy_graph(
+    debug: bool = False,
+    use_async: bool = False,
+    classifier: str = "parallel",
+    checkpointer=None,
+):
+    """
+    Build and compile the therapy graph.
+
+    With use_async=True every node that calls an LLM, Supabase or the vector
+    store is a coroutine, and the compiled graph must be run with ainvoke.
+    `classifier` selects how emotion, crisis and journal intent are
+    classified (see CLASSIFIER_MODE). With a `checkpointer` (any LangGraph
+    saver, e.g. SqliteCheckpointSaver or the Postgres saver) the state
+    persists per thread between turns; run it with a configurable thread_id.
+    """
+    if classifier not in CLASSIFIER_NODES:
+        raise ValueError(f"Unknown classifier mode: {classifier}")
+    classifier_nodes = CLASSIFIER_NODES[classifier]
     graph = StateGraph(TherapyState)
 
-    # === Add All Nodes ===
-    
-    graph.add_node("check_input_moderation", input_moderation_check)
-    graph.add_node("handle_blocked", handle_blocked_input)
-    graph.add_node("handle_injection", handle_prompt_injection)
-
-    graph.add_node("check_pii", pii_detection_node)
-    graph.add_node("handle_pii", handle_pii)
+    def pick(sync_fn, async_fn):
+        return async_fn if use_async else sync_fn
 
-    graph.add_node("analyze_emotion", emotion_node)
-    graph.add_node("check_crisis", crisis_check_node)
-    graph.add_node("crisis", crisis_node)
+    # Every node reports its wall time to therapy_node_duration_seconds.
+    def add_node(name, fn):
+        graph.add_node(name, timed_node(name, fn))
 
-    graph.add_node("check_journal", journal_intent_node)
-    graph.add_node("journal", journal_node)
+    # === Add All Nodes ===
 
-    graph.add_node("chat", therapy_node)
+    add_node("restore_history", pick(restore_history_node, arestore_history_node))
+    add_node("check_input_moderation", input_moderation_check)
+    add_node("handle_blocked", pick(handle_blocked_input, ahandle_blocked_input))
+    add_node("handle_injection", pick(handle_prompt_injection, ahandle_prompt_injection))
+
+    add_node("check_pii", pii_detection_node)
+    add_node("handle_pii", pick(handle_pii, ahandle_pii))
+
+    if classifier == "combined":
+        add_node("analyze_turn", pick(turn_analysis_node, aturn_analysis_node))
+    elif classifier == "local":
+        add_node("analyze_emotion", pick(local_emotion_node, alocal_emotion_node))
+        add_node("check_crisis", pick(crisis_check_node, acrisis_check_node))
+        add_node("check_journal", pick(local_journal_intent_node, alocal_journal_intent_node))
+    else:
+        add_node("analyze_emotion", pick(emotion_node, aemotion_node))
+        add_node("check_crisis", pick(crisis_check_node, acrisis_check_node))
+        add_node("check_journal", pick(journal_intent_node, ajournal_intent_node))
+    add_node("route_turn", join_classifiers)
+
+    add_node("crisis", pick(crisis_node, acrisis_node))
+    add_node("journal", pick(journal_node, ajournal_node))
+
+    add_node("chat", pick(therapy_node, atherapy_node))
     # graph.add_node("check_output_moderation", response_validation_node)
-    graph.add_node("handle_unsafe_response", output_validation_node)
+    add_node("handle_unsafe_response", pick(output_validation_node, aoutput_validation_node))
+    add_node("commit_response", pick(commit_response_node, acommit_response_node))
 
     # === Entry Point ===
-    graph.set_entry_point("check_input_moderation")
+    graph.set_entry_point("restore_history")
+    graph.add_edge("restore_history", "check_input_moderation")
 
     # === Moderation Routing ===
     graph.add_conditional_edges(
@@ -243,56 +472,76 @@ def build_therapy_graph():
     graph.add_edge("handle_injection", END)
 
     # === PII Routing ===
+    # Safe input fans out to every classifier node at once.
     graph.add_conditional_edges(
         "check_pii",
-        lambda state: state['attack'],
+        lambda state: "pii_found" if state["attack"] == "pii_found" else classifier_nodes,
         {
             "pii_found": "handle_pii",
-            "safe": "analyze_emotion",
+            **{name: name for name in classifier_nodes},
         },
     )
     graph.add_edge("handle_pii", END)
 
-    # === Emotional Analysis and Crisis Check ===
+    # === Classification (emotion, crisis, journal intent) ===
+    graph.add_edge(classifier_nodes, "route_turn")
     graph.add_conditional_edges(
-        "analyze_emotion",
-        crisis_check_node,
+        "route_turn",
+        route_after_classification,
         {
-            "safe": "check_journal",
             "crisis": "crisis",
+            "journal": "journal",
+            "chat": "chat",
         },
     )
     graph.add_edge("crisis", END)
 
-    # === Journal Detection ===
-    graph.add_conditional_edges(
-        "check_journal",
-        is_journal_entry,
-        {
-            True: "journal",
-            False: "chat",
-        },
-    )
-    graph.add_edge("journal", END)
-
-    # === Chat Node and Output Guarding ===
+    # === Output Guarding (chat and journal responses) ===
     # graph.add_edge("chat", "check_output_moderation")
-    graph.add_conditional_edges(
-        "chat",
-        response_validation_node,
-        {
-            "safe": END,
-            "unsafe": "handle_unsafe_response",
-        },
-    )
+    for generator in ("chat", "journal"):
+        graph.add_conditional_edges(
+            generator,
+            response_validation_node,
+            {
+                "safe": "commit_response",
+                "unsafe": "handle_unsafe_response",
+            },
+        )
+    graph.add_edge("commit_response", END)
     graph.add_edge("handle_unsafe_response", END)
 
-    return graph.compile(debug=True)
+    return graph.compile(debug=debug, checkpointer=checkpointer)
+
+
+# Compiled graphs are immutable and safe to share, so each process builds
+# every variant once and reuses it for all turns.
+_compiled_graphs = {}
+_graph_lock = threading.Lock()
+
+
+def get_therapy_graph(
+    debug: bool = GRAPH_DEBUG, use_async: bool = False, classifier: str = CLASSIFIER_MODE
+):
+    """Return the process-wide compiled therapy graph, building it on first use."""
+    key = (debug, use_async, classifier)
+    graph = _compiled_graphs.get(key)
+    if graph is None:
+        with _graph_lock:
+            graph = _compiled_graphs.get(key)
+            if graph is None:
+                graph = build_therapy_graph(
+                    debug=debug,
+                    use_async=use_async,
+                    classifier=classifier,
+                    checkpointer=get_checkpointer(),
+                )
+                _compiled_graphs[key] = graph
+    return graph
 
 
 # Example usage
 if __name__ == "__main__":
-    flow = build_therapy_graph()
+    flow = build_therapy_graph(debug=True)
     config = {"configurable": {"thread_id": "1"}}
 
     # === Input Examples for Each Condition ===
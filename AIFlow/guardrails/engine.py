@@ -0,0 +1,193 @@
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+@dataclass(frozen=True)
+class GuardrailMatch:
+    category: str  # e.g. 'unsafe', 'injection', 'pii'
+    label: str  # the keyword that matched, or the pattern's name
+    start: int
+    end: int
+
+    def to_dict(self) -> Dict:
+        return {"category": self.category, "label": self.label, "start": self.start, "end": self.end}
+
+
+def keyword_pattern(keywords: Iterable[str]) -> str:
+    """
+    Compile literal keywords into a prefix-factored regex ("kill" and
+    "kill myself" become kill(?:\\ myself)?), the trie an Aho-Corasick
+    automaton would build, so each text position is tested by walking one
+    shared trie in the C regex engine instead of once per keyword.
+    """
+    trie: Dict = {}
+    for word in keywords:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def emit(node: Dict) -> str:
+        branches = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            # Prefer the longer keyword, fall back to the one ending here.
+            body = (body if len(branches) > 1 else "(?:" + body + ")") + "?"
+        return body
+
+    return emit(trie)
+
+
+class GuardrailEngine:
+    """
+    Scans text for every guardrail category in a single pass.
+
+    All keywords (from every category) are compiled into one trie-shaped
+    regex, matched against the lower-cased text, so a message is lower-cased
+    once and scanned once no matter how many keywords there are.
+
+    Regex patterns are too costly to try at every position, so each one is
+    given as (pattern, (triggers, span)): a string of trigger characters
+    (e.g. "@" for emails) that are added to the trie, and a one-character
+    class `span` that the pattern's matches consist of. Wherever a trigger
+    is found, the patterns it gates are run as one combined regex with a
+    named group each, over just the run of `span` characters around it.
+    Patterns must be linear-time: no nested unbounded quantifiers.
+    """
+
+    def __init__(
+        self,
+        keywords: Optional[Dict[str, Union[Iterable[str], Dict[str, str]]]] = None,
+        patterns: Optional[Dict[str, Dict[str, Tuple[str, Tuple[str, str]]]]] = None,
+    ):
+        # lower-cased keyword -> (category, label); a list of keywords labels
+        # each match with the keyword itself
+        self._keywords: Dict[str, Tuple[str, str]] = {}
+        for category, words in (keywords or {}).items():
+            labels = words if isinstance(words, dict) else {word: word for word in words}
+            for word, label in labels.items():
+                self._keywords.setdefault(word.lower(), (category, label))
+        self._max_keyword = max(map(len, self._keywords), default=0)
+
+        grouped: Dict[Tuple[str, str], List[Tuple[str, str, str]]] = {}
+        for category, rules in (patterns or {}).items():
+            for label, (pattern, gate) in rules.items():
+                grouped.setdefault(gate, []).append((category, label, pattern))
+        # trigger character -> indexes into self._gates
+        self._triggers: Dict[str, List[int]] = {}
+        self._gates: List[_Gate] = []
+        for (triggers, span), rules in grouped.items():
+            for ch in triggers:
+                if any(word.startswith(ch) for word in self._keywords):
+                    raise ValueError(f"Trigger {ch!r} also starts a keyword")
+                self._triggers.setdefault(ch, []).append(len(self._gates))
+            self._gates.append(_Gate(triggers, span, rules))
+
+        self._keyword_regex = _Compiled(keyword_pattern(self._keywords))
+        self._scan_regex = _Compiled(keyword_pattern(list(self._keywords) + list(self._triggers)))
+
+    def _iter(self, text: str) -> Iterator[GuardrailMatch]:
+        lowered = text.lower()
+        # If lower-casing changes the text's length (e.g. 'İ') match spans
+        # would shift, so match the original text case-insensitively instead.
+        folded = len(lowered) != len(text)
+        subject = text if folded else lowered
+        scan = self._scan_regex.get(folded)
+        gate_ends = [0] * len(self._gates)
+        pos = 0
+        while True:
+            m = scan.search(subject, pos)
+            if m is None:
+                return
+            gates = self._triggers.get(m.group())
+            if gates is None:
+                yield from self._keyword_match(m)
+                # Resume just after the match start rather than its end, so a
+                # keyword can't hide another one it overlaps.
+                pos = m.start() + 1
+                continue
+            # A trigger: run its gates over their windows, then skip past
+            # them (scanning the skipped text for keywords only), which keeps
+            # long runs of triggers such as digits linear.
+            pos = len(subject)
+            for index in gates:
+                if m.start() >= gate_ends[index]:
+                    gate = self._gates[index]
+                    left, right = gate.window(subject, m.start(), m.end())
+                    yield from gate.matches(subject, left, right, folded)
+                    gate_ends[index] = right
+                pos = min(pos, gate_ends[index])
+            # Only these gates' triggers are skipped: the window can hold
+            # another gate's triggers (digits inside an email-like run), so
+            # resume at the first one that gate hasn't covered yet.
+            for index, gate in enumerate(self._gates):
+                if index not in gates:
+                    other = gate.trigger.get(folded).search(subject, max(m.start() + 1, gate_ends[index]), pos)
+                    if other is not None:
+                        pos = other.start()
+            keywords = self._keyword_regex.get(folded)
+            endpos = min(len(subject), pos + self._max_keyword)
+            at = m.start() + 1
+            while True:
+                km = keywords.search(subject, at, endpos)
+                if km is None or km.start() >= pos:
+                    break
+                yield from self._keyword_match(km)
+                at = km.start() + 1
+
+    def _keyword_match(self, m: "re.Match") -> Iterator[GuardrailMatch]:
+        rule = self._keywords.get(m.group().lower())
+        if rule is not None:
+            yield GuardrailMatch(rule[0], rule[1], m.start(), m.end())
+
+    def scan(self, text: str) -> List[GuardrailMatch]:
+        """Return every match, ordered by position."""
+        return sorted(self._iter(text), key=lambda match: (match.start, match.end))
+
+    def first(self, text: str, category: Optional[str] = None) -> Optional[GuardrailMatch]:
+        """Return a match (of `category`, if given), stopping as soon as one is found."""
+        for match in self._iter(text):
+            if category is None or match.category == category:
+                return match
+        return None
+
+
+class _Compiled:
+    """A pattern compiled for lower-cased text and, as a fallback, case-insensitively."""
+
+    def __init__(self, source: str):
+        source = source or "(?!)"
+        self.lower = re.compile(source)
+        self.ignorecase = re.compile(source, re.IGNORECASE)
+
+    def get(self, folded: bool) -> "re.Pattern":
+        return self.ignorecase if folded else self.lower
+
+
+class _Gate:
+    """The regex patterns sharing one set of trigger characters."""
+
+    def __init__(self, triggers: str, span: str, rules: List[Tuple[str, str, str]]):
+        self.trigger = _Compiled("[" + re.escape(triggers) + "]")
+        self.span = re.compile(span)
+        self.run = re.compile(f"(?:{span})*")
+        self.groups = {f"p{i}": (category, label) for i, (category, label, _) in enumerate(rules)}
+        self.regex = _Compiled("|".join(f"(?P<p{i}>{pattern})" for i, (_, _, pattern) in enumerate(rules)))
+
+    def window(self, subject: str, start: int, end: int) -> Tuple[int, int]:
+        """The run of span characters around subject[start:end]."""
+        left = start
+        while left > 0 and self.span.match(subject, left - 1):
+            left -= 1
+        return left, self.run.match(subject, end).end()
+
+    def matches(self, subject: str, left: int, right: int, folded: bool) -> Iterator[GuardrailMatch]:
+        # One character past the window, so \b and lookaheads see real context
+        endpos = min(len(subject), right + 1)
+        for m in self.regex.get(folded).finditer(subject, left, endpos):
+            if m.start() >= right:
+                return
+            category, label = self.groups[m.lastgroup]
+            yield GuardrailMatch(category, label, m.start(), m.end())
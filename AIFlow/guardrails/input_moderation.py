@@ -1,18 +1,50 @@
-import re
+from typing import List
+from AIFlow.guardrails.engine import GuardrailEngine, GuardrailMatch
+from AIFlow.guardrails.pii_detection import PII_PATTERNS
+
+# Simple keyword-based filter — you can use OpenAI/Anthropic moderation APIs here.
+UNSAFE_KEYWORDS = [
+    "kill myself", "suicide", "abuse", "rape", "murder",
+    "hate speech", "bomb", "school shooting", "cut myself",
+    "terrorism", "kill", "hurt", "self-harm", "violence",
+]
+
+# phrase -> label reported when it matches
+INJECTION_PHRASES = {
+    "ignore previous": "ignore_previous", "ignore the previous": "ignore_previous",
+    "disregard above": "disregard_above", "disregard the above": "disregard_above",
+    "act as": "act_as", "simulate": "simulate", "pretend to": "pretend_to",
+    "bypass": "bypass", "jailbreak": "jailbreak", "you are now": "you_are_now",
+}
+
+DANGEROUS_RESPONSE_PHRASES = [
+    "you should just give up", "go ahead and hurt yourself",
+    "i diagnose you", "take medication", "here’s how to",
+    "no one cares", "you are worthless"
+]
+
+# Compiled once at import; every check below is a single pass over the text.
+input_guardrails = GuardrailEngine(
+    keywords={"unsafe": UNSAFE_KEYWORDS, "injection": INJECTION_PHRASES},
+    patterns={"pii": PII_PATTERNS},
+)
+output_guardrails = GuardrailEngine(keywords={"dangerous_response": DANGEROUS_RESPONSE_PHRASES})
+
+
+def scan_input(text: str) -> List[GuardrailMatch]:
+    """
+    Returns every unsafe keyword, prompt-injection phrase and PII pattern
+    found in the input, with its category and span.
+    """
+    return input_guardrails.scan(text)
+
 
 # 🛡️ Input Moderation Check
 def contains_unsafe_content(text: str) -> bool:
     """
     Returns True if the input contains unsafe or flagged content.
     """
-    # Simple keyword-based filter — you can use OpenAI/Anthropic moderation APIs here.
-    unsafe_keywords = [
-        "kill myself", "suicide", "abuse", "rape", "murder",
-        "hate speech", "bomb", "school shooting", "cut myself"
-        "terrorism", "kill", "hurt", "self-harm", "violence",
-    ]
-    text = text.lower()
-    return any(word in text for word in unsafe_keywords)
+    return input_guardrails.first(text, "unsafe") is not None
 
 
 # 🧪 Prompt Injection Detector
@@ -20,12 +52,7 @@ def detect_prompt_injection(text: str) -> bool:
     """
     Detect basic prompt injection attempts using keyword matching.
     """
-    injection_patterns = [
-        r"ignore (the )?previous", r"disregard (the )?above",
-        r"act as", r"simulate", r"pretend to", r"bypass",
-        r"jailbreak", r"you are now"
-    ]
-    return any(re.search(pattern, text.lower()) for pattern in injection_patterns)
+    return input_guardrails.first(text, "injection") is not None
 
 
 # 🧯 Output Safety Validator
@@ -34,9 +61,50 @@ def contains_dangerous_response(text: str) -> bool:
     Detect unsafe AI responses, e.g., that could be interpreted as medical advice,
     harmful instructions, or misinformation.
     """
-    flagged_phrases = [
-        "you should just give up", "go ahead and hurt yourself",
-        "I diagnose you", "take medication", "here’s how to",
-        "no one cares", "you are worthless"
-    ]
-    return any(phrase in text.lower() for phrase in flagged_phrases)
+    return output_guardrails.first(text) is not None
+
+
+class ResponseStreamGate:
+    """
+    Releases a streamed response to the client only once it has been checked.
+
+    The last few characters are held back so a flagged phrase split across
+    chunks is never sent before the full phrase can be detected; once any
+    phrase is found nothing more is released.
+    """
+
+    holdback = max(len(phrase) for phrase in DANGEROUS_RESPONSE_PHRASES)
+
+    def __init__(self):
+        self.text = ""
+        self.released = 0
+        self.checked = 0
+        self.blocked = False
+
+    def _check(self) -> bool:
+        # Only text a new phrase could overlap needs rescanning.
+        if not self.blocked:
+            start = max(0, self.checked - self.holdback)
+            self.blocked = contains_dangerous_response(self.text[start:])
+            self.checked = len(self.text)
+        return not self.blocked
+
+    def feed(self, delta: str) -> str:
+        """Add a chunk and return the text that is now safe to release."""
+        self.text += delta
+        if not self._check():
+            return ""
+        return self._release(len(self.text) - self.holdback)
+
+    def close(self) -> str:
+        """Return whatever was held back, unless the response was blocked."""
+        if not self._check():
+            return ""
+        return self._release(len(self.text))
+
+    def _release(self, upto: int) -> str:
+        if upto <= self.released:
+            return ""
+        chunk = self.text[self.released:upto]
+        self.released = upto
+        return chunk
@@ -1,11 +1,20 @@
-import re
+from AIFlow.guardrails.engine import GuardrailEngine
+
+# Every pattern is linear-time: bounded repetition only, and the unbounded
+# email parts are anchored by a lookbehind so they're tried once per run.
+# Each is only tried around its trigger characters (see GuardrailEngine).
+DIGITS = ("0123456789", r"[\d -]")
+EMAIL = ("@", r"[\w.@-]")
+PII_PATTERNS = {
+    "ssn": (r"\b\d{3}-\d{2}-\d{4}\b", DIGITS),                                   # SSN
+    "credit_card": (r"(?<![\d-])\d(?:[ -]?\d){12,15}(?![\d-])", DIGITS),          # Credit card
+    "phone": (r"\b\d{10}\b", DIGITS),                                            # Phone numbers
+    "zip": (r"\b\d{5}(?:-\d{4})?\b", DIGITS),                                    # ZIP code
+    "email": (r"(?<![\w.-])[\w.-]+@[\w-]+(?:\.[\w-]+)*\.\w{2,4}\b", EMAIL),       # Email
+}
+
+pii_guardrails = GuardrailEngine(patterns={"pii": PII_PATTERNS})
+
 
 def detect_pii(text: str) -> bool:
-    patterns = [
-        r"\b\d{3}-\d{2}-\d{4}\b",              # SSN
-        r"\b\d{10}\b",                         # Phone numbers
-        r"\b\d{5}(-\d{4})?\b",                 # ZIP code
-        r"\b[\w.-]+@[\w.-]+\.\w{2,4}\b",       # Email
-        r"\b(?:\d[ -]*?){13,16}\b",            # Credit card
-    ]
-    return any(re.search(p, text) for p in patterns)
\ No newline at end of file
+    return pii_guardrails.first(text) is not None
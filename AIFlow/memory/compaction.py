@@ -0,0 +1,166 @@
+"""
+Compaction of old long-term memory.
+
+Long-term memories are bucketed by calendar month (metadata["period"], UTC).
+Once a month's memories are older than LONG_TERM_COMPACT_AFTER_DAYS, and
+haven't been seen again since (last_seen), they are condensed into one
+"digest" document for the month and moved out of the searchable index into
+the archive (documents_archive in Supabase, archive.jsonl in a local shard).
+A user's searchable memory is then the recent months in full plus one digest
+per older month, so search cost stays flat as the history grows. Months with
+more than LONG_TERM_DIGEST_MAX_INPUTS memories are downsampled to the most
+recurring ones for the digest; all of them are archived.
+
+    python -m AIFlow.memory.compaction [--older-than-days 365] [--max-periods 100]
+
+runs one pass; every API worker also runs one every LONG_TERM_COMPACT_INTERVAL
+seconds (0 disables it, e.g. when the CLI runs from cron instead). A pass
+holds the vector store's compaction lease, so only one runs at a time
+however many workers share the store; the others skip their turn.
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import socket
+from typing import Dict, List, Tuple
+from uuid import uuid4
+import dotenv
+from langchain_core.documents import Document
+from AIFlow.memory.local_vector_store import utc_datetime
+from AIFlow.memory.memory_manager import get_vector_store, recent_filter, save_batch_to_long_term_memory
+from AIFlow.monitoring.metrics import METRICS_ENABLED, memory_compaction
+from AIFlow.tools.summarizer import digest_tool
+
+dotenv.load_dotenv()
+
+LONG_TERM_COMPACT_AFTER_DAYS = float(os.getenv("LONG_TERM_COMPACT_AFTER_DAYS", "365"))
+LONG_TERM_COMPACT_INTERVAL = float(os.getenv("LONG_TERM_COMPACT_INTERVAL", str(6 * 3600)))
+# Months compacted per pass, and documents read per month per pass (the rest
+# of a larger month is folded into its digest on the next pass).
+LONG_TERM_COMPACT_MAX_PERIODS = int(os.getenv("LONG_TERM_COMPACT_MAX_PERIODS", "100"))
+LONG_TERM_COMPACT_MAX_DOCUMENTS = int(os.getenv("LONG_TERM_COMPACT_MAX_DOCUMENTS", "1000"))
+LONG_TERM_DIGEST_MAX_INPUTS = int(os.getenv("LONG_TERM_DIGEST_MAX_INPUTS", "100"))
+LONG_TERM_DIGEST_MAX_WORDS = int(os.getenv("LONG_TERM_DIGEST_MAX_WORDS", "250"))
+# The lease is renewed before each month; a pass that dies holding it blocks
+# the others for at most this long.
+LONG_TERM_COMPACT_LEASE_SECONDS = float(os.getenv("LONG_TERM_COMPACT_LEASE_SECONDS", "900"))
+DIGEST_TYPE = "digest"
+# Characters of each memory quoted in the digest prompt.
+_DIGEST_INPUT_CHARS = 500
+
+
+def period_bounds(period: str) -> Tuple[datetime.datetime, datetime.datetime]:
+    """[start, end) of a "YYYY-MM" period, in UTC."""
+    start = datetime.datetime.strptime(period, "%Y-%m").replace(tzinfo=datetime.timezone.utc)
+    end = (start + datetime.timedelta(days=32)).replace(day=1)
+    return start, end
+
+
+def _sampled(documents: List[Document], limit: int) -> List[Document]:
+    """At most `limit` documents, the most recurring first choice, in their original order."""
+    if len(documents) <= limit:
+        return documents
+    ranked = sorted(range(len(documents)), key=lambda i: -documents[i].metadata.get("occurrences", 1))
+    return [documents[i] for i in sorted(ranked[:limit])]
+
+
+def _count(result: str, amount: int = 1) -> None:
+    if METRICS_ENABLED and amount:
+        memory_compaction.inc(amount, result)
+
+
+def compact_period(user_id: str, period: str, older_than_days: float = LONG_TERM_COMPACT_AFTER_DAYS) -> int:
+    """
+    Fold a user's month of memories into the month's digest and archive them.
+    Returns how many memories were archived.
+    """
+    vector_store = get_vector_store()
+    start, end = period_bounds(period)
+    documents = vector_store.period_documents(user_id, start, end, LONG_TERM_COMPACT_MAX_DOCUMENTS)
+    digests = [doc for doc in documents if doc.metadata.get("type") == DIGEST_TYPE]
+    sources = [
+        doc for doc in documents
+        if doc.metadata.get("type") != DIGEST_TYPE and not recent_filter(doc, older_than_days)
+    ]
+    if not sources:
+        return 0
+
+    previous = digests[-1] if digests else None
+    entries = [doc.page_content[:_DIGEST_INPUT_CHARS] for doc in _sampled(sources, LONG_TERM_DIGEST_MAX_INPUTS)]
+    digest = digest_tool(previous.page_content if previous else None, period, entries, LONG_TERM_DIGEST_MAX_WORDS)
+    # The digest is dated at the month's last memory, so it stays in the month.
+    last = max(utc_datetime(doc.metadata["timestamp"]) for doc in sources + digests)
+    save_batch_to_long_term_memory(
+        user_id,
+        [digest],
+        [{
+            "type": DIGEST_TYPE,
+            "period": period,
+            "timestamp": last.isoformat(),
+            "source_count": len(sources) + sum(d.metadata.get("source_count", 0) for d in digests),
+        }],
+    )
+    # Written before anything is archived: if this pass stops in between, the
+    # next one folds the same memories in again rather than losing them.
+    archived = vector_store.archive_documents(user_id, [doc.id for doc in sources + digests])
+    _count("archived", len(sources))
+    _count("digests")
+    return archived
+
+
+def compact_long_term_memory(
+    older_than_days: float = LONG_TERM_COMPACT_AFTER_DAYS, max_periods: int = LONG_TERM_COMPACT_MAX_PERIODS
+) -> Dict[str, int]:
+    """
+    One compaction pass over the oldest uncompacted months of all users, or
+    none if another pass holds the compaction lease.
+    """
+    older_than = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=older_than_days)
+    stats = {"periods": 0, "archived": 0, "failed": 0}
+    vector_store = get_vector_store()
+    holder = f"{socket.gethostname()}:{os.getpid()}:{uuid4()}"
+    if not vector_store.acquire_compaction_lease(holder, LONG_TERM_COMPACT_LEASE_SECONDS):
+        print("Long-term memory compaction: another pass is running, skipping")
+        return stats
+    try:
+        for user_id, period in vector_store.compactable_periods(older_than, max_periods):
+            if not vector_store.acquire_compaction_lease(holder, LONG_TERM_COMPACT_LEASE_SECONDS):
+                print("Long-term memory compaction: lease lost, stopping")
+                break
+            try:
+                stats["archived"] += compact_period(user_id, period, older_than_days)
+                stats["periods"] += 1
+            except Exception as e:
+                # Left for the next pass, e.g. when the summarizer is unavailable.
+                print(f"Compacting {period} for {user_id} failed: {e!r}")
+                stats["failed"] += 1
+                _count("failed")
+    finally:
+        vector_store.release_compaction_lease(holder)
+    if stats["periods"] or stats["failed"]:
+        print(f"Long-term memory compaction: {stats}")
+    return stats
+
+
+async def run_compaction_loop(interval: float = LONG_TERM_COMPACT_INTERVAL) -> None:
+    """Run a compaction pass every `interval` seconds, off the event loop, until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(compact_long_term_memory)
+        except Exception as e:
+            print(f"Long-term memory compaction failed: {e!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--older-than-days", type=float, default=LONG_TERM_COMPACT_AFTER_DAYS)
+    parser.add_argument("--max-periods", type=int, default=LONG_TERM_COMPACT_MAX_PERIODS)
+    args = parser.parse_args()
+    stats = compact_long_term_memory(args.older_than_days, args.max_periods)
+    print(f"Compacted {stats['periods']} months, archived {stats['archived']} memories, {stats['failed']} failed")
+
+
+if __name__ == "__main__":
+    main()
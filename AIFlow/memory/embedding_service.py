@@ -0,0 +1,210 @@
+import asyncio
+import hashlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+from langchain_core.embeddings import Embeddings
+
+
+class EmbeddingService(Embeddings):
+    """
+    Caching, micro-batching front end for an embedding model.
+
+    Vectors are cached in memory (LRU, keyed by a hash of model name and
+    text) and optionally in a SQLite file under `cache_dir`, so a text is
+    only ever encoded once. Cache misses from all callers are queued for a
+    single dedicated thread, which gathers up to `max_batch_size` texts, or
+    whatever arrives within `max_wait_ms`, into one embed_documents call.
+    The model therefore runs off the event loop, and concurrent sessions
+    share a batch instead of each paying for a single-text encode.
+
+    Queries and documents are embedded the same way, which holds for
+    symmetric models such as all-MiniLM-L6-v2.
+    """
+
+    def __init__(
+        self,
+        embedder: Embeddings,
+        model_name: str,
+        cache_size: int = 10_000,
+        cache_dir: Optional[str] = None,
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0,
+    ):
+        self.embedder = embedder
+        self.model_name = model_name
+        self.cache_size = cache_size
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue()
+        self.hits = 0
+        self.misses = 0
+        self.batches = 0
+        self.batched_texts = 0
+
+        self._disk = None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._disk = sqlite3.connect(
+                os.path.join(cache_dir, "embeddings.sqlite"), check_same_thread=False
+            )
+            self._disk.execute(
+                "create table if not exists embeddings (key text primary key, vector blob)"
+            )
+            self._disk_lock = threading.Lock()
+
+        self._thread = threading.Thread(
+            target=self._run, name="embedding-batcher", daemon=True
+        )
+        self._thread.start()
+
+    # === Embeddings interface ===
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [future.result() for future in self._submit(texts)]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        futures = [asyncio.wrap_future(f) for f in self._submit(texts)]
+        return list(await asyncio.gather(*futures))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def embed_bulk(self, texts: List[str], batch_size: int = 256) -> List[List[float]]:
+        """
+        Embed many texts straight through the model, batch_size at a time.
+        For imports: skips the cache and the batcher thread, so a bulk load
+        neither evicts the vectors live sessions reuse nor queues ahead of them.
+        """
+        vectors: List[List[float]] = []
+        for start in range(0, len(texts), batch_size):
+            vectors += [list(v) for v in self.embedder.embed_documents(texts[start:start + batch_size])]
+        return vectors
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "cached": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "batches": self.batches,
+                "mean_batch_size": self.batched_texts / self.batches if self.batches else 0.0,
+            }
+
+    # === Cache ===
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def _submit(self, texts: List[str]) -> List[Future]:
+        futures = []
+        for text in texts:
+            key = self._key(text)
+            with self._lock:
+                vector = self._cache.get(key)
+                if vector is not None:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    future = Future()
+                    future.set_result(vector)
+                    futures.append(future)
+                    continue
+                future = self._inflight.get(key)
+                if future is None:
+                    vector = self._disk_get(key)
+                    if vector is not None:
+                        self.hits += 1
+                        self._remember(key, vector)
+                        future = Future()
+                        future.set_result(vector)
+                    else:
+                        self.misses += 1
+                        future = Future()
+                        self._inflight[key] = future
+                        self._queue.put((key, text, future))
+                else:
+                    # Same text already queued by another caller: share its result.
+                    self.hits += 1
+                futures.append(future)
+        return futures
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        # Caller holds self._lock
+        self._cache[key] = vector
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _disk_get(self, key: str) -> Optional[List[float]]:
+        if self._disk is None:
+            return None
+        with self._disk_lock:
+            row = self._disk.execute(
+                "select vector from embeddings where key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return array("f", row[0]).tolist()
+
+    def _disk_put(self, items: List[tuple]) -> None:
+        if self._disk is None:
+            return
+        with self._disk_lock:
+            self._disk.executemany(
+                "insert or replace into embeddings (key, vector) values (?, ?)",
+                [(key, array("f", vector).tobytes()) for key, vector in items],
+            )
+            self._disk.commit()
+
+    # === Batching ===
+    def _next_batch(self) -> List[tuple]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            try:
+                vectors = self.embedder.embed_documents([text for _, text, _ in batch])
+            except Exception as e:
+                with self._lock:
+                    for key, _, future in batch:
+                        self._inflight.pop(key, None)
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            items = [(key, list(vector)) for (key, _, _), vector in zip(batch, vectors)]
+            try:
+                self._disk_put(items)
+            except sqlite3.Error as e:
+                print(f"Embedding disk cache write failed: {e}")
+            with self._lock:
+                self.batches += 1
+                self.batched_texts += len(batch)
+                for key, vector in items:
+                    self._remember(key, vector)
+                    self._inflight.pop(key, None)
+            for (_, _, future), (_, vector) in zip(batch, items):
+                future.set_result(vector)
@@ -0,0 +1,267 @@
+"""
+Bulk import of journal entries into long-term memory.
+
+Entries are read one record at a time from NDJSON or CSV, split into
+overlapping chunks, and saved with save_batch_to_long_term_memory once
+JOURNAL_IMPORT_BATCH_SIZE chunks have accumulated, so memory use is bounded
+by one batch plus the longest entry. After every batch the position in the
+input is written to an optional checkpoint file; an interrupted import
+started again with the same checkpoint resumes after the last saved batch.
+Chunk ids are derived from the user, the entry and the chunk's position, and
+both vector stores skip or overwrite ids they already hold, so records saved
+again (the batch in flight when the import stopped) are not stored twice.
+
+    python -m AIFlow.memory.journal_import --user-id <uuid> entries.ndjson
+        [--format ndjson|csv] [--checkpoint import.ckpt] [--batch-size 512]
+
+Each record needs the entry's text in one of TEXT_FIELDS and may carry its
+date in one of TIME_FIELDS (ISO 8601; without a timezone it is taken as UTC).
+"""
+import argparse
+import csv
+import datetime
+import hashlib
+import json
+import os
+import sys
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import dotenv
+from AIFlow.memory.memory_manager import save_batch_to_long_term_memory
+
+dotenv.load_dotenv()
+
+# Chunks of at most JOURNAL_CHUNK_CHARS characters (all-MiniLM-L6-v2 reads
+# about 256 word pieces), each repeating the last JOURNAL_CHUNK_OVERLAP
+# characters of the one before so no sentence loses its context.
+JOURNAL_CHUNK_CHARS = int(os.getenv("JOURNAL_CHUNK_CHARS", "1000"))
+JOURNAL_CHUNK_OVERLAP = int(os.getenv("JOURNAL_CHUNK_OVERLAP", "150"))
+# Chunks embedded and saved together, and checkpointed after.
+JOURNAL_IMPORT_BATCH_SIZE = int(os.getenv("JOURNAL_IMPORT_BATCH_SIZE", "512"))
+
+TEXT_FIELDS = ("content", "text", "entry", "body")
+TIME_FIELDS = ("timestamp", "date", "created_at")
+# Kept in the chunks' metadata when present.
+EXTRA_FIELDS = ("title", "mood")
+# Document ids are derived from the entry, so re-importing it
+# overwrites its chunks instead of duplicating them.
+_ID_NAMESPACE = uuid.UUID("6f1c3a52-3f0e-4b8e-9a57-1f2f5c0d7e41")
+_SEPARATORS = ("\n\n", "\n", ". ", "! ", "? ", "; ", ", ", " ")
+
+
+@dataclass
+class ImportProgress:
+    records: int = 0  # input records done; the record to resume from
+    entries: int = 0
+    documents: int = 0
+    skipped: int = 0
+    seconds: float = 0.0
+
+    @property
+    def documents_per_sec(self) -> float:
+        return self.documents / self.seconds if self.seconds else 0.0
+
+    def as_dict(self) -> Dict:
+        return {**asdict(self), "seconds": round(self.seconds, 2),
+                "documents_per_sec": round(self.documents_per_sec, 1)}
+
+
+# === Parsing ===
+
+def read_ndjson(lines: Iterable[str]) -> Iterator[Optional[Dict]]:
+    """One record per non-blank line; None for lines that aren't a JSON object."""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            print(f"Journal import: skipping line {number}: {e}")
+            record = None
+        yield record if isinstance(record, dict) else None
+
+
+def read_csv(lines: Iterable[str]) -> Iterator[Optional[Dict]]:
+    """One record per CSV row, keyed by the header row."""
+    yield from csv.DictReader(lines)
+
+
+READERS = {"ndjson": read_ndjson, "csv": read_csv}
+
+
+def _field(record: Dict, names: Tuple[str, ...]) -> Optional[str]:
+    for name in names:
+        value = record.get(name)
+        if value not in (None, ""):
+            return str(value)
+    return None
+
+
+def _timestamp(value: Optional[str]) -> Optional[str]:
+    if value is None:
+        return None
+    parsed = datetime.datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed.isoformat()
+
+
+def chunk_text(text: str, max_chars: int = JOURNAL_CHUNK_CHARS, overlap: int = JOURNAL_CHUNK_OVERLAP) -> List[str]:
+    """
+    Split text into chunks of at most max_chars, ending each at the last
+    paragraph, sentence or word break in its second half, with about
+    `overlap` characters repeated at the start of the next.
+    """
+    text = text.strip()
+    if len(text) <= max_chars:
+        return [text] if text else []
+    overlap = min(overlap, max_chars // 4)
+    chunks, start = [], 0
+    while True:
+        end = start + max_chars
+        if end >= len(text):
+            chunks.append(text[start:].strip())
+            return [chunk for chunk in chunks if chunk]
+        for separator in _SEPARATORS:
+            cut = text.rfind(separator, start + max_chars // 2, end)
+            if cut != -1:
+                end = cut + len(separator)
+                break
+        chunks.append(text[start:end].strip())
+        # Start the overlap on a word boundary.
+        start = end - overlap
+        space = text.find(" ", start, end)
+        if space != -1:
+            start = space + 1
+
+
+def entry_chunks(user_id: str, record: Dict) -> Optional[Tuple[List[str], List[Dict]]]:
+    """A record's chunks and their metadata, or None if it has no text or a bad date."""
+    text = _field(record, TEXT_FIELDS)
+    if text is None:
+        return None
+    try:
+        timestamp = _timestamp(_field(record, TIME_FIELDS))
+    except ValueError:
+        return None
+    chunks = chunk_text(text)
+    if not chunks:
+        return None
+    extra = {name: record[name] for name in EXTRA_FIELDS if record.get(name) not in (None, "")}
+    digest = hashlib.sha256(f"{timestamp}\0{text}".encode("utf-8")).hexdigest()
+    metadatas = []
+    for i in range(len(chunks)):
+        metadata = {
+            "type": "journal",
+            "source": "import",
+            "chunk": i,
+            "chunks": len(chunks),
+            "document_id": str(uuid.uuid5(_ID_NAMESPACE, f"{user_id}:{digest}:{i}")),
+            **extra,
+        }
+        if timestamp:
+            metadata["timestamp"] = timestamp
+        metadatas.append(metadata)
+    return chunks, metadatas
+
+
+# === Import ===
+
+def import_journal(
+    user_id: str,
+    records: Iterable[Optional[Dict]],
+    start: int = 0,
+    batch_size: int = JOURNAL_IMPORT_BATCH_SIZE,
+    on_batch: Optional[Callable[[ImportProgress], None]] = None,
+) -> ImportProgress:
+    """
+    Save journal records to user_id's long-term memory, skipping the first
+    `start` records (already imported). on_batch is called after each saved
+    batch; its progress.records is where a later import should start.
+    """
+    progress = ImportProgress(records=start)
+    started = time.monotonic()
+    contents: List[str] = []
+    metadatas: List[Dict] = []
+    pending = ImportProgress()
+
+    def flush(records_done: int) -> None:
+        if contents:
+            save_batch_to_long_term_memory(user_id, contents, metadatas)
+        progress.records = records_done
+        progress.entries += pending.entries
+        progress.skipped += pending.skipped
+        progress.documents += len(contents)
+        progress.seconds = time.monotonic() - started
+        contents.clear()
+        metadatas.clear()
+        pending.entries = pending.skipped = 0
+        if on_batch:
+            on_batch(progress)
+
+    index = start
+    for index, record in enumerate(records, 1):
+        if index <= start:
+            continue
+        chunks = entry_chunks(user_id, record) if record else None
+        if chunks is None:
+            pending.skipped += 1
+        else:
+            contents.extend(chunks[0])
+            metadatas.extend(chunks[1])
+            pending.entries += 1
+        if len(contents) >= batch_size:
+            flush(index)
+    flush(max(index, start))
+    return progress
+
+
+def load_checkpoint(path: str, user_id: str) -> int:
+    """The record to resume from (0 without a checkpoint)."""
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return 0
+    if checkpoint.get("user_id") != user_id:
+        raise ValueError(f"Checkpoint {path} belongs to another user's import")
+    return int(checkpoint["records"])
+
+
+def save_checkpoint(path: str, user_id: str, progress: ImportProgress) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"user_id": user_id, **progress.as_dict()}, f)
+    os.replace(tmp, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="NDJSON or CSV file, or - for stdin")
+    parser.add_argument("--user-id", required=True)
+    parser.add_argument("--format", choices=sorted(READERS), help="default: from the file extension")
+    parser.add_argument("--checkpoint", help="progress file to resume from and update")
+    parser.add_argument("--batch-size", type=int, default=JOURNAL_IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    fmt = args.format or ("csv" if args.path.lower().endswith(".csv") else "ndjson")
+    start = load_checkpoint(args.checkpoint, args.user_id) if args.checkpoint else 0
+    if start:
+        print(f"Resuming after record {start}")
+
+    def report(progress: ImportProgress) -> None:
+        if args.checkpoint:
+            save_checkpoint(args.checkpoint, args.user_id, progress)
+        print(f"{progress.records} records, {progress.entries} entries, {progress.documents} documents, "
+              f"{progress.skipped} skipped, {progress.documents_per_sec:.1f} documents/s", flush=True)
+
+    source = sys.stdin if args.path == "-" else open(args.path, newline="", encoding="utf-8")
+    with source:
+        progress = import_journal(args.user_id, READERS[fmt](source), start, args.batch_size, report)
+    print(f"Imported {progress.documents} documents from {progress.entries} entries in {progress.seconds:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
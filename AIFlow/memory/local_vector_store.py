@@ -0,0 +1,471 @@
+import contextlib
+import datetime
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from uuid import uuid4
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+try:
+    import fcntl
+except ImportError:  # Windows: no other process may share the directory
+    fcntl = None
+
+
+class _Shard:
+    """
+    One user's vectors (memory-mapped float32 rows) and their documents.
+
+    Several processes can share a shard: writes hold its lock file and start
+    by reading what the others wrote (see refresh()). Archiving rewrites the
+    shard into the files of a new generation, which meta.json switches to
+    atomically; until then the old files stay valid.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.meta_path = os.path.join(path, "meta.json")
+        self.lock_path = os.path.join(path, "lock")
+        # Documents moved out by compaction, with their vectors.
+        self.archive_path = os.path.join(path, "archive.jsonl")
+        self.dim: Optional[int] = None
+        self.docs: List[Dict] = []
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        # Each document's timestamp in epoch seconds (NaN if it has none), for time windows.
+        self.created = np.zeros(0)
+        self._seen: Optional[Tuple] = None
+        self._use_generation(0)
+        self.refresh()
+
+    def _use_generation(self, generation: int) -> None:
+        self.generation = generation
+        self.vectors_path, self.docs_path, self.updates_path = self._files(generation)
+        # Bytes of the documents and updates files read so far.
+        self._docs_read = 0
+        self._updates_read = 0
+
+    def _files(self, generation: int) -> Tuple[str, str, str]:
+        """Vectors, documents and metadata updates (applied over the documents) of a generation."""
+        suffix = f".{generation}" if generation else ""
+        return (
+            os.path.join(self.path, f"vectors{suffix}.f32"),
+            os.path.join(self.path, f"documents{suffix}.jsonl"),
+            os.path.join(self.path, f"updates{suffix}.jsonl"),
+        )
+
+    def _write_meta(self, generation: int) -> None:
+        tmp = f"{self.meta_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"dim": self.dim, "generation": generation}, f)
+        os.replace(tmp, self.meta_path)
+
+    def refresh(self) -> None:
+        """Read in whatever has been written to the shard, by any process, since the last look."""
+        seen = tuple(_stat(path) for path in (self.meta_path, self.docs_path, self.updates_path))
+        if seen == self._seen or seen[0] is None:
+            return
+        with open(self.meta_path) as f:
+            meta = json.load(f)
+        self.dim = meta["dim"]
+        docs = self.docs
+        if meta.get("generation", 0) != self.generation:
+            self._use_generation(meta.get("generation", 0))
+            docs, self.created = [], np.zeros(0)
+            seen = tuple(_stat(path) for path in (self.meta_path, self.docs_path, self.updates_path))
+        self._seen = seen
+        lines, self._docs_read = _read_lines(self.docs_path, self._docs_read)
+        docs = docs + [json.loads(line) for line in lines]
+        lines, self._updates_read = _read_lines(self.updates_path, self._updates_read)
+        if lines:
+            positions = {doc["id"]: i for i, doc in enumerate(docs)}
+            for line in lines:
+                update = json.loads(line)
+                if update["id"] in positions:
+                    i = positions[update["id"]]
+                    docs[i] = {**docs[i], "metadata": update["metadata"]}
+        # Rebind rather than extend: searches hold on to the previous list.
+        self.docs = docs
+        self._remap()
+
+    @contextlib.contextmanager
+    def _writing(self):
+        """Hold the shard's lock file, with everything written before it was taken read in."""
+        os.makedirs(self.path, exist_ok=True)
+        with open(self.lock_path, "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self.refresh()
+                yield
+                self.refresh()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _remap(self) -> None:
+        # Vectors are written before their documents, so rows past the last
+        # document are from a write still going on, or one that crashed.
+        rows = os.path.getsize(self.vectors_path) // (4 * self.dim) if os.path.exists(self.vectors_path) else 0
+        rows = min(rows, len(self.docs))
+        self.docs = self.docs[:rows]
+        known = min(len(self.created), rows)
+        self.created = np.concatenate([self.created[:known], _created_seconds(self.docs[known:])])
+        if rows == 0:
+            self.matrix = np.zeros((0, self.dim), dtype=np.float32)
+        else:
+            self.matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+
+    def append(self, vectors: np.ndarray, docs: List[Dict]) -> None:
+        with self._writing():
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                self._write_meta(self.generation)
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+            # Documents already stored (a batch saved again, e.g. by a resumed
+            # import) are skipped.
+            seen = {doc["id"] for doc in self.docs}
+            rows = [i for i, doc in enumerate(docs) if not (doc["id"] in seen or seen.add(doc["id"]))]
+            if not rows:
+                return
+            vectors, docs = vectors[rows], [docs[i] for i in rows]
+            # Cut off what a crashed write left at the ends of the files
+            # (vectors without documents, half a document line), or the new
+            # vectors would not line up with their documents.
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(len(self.docs) * self.dim * 4)
+                f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            with open(self.docs_path, "ab") as f:
+                f.truncate(self._docs_read)
+                f.write("".join(json.dumps(doc) + "\n" for doc in docs).encode("utf-8"))
+
+    def update_metadata(self, doc_id: str, metadata: Dict) -> bool:
+        with self._writing():
+            if not any(doc["id"] == doc_id for doc in self.docs):
+                return False
+            with open(self.updates_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"id": doc_id, "metadata": metadata}) + "\n")
+        return True
+
+    def archive(self, ids: Iterable[str]) -> int:
+        """Move documents (and their vectors) to archive.jsonl; returns how many."""
+        ids = set(ids)
+        with self._writing():
+            keep = [i for i, doc in enumerate(self.docs) if doc["id"] not in ids]
+            if len(keep) == len(self.docs):
+                return 0
+            with open(self.archive_path, "a", encoding="utf-8") as f:
+                for i, doc in enumerate(self.docs):
+                    if doc["id"] in ids:
+                        f.write(json.dumps({**doc, "vector": self.matrix[i].tolist()}) + "\n")
+            # The new generation's files are read back in by the refresh on
+            # leaving _writing().
+            vectors_path, docs_path, updates_path = self._files(self.generation + 1)
+            with open(vectors_path, "wb") as f:
+                f.write(np.ascontiguousarray(self.matrix[keep], dtype=np.float32).tobytes())
+            with open(docs_path, "w", encoding="utf-8") as f:
+                for i in keep:
+                    f.write(json.dumps(self.docs[i]) + "\n")
+            if os.path.exists(updates_path):
+                os.remove(updates_path)  # left over from an interrupted archive
+            self._write_meta(self.generation + 1)
+            for path in (self.vectors_path, self.docs_path, self.updates_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            return len(self.docs) - len(keep)
+
+
+def _stat(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def _read_lines(path: str, offset: int) -> Tuple[List[str], int]:
+    """The complete, non-empty lines of a file after offset, and the offset past them."""
+    if not os.path.exists(path):
+        return [], offset
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    lines = [line for line in data[:end].decode("utf-8").splitlines() if line.strip()]
+    return lines, offset + end
+
+
+def utc_datetime(value) -> datetime.datetime:
+    """A datetime or ISO string as an aware datetime; naive values are UTC."""
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    return value if value.tzinfo else value.replace(tzinfo=datetime.timezone.utc)
+
+
+def _created_seconds(docs: List[Dict]) -> np.ndarray:
+    return np.array(
+        [utc_datetime(d["metadata"]["timestamp"]).timestamp() if d["metadata"].get("timestamp") else np.nan
+         for d in docs],
+        dtype=np.float64,
+    )
+
+
+class LocalVectorStore(VectorStore):
+    """
+    Exact cosine-similarity index kept on local disk, sharded per user.
+
+    Each user's vectors live in an append-only float32 file that is
+    memory-mapped for search, with documents and metadata in a JSONL file
+    beside it; worker processes can share the directory. Searches filtered on user_id (the only way the app queries
+    long-term memory) touch a single shard, so recall is a single matrix
+    product over that user's documents with no network hop. Shards are
+    loaded lazily and persist across restarts; compaction archives old
+    documents out of them (see AIFlow.memory.compaction).
+    """
+
+    def __init__(self, embedding: Embeddings, root_dir: str):
+        self._embedding = embedding
+        self.root_dir = root_dir
+        self._shards: Dict[str, _Shard] = {}
+        self._lock = threading.RLock()
+        self._compaction_lock = None
+        os.makedirs(root_dir, exist_ok=True)
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def _shard(self, user_id: str) -> _Shard:
+        """A user's shard, up to date with what other processes have written to it."""
+        name = hashlib.sha1(str(user_id).encode("utf-8")).hexdigest()
+        with self._lock:
+            shard = self._shards.get(name)
+            if shard is None:
+                shard = _Shard(os.path.join(self.root_dir, name))
+                self._shards[name] = shard
+            else:
+                shard.refresh()
+            return shard
+
+    def _all_shards(self) -> List[_Shard]:
+        with self._lock:
+            for name in os.listdir(self.root_dir):
+                path = os.path.join(self.root_dir, name)
+                if name in self._shards:
+                    self._shards[name].refresh()
+                elif os.path.isdir(path):
+                    self._shards[name] = _Shard(path)
+            return list(self._shards.values())
+
+    # === Writes ===
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[Dict[Any, Any]]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        docs = [Document(page_content=t, metadata=m) for t, m in zip(texts, metadatas)]
+        return self.add_vectors(self._embedding.embed_documents(texts), docs, ids)
+
+    def add_vectors(
+        self,
+        vectors: List[List[float]],
+        documents: List[Document],
+        ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        """
+        Append pre-computed vectors, grouped into the shard of each document's
+        user_id. Ids that are already stored are skipped, so saving the same
+        documents again is a no-op.
+        """
+        ids = ids or [str(uuid4()) for _ in documents]
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms == 0, 1, norms)
+
+        by_user: Dict[str, List[int]] = {}
+        for i, doc in enumerate(documents):
+            by_user.setdefault(str(doc.metadata.get("user_id", "")), []).append(i)
+        with self._lock:
+            for user_id, rows in by_user.items():
+                self._shard(user_id).append(
+                    matrix[rows],
+                    [
+                        {"id": ids[i], "content": documents[i].page_content, "metadata": documents[i].metadata}
+                        for i in rows
+                    ],
+                )
+        return ids
+
+    def update_document_metadata(self, doc_id: str, metadata: Dict) -> None:
+        """Replace a stored document's metadata (its user_id picks the shard)."""
+        with self._lock:
+            self._shard(str(metadata.get("user_id", ""))).update_metadata(doc_id, metadata)
+
+    # === Compaction ===
+    def compactable_periods(self, older_than, limit: int = 100) -> List[Tuple[str, str]]:
+        """(user_id, "YYYY-MM") buckets with memories not saved or seen since older_than, oldest first."""
+        older_than = utc_datetime(older_than)
+        periods = set()
+        for shard in self._all_shards():
+            for doc in shard.docs:
+                metadata = doc["metadata"]
+                if metadata.get("type") == "digest" or not metadata.get("timestamp"):
+                    continue
+                created = utc_datetime(metadata["timestamp"])
+                if utc_datetime(metadata.get("last_seen") or created) < older_than:
+                    periods.add((str(metadata.get("user_id", "")), created.strftime("%Y-%m")))
+        return sorted(periods, key=lambda period: (period[1], period[0]))[:limit]
+
+    def period_documents(self, user_id: str, start, end, limit: int = 1000) -> List[Document]:
+        """A user's documents created in [start, end), oldest first."""
+        start, end = utc_datetime(start), utc_datetime(end)
+        found = []
+        for doc in self._shard(str(user_id)).docs:
+            timestamp = doc["metadata"].get("timestamp")
+            if timestamp and start <= utc_datetime(timestamp) < end:
+                found.append((utc_datetime(timestamp), doc))
+        found.sort(key=lambda item: item[0])
+        return [Document(id=d["id"], page_content=d["content"], metadata=d["metadata"]) for _, d in found[:limit]]
+
+    def archive_documents(self, user_id: str, ids: List[str]) -> int:
+        """Move documents to the shard's archive.jsonl, out of the searchable index."""
+        with self._lock:
+            return self._shard(str(user_id)).archive(ids)
+
+    def acquire_compaction_lease(self, holder: str, seconds: float) -> bool:
+        """
+        Take the directory's compaction lock unless another process holds it.
+        The lock lasts until released or the process exits, so `seconds` (and
+        renewal) don't apply.
+        """
+        with self._lock:
+            if self._compaction_lock is not None:
+                return True
+            lock = open(os.path.join(self.root_dir, "compaction.lock"), "a")
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    lock.close()
+                    return False
+            self._compaction_lock = lock
+            return True
+
+    def release_compaction_lease(self, holder: str) -> None:
+        with self._lock:
+            if self._compaction_lock is not None:
+                self._compaction_lock.close()  # closing the file releases the flock
+                self._compaction_lock = None
+
+    # === Reads ===
+    def similarity_search_by_vector_with_embeddings(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        created_after=None,
+        created_before=None,
+    ) -> List[Tuple[Document, float, np.ndarray]]:
+        """
+        (document, similarity, stored unit vector) of the k nearest documents.
+        Metadata equality filters, plus an optional [created_after,
+        created_before) window on metadata["timestamp"].
+        """
+        filter = dict(filter or {})
+        after = utc_datetime(created_after) if created_after is not None else None
+        before = utc_datetime(created_before) if created_before is not None else None
+
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        with self._lock:
+            if "user_id" in filter:
+                shards = [self._shard(str(filter.pop("user_id")))]
+            else:
+                shards = self._all_shards()
+            candidates = [(shard.matrix, shard.docs, shard.created) for shard in shards if shard.docs]
+
+        results: List[Tuple[Dict, float, np.ndarray]] = []
+        for matrix, docs, created in candidates:
+            scores = matrix @ query
+            if filter:
+                mask = np.array([all(d["metadata"].get(key) == value for key, value in filter.items()) for d in docs])
+                scores = np.where(mask, scores, -np.inf)
+            # Documents without a timestamp (NaN) fall outside any window.
+            with np.errstate(invalid="ignore"):
+                if after is not None:
+                    scores = np.where(created >= after.timestamp(), scores, -np.inf)
+                if before is not None:
+                    scores = np.where(created < before.timestamp(), scores, -np.inf)
+            top = min(k, len(docs))
+            idx = np.argpartition(-scores, top - 1)[:top]
+            results += [(docs[i], float(scores[i]), np.array(matrix[i])) for i in idx if scores[i] != -np.inf]
+
+        results.sort(key=lambda item: item[1], reverse=True)
+        return [
+            (Document(id=d["id"], page_content=d["content"], metadata=d["metadata"]), score, vector)
+            for d, score, vector in results[:k]
+        ]
+
+    def similarity_search_by_vector_with_relevance_scores(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        created_after=None,
+        created_before=None,
+    ) -> List[Tuple[Document, float]]:
+        """Metadata equality filters, plus an optional [created_after, created_before) window on metadata["timestamp"]."""
+        return [
+            (doc, score)
+            for doc, score, _ in self.similarity_search_by_vector_with_embeddings(
+                embedding, k, filter, created_after, created_before
+            )
+        ]
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [
+            doc
+            for doc, _ in self.similarity_search_by_vector_with_relevance_scores(
+                embedding, k=k, filter=filter, **kwargs
+            )
+        ]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_relevance_scores(
+            self._embedding.embed_query(query), k=k, filter=filter, **kwargs
+        )
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Document]:
+        return self.similarity_search_by_vector(self._embedding.embed_query(query), k=k, filter=filter, **kwargs)
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        root_dir: str = ".vector_index",
+        **kwargs: Any,
+    ) -> "LocalVectorStore":
+        store = cls(embedding=embedding, root_dir=root_dir)
+        store.add_texts(texts, metadatas=metadatas, **kwargs)
+        return store
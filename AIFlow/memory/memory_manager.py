@@ -1,62 +1,360 @@
 from langchain_core.documents import Document
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
-from langchain_community.vectorstores import SupabaseVectorStore
-from langchain_huggingface import HuggingFaceEmbeddings
 
 # from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from supabase import create_client, Client
-from typing import Dict, List, Optional
+from supabase import acreate_client, create_client, AsyncClient, Client
+from postgrest.exceptions import APIError
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from AIFlow.memory.state import TherapyState
+from AIFlow.memory.embedding_service import EmbeddingService
+from AIFlow.memory.local_vector_store import utc_datetime
+from AIFlow.memory.short_term_cache import ShortTermCache
+from AIFlow.monitoring.metrics import METRICS_ENABLED, memory_search_results, memory_writes, timed_operation
+from AIFlow.memory.write_behind import MemoryLogWriter
 from uuid import uuid4
+import asyncio
+import atexit
 import datetime
+import hashlib
+import json
+import threading
+import time
 import os
 import dotenv
+import numpy as np
 
 dotenv.load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+# "supabase": pgvector via the match_documents RPC (see PgVectorStore).
+# "local":    on-disk per-user index (see LocalVectorStore), no network hop.
+LONG_TERM_MEMORY_BACKEND = os.getenv("LONG_TERM_MEMORY_BACKEND", "supabase")
+LOCAL_VECTOR_DIR = os.getenv("LOCAL_VECTOR_DIR", ".vector_index")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR")  # on-disk cache disabled when unset
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
+# Bulk saves (save_batch_to_long_term_memory) embed this many texts per model
+# call and write this many documents per vector store request.
+EMBEDDING_BULK_BATCH_SIZE = int(os.getenv("EMBEDDING_BULK_BATCH_SIZE", "256"))
+LONG_TERM_WRITE_PAGE_SIZE = int(os.getenv("LONG_TERM_WRITE_PAGE_SIZE", "200"))
+# A saved memory whose normalised text matches, or whose embedding is at least
+# LONG_TERM_DEDUP_THRESHOLD similar to, one of the user's memories of the same
+# type from the last LONG_TERM_DEDUP_WINDOW_DAYS is merged into it (its
+# occurrences and last_seen metadata are updated) instead of stored again.
+# A window of 0 turns deduplication off.
+LONG_TERM_DEDUP_THRESHOLD = float(os.getenv("LONG_TERM_DEDUP_THRESHOLD", "0.95"))
+LONG_TERM_DEDUP_WINDOW_DAYS = float(os.getenv("LONG_TERM_DEDUP_WINDOW_DAYS", "90"))
+LONG_TERM_DEDUP_CANDIDATES = 3
+# Searches pick k memories by maximal marginal relevance from the
+# k * LONG_TERM_MMR_FETCH_FACTOR nearest; LONG_TERM_MMR_LAMBDA trades
+# relevance (1.0: plain nearest neighbours) against diversity.
+LONG_TERM_MMR_FETCH_FACTOR = int(os.getenv("LONG_TERM_MMR_FETCH_FACTOR", "4"))
+LONG_TERM_MMR_LAMBDA = float(os.getenv("LONG_TERM_MMR_LAMBDA", "0.7"))
+# Long-term memories are bucketed by calendar month (metadata["period"], UTC).
+# Searches look at the last LONG_TERM_RECENT_DAYS first and only reach
+# further back when fewer than k of those are at least
+# LONG_TERM_RECENT_MIN_SIMILARITY similar to the query (0 days: one search
+# over everything). Older months are compacted into digests (see
+# AIFlow.memory.compaction), so either search stays small however long the
+# history gets.
+LONG_TERM_RECENT_DAYS = float(os.getenv("LONG_TERM_RECENT_DAYS", "90"))
+LONG_TERM_RECENT_MIN_SIMILARITY = float(os.getenv("LONG_TERM_RECENT_MIN_SIMILARITY", "0.35"))
+# Candidates are ranked by similarity blended with recency: a share of
+# LONG_TERM_RECENCY_WEIGHT of the score halves every
+# LONG_TERM_RECENCY_HALF_LIFE_DAYS since the memory was last seen.
+LONG_TERM_RECENCY_WEIGHT = float(os.getenv("LONG_TERM_RECENCY_WEIGHT", "0.2"))
+LONG_TERM_RECENCY_HALF_LIFE_DAYS = float(os.getenv("LONG_TERM_RECENCY_HALF_LIFE_DAYS", "180"))
+# "buffered": memory_logs rows are queued and bulk-inserted in the background
+#             (flushed every MEMORY_LOG_FLUSH_INTERVAL seconds and at shutdown).
+# "sync":     every row is inserted before append_to_memory returns.
+MEMORY_LOG_DURABILITY = os.getenv("MEMORY_LOG_DURABILITY", "buffered")
+MEMORY_LOG_BATCH_SIZE = int(os.getenv("MEMORY_LOG_BATCH_SIZE", "50"))
+MEMORY_LOG_FLUSH_INTERVAL = float(os.getenv("MEMORY_LOG_FLUSH_INTERVAL", "0.5"))
+MEMORY_LOG_MAX_PENDING = int(os.getenv("MEMORY_LOG_MAX_PENDING", "10000"))
+# Rows the buffer can't write (rejected by the database, or still failing
+# after MEMORY_LOG_MAX_ATTEMPTS tries) are appended here as JSON lines.
+MEMORY_LOG_MAX_ATTEMPTS = int(os.getenv("MEMORY_LOG_MAX_ATTEMPTS", "8"))
+MEMORY_LOG_DEAD_LETTER_FILE = os.getenv("MEMORY_LOG_DEAD_LETTER_FILE", "memory_logs.dead_letter.jsonl")
+# LangGraph checkpointer that keeps each conversation's state between turns:
+# "sqlite" (local file, see SqliteCheckpointSaver), "memory" (this process
+# only) or "none" (history is reloaded from memory_logs every turn).
+CHECKPOINTER = os.getenv("CHECKPOINTER", "sqlite")
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", ".checkpoints/therapy.sqlite")
+CHECKPOINT_KEEP = int(os.getenv("CHECKPOINT_KEEP", "10"))
+# Rows read per request while exporting a user's history.
+HISTORY_EXPORT_PAGE_SIZE = int(os.getenv("HISTORY_EXPORT_PAGE_SIZE", "500"))
+DEFAULT_THREAD_ID = "default"
+_SUMMARY_MISS = object()
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("Supabase URL and Key must be set in environment variables.")
+# Recent messages per (user_id, thread_id), so get_memory only reads
+# memory_logs when a conversation isn't cached in this worker.
+short_term_cache = ShortTermCache(
+    max_conversations=int(os.getenv("SHORT_TERM_CACHE_CONVERSATIONS", "10000")),
+    max_messages=int(os.getenv("SHORT_TERM_CACHE_MESSAGES", "20")),
+    ttl=float(os.getenv("SHORT_TERM_CACHE_TTL", "900")),
+)
 
+# The Supabase client and the embedding model are created on first use (or by
+# warm_up_memory at server startup) so importing this module stays cheap.
+_supabase: Optional[Client] = None
+_async_supabase: Optional[AsyncClient] = None
+_embeddings: Optional[EmbeddingService] = None
+_vector_store = None
+_checkpointer = None
+_memory_log_writer: Optional[MemoryLogWriter] = None
+_init_lock = threading.RLock()
+_async_init_lock = asyncio.Lock()
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-# Initialize vector store
-vector_store = SupabaseVectorStore(
-    client=supabase,
-    embedding=HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2"),
-    table_name="documents",
-    query_name="match_documents",
-)
+def get_supabase() -> Client:
+    """Return the process-wide Supabase client, creating it on first use."""
+    global _supabase
+    if _supabase is None:
+        with _init_lock:
+            if _supabase is None:
+                if not SUPABASE_URL or not SUPABASE_KEY:
+                    raise ValueError(
+                        "Supabase URL and Key must be set in environment variables."
+                    )
+                _supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return _supabase
+
+
+async def get_async_supabase() -> AsyncClient:
+    """Return the process-wide async Supabase client used by the async graph."""
+    global _async_supabase
+    if _async_supabase is None:
+        async with _async_init_lock:
+            if _async_supabase is None:
+                if not SUPABASE_URL or not SUPABASE_KEY:
+                    raise ValueError(
+                        "Supabase URL and Key must be set in environment variables."
+                    )
+                _async_supabase = await acreate_client(SUPABASE_URL, SUPABASE_KEY)
+    return _async_supabase
+
+
+def get_embeddings() -> EmbeddingService:
+    """Return the process-wide embedding service, loading the model on first use."""
+    global _embeddings
+    if _embeddings is None:
+        with _init_lock:
+            if _embeddings is None:
+                # Deferred: importing this pulls in torch and sentence-transformers.
+                from langchain_huggingface import HuggingFaceEmbeddings
+
+                _embeddings = EmbeddingService(
+                    HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL),
+                    model_name=EMBEDDING_MODEL,
+                    cache_size=EMBEDDING_CACHE_SIZE,
+                    cache_dir=EMBEDDING_CACHE_DIR,
+                    max_batch_size=EMBEDDING_BATCH_SIZE,
+                    max_wait_ms=EMBEDDING_BATCH_WAIT_MS,
+                )
+    return _embeddings
+
+
+def get_vector_store():
+    """Return the process-wide long-term memory store, loading the embedding model on first use."""
+    global _vector_store
+    if _vector_store is None:
+        with _init_lock:
+            if _vector_store is None and LONG_TERM_MEMORY_BACKEND == "local":
+                from AIFlow.memory.local_vector_store import LocalVectorStore
+
+                _vector_store = LocalVectorStore(get_embeddings(), LOCAL_VECTOR_DIR)
+            elif _vector_store is None:
+                from AIFlow.memory.supabase_vector_store import PgVectorStore
+
+                _vector_store = PgVectorStore(
+                    client=get_supabase(),
+                    embedding=get_embeddings(),
+                    table_name="documents",
+                    query_name="match_documents",
+                )
+    return _vector_store
+
+
+def get_checkpointer():
+    """Return the process-wide graph checkpointer, or None if CHECKPOINTER is "none"."""
+    global _checkpointer
+    if _checkpointer is None and CHECKPOINTER != "none":
+        with _init_lock:
+            if _checkpointer is None and CHECKPOINTER == "memory":
+                from langgraph.checkpoint.memory import InMemorySaver
+
+                _checkpointer = InMemorySaver()
+            elif _checkpointer is None and CHECKPOINTER == "sqlite":
+                from AIFlow.memory.checkpointer import SqliteCheckpointSaver
+
+                _checkpointer = SqliteCheckpointSaver(CHECKPOINT_DB, keep=CHECKPOINT_KEEP)
+            elif _checkpointer is None:
+                raise ValueError(f"Unknown checkpointer: {CHECKPOINTER}")
+    return _checkpointer
+
+
+def checkpoint_thread_id(user_id: str, thread_id: Optional[str]) -> str:
+    """Checkpointer key of a conversation; thread ids are only unique per user."""
+    return f"{user_id}:{thread_id or DEFAULT_THREAD_ID}"
+
+
+@timed_operation("supabase", "memory_logs.insert")
+def _insert_memory_logs(rows: List[Dict]) -> None:
+    # Rows carry their own ids, so a retried batch never duplicates messages.
+    get_supabase().table("memory_logs").upsert(
+        rows, on_conflict="id", ignore_duplicates=True
+    ).execute()
+
+
+def _memory_log_rejected(error: Exception) -> bool:
+    # Data exceptions and integrity constraint violations (SQLSTATE classes
+    # 22 and 23) come from the rows themselves; a retry fails the same way.
+    return isinstance(error, APIError) and (error.code or "")[:2] in ("22", "23")
+
+
+def _dead_letter_memory_logs(rows: List[Dict], error: Exception) -> None:
+    with open(MEMORY_LOG_DEAD_LETTER_FILE, "a", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps({"error": str(error), "row": row}, default=str) + "\n")
+
+
+def get_memory_log_writer() -> MemoryLogWriter:
+    """Return the process-wide write-behind buffer for memory_logs."""
+    global _memory_log_writer
+    if _memory_log_writer is None:
+        with _init_lock:
+            if _memory_log_writer is None:
+                _memory_log_writer = MemoryLogWriter(
+                    _insert_memory_logs,
+                    batch_size=MEMORY_LOG_BATCH_SIZE,
+                    flush_interval=MEMORY_LOG_FLUSH_INTERVAL,
+                    max_pending=MEMORY_LOG_MAX_PENDING,
+                    max_attempts=MEMORY_LOG_MAX_ATTEMPTS,
+                    is_permanent=_memory_log_rejected,
+                    dead_letter=_dead_letter_memory_logs,
+                )
+                atexit.register(_memory_log_writer.close)
+    return _memory_log_writer
+
+
+def flush_memory_logs(timeout: Optional[float] = 10.0) -> bool:
+    """Write out any buffered memory_logs rows. Returns False on timeout."""
+    if _memory_log_writer is None:
+        return True
+    return _memory_log_writer.flush(timeout)
+
+
+def warm_up_memory() -> None:
+    """Eagerly create the Supabase client and load the embedding model."""
+    get_supabase()
+    get_vector_store()
+    if MEMORY_LOG_DURABILITY == "buffered":
+        get_memory_log_writer()
 
 
 # === SHORT-TERM MEMORY FUNCTIONS ===
+def _memory_log_row(state: TherapyState, message: BaseMessage, role: str) -> Dict:
+    return {
+        "id": str(uuid4()),
+        "user_id": state["user_id"],
+        "thread_id": _thread_id(state),
+        "role": role,
+        "content": message.content,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "emotion": state.get("emotion"),
+        "is_crisis": state.get("is_crisis"),
+        "mode": _logged_mode(state.get("mode")),
+        "journal_entry": state.get("journal_entry"),
+        "attack": state.get("attack"),
+    }
+
+
+def _logged_mode(mode: Optional[str]) -> Optional[str]:
+    # The classifier's raw reply can be e.g. "journal." or "Chat"; the graph
+    # only takes the journal branch on an exact "journal", so anything else
+    # was a chat turn (memory_logs.mode allows just these two, or null).
+    if not mode:
+        return None
+    return "journal" if mode == "journal" else "chat"
+
+
+def _thread_id(state: TherapyState) -> str:
+    return state.get("thread_id") or DEFAULT_THREAD_ID
+
+
+def _rows_to_messages(rows: List[Dict]) -> List[BaseMessage]:
+    messages = []
+    for row in rows:
+        role = row["role"]
+        content = row["content"]
+        # The memory_logs id lets the prompt builder tell which messages its
+        # rolling summary already covers.
+        if role == "user":
+            messages.append(HumanMessage(content=content, id=row.get("id")))
+        else:
+            messages.append(AIMessage(content=content, id=row.get("id")))
+    return messages
+
+
+def _with_pending_rows(
+    db_rows: List[Dict], user_id: str, thread_id: str, limit: int
+) -> List[Dict]:
+    """
+    Oldest-first view of the last `limit` rows, including this process's
+    buffered rows that haven't reached the database yet.
+    """
+    rows = list(reversed(db_rows))
+    if _memory_log_writer is not None:
+        seen = {row.get("id") for row in rows}
+        rows += [
+            row
+            for row in _memory_log_writer.pending(user_id, thread_id)
+            if row["id"] not in seen
+        ]
+    return rows[-limit:]
+
+
+@timed_operation("supabase", "memory_logs.append")
 def append_to_memory(
     state: TherapyState, message: BaseMessage, role: str = "user"
 ) -> TherapyState:
     """Appends a new message to the short-term memory."""
 
     """Appends message to Supabase memory_logs."""
-    user_id = state["user_id"]
-    supabase.table("memory_logs").insert(
-        {
-            "user_id": user_id,
-            "role": role,
-            "content": message.content,
-            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
-            "emotion": state.get("emotion"),
-            "is_crisis": state.get("is_crisis"),
-            "mode": state.get("mode"),
-            "journal_entry": state.get("journal_entry"),
-            "attack": state.get("attack"),
-        }
-    ).execute()
-    state["messages"].append(message)
+    row = _memory_log_row(state, message, role)
+    if MEMORY_LOG_DURABILITY == "sync":
+        get_supabase().table("memory_logs").insert(row).execute()
+    else:
+        get_memory_log_writer().submit(row)
+    message.id = row["id"]
+    short_term_cache.append(row["user_id"], row["thread_id"], message)
+    # A new list, so checkpoints already taken of the old one stay unchanged.
+    state["messages"] = [*state["messages"], message]
     return state
 
 
+@timed_operation("supabase", "memory_logs.append")
+async def aappend_to_memory(
+    state: TherapyState, message: BaseMessage, role: str = "user"
+) -> TherapyState:
+    """Async variant of append_to_memory."""
+    row = _memory_log_row(state, message, role)
+    if MEMORY_LOG_DURABILITY == "sync":
+        client = await get_async_supabase()
+        await client.table("memory_logs").insert(row).execute()
+    else:
+        await get_memory_log_writer().asubmit(row)
+    message.id = row["id"]
+    short_term_cache.append(row["user_id"], row["thread_id"], message)
+    state["messages"] = [*state["messages"], message]
+    return state
+
+
+@timed_operation("supabase", "memory_logs.read")
 def get_memory(
     state: TherapyState, limit: int = 6, from_db: bool = True
 ) -> List[BaseMessage]:
@@ -65,58 +363,457 @@ def get_memory(
         # If not from DB, return messages from state
         return state["messages"][-limit:]
 
-    user_id = state["user_id"]
+    user_id, thread_id = state["user_id"], _thread_id(state)
+    cached = short_term_cache.get(user_id, thread_id, limit)
+    if cached is not None:
+        return cached
+
+    fetch = max(limit, short_term_cache.max_messages)
     response = (
-        supabase.table("memory_logs")
-        .select("content, role")
+        get_supabase().table("memory_logs")
+        .select("id, content, role")
         .eq("user_id", user_id)
+        .eq("thread_id", thread_id)
         .order("timestamp", desc=True)
-        .limit(limit)
+        .limit(fetch)
         .execute()
     )
-    messages = []
-    for row in reversed(response.data):
-        role = row["role"]
-        content = row["content"]
-        if role == "user":
-            messages.append(HumanMessage(content=content))
-        else:
-            messages.append(AIMessage(content=content))
-    return messages
+    messages = _rows_to_messages(_with_pending_rows(response.data, user_id, thread_id, fetch))
+    short_term_cache.prime(user_id, thread_id, messages)
+    return messages[-limit:]
+
+
+@timed_operation("supabase", "memory_logs.read")
+async def aget_memory(
+    state: TherapyState, limit: int = 6, from_db: bool = True
+) -> List[BaseMessage]:
+    """Async variant of get_memory."""
+    if not from_db:
+        return state["messages"][-limit:]
+
+    user_id, thread_id = state["user_id"], _thread_id(state)
+    cached = short_term_cache.get(user_id, thread_id, limit)
+    if cached is not None:
+        return cached
+
+    fetch = max(limit, short_term_cache.max_messages)
+    client = await get_async_supabase()
+    response = await (
+        client.table("memory_logs")
+        .select("id, content, role")
+        .eq("user_id", user_id)
+        .eq("thread_id", thread_id)
+        .order("timestamp", desc=True)
+        .limit(fetch)
+        .execute()
+    )
+    messages = _rows_to_messages(_with_pending_rows(response.data, user_id, thread_id, fetch))
+    short_term_cache.prime(user_id, thread_id, messages)
+    return messages[-limit:]
+
+
+# === HISTORY AND EXPORT ===
+# Keyset pages over the RPCs of supabase_schema_004_history_pagination.sql. A
+# cursor is the (timestamp, id) or (created_at, id) of the last row already
+# read, so deep pages cost the same as the first. Rows still buffered by the
+# write-behind writer show up once it has flushed them.
+@timed_operation("supabase", "memory_logs.page")
+async def amemory_logs_page(
+    user_id: str,
+    limit: int = 50,
+    cursor: Optional[Tuple[str, str]] = None,
+    newest_first: bool = True,
+    thread_id: Optional[str] = None,
+) -> List[Dict]:
+    """A page of a user's memory_logs rows following `cursor`, optionally for one thread."""
+    params = {"page_user_id": user_id, "page_size": limit, "newest_first": newest_first}
+    if cursor is not None:
+        params["cursor_timestamp"], params["cursor_id"] = cursor
+    if thread_id is not None:
+        params["page_thread_id"] = thread_id
+    client = await get_async_supabase()
+    response = await client.rpc("memory_logs_page", params).execute()
+    return response.data
+
+
+@timed_operation("supabase", "documents.page")
+async def _adocuments_page(
+    user_id: str, limit: int, cursor: Optional[Tuple[str, str]], archived: bool
+) -> List[Dict]:
+    params = {"page_user_id": user_id, "page_size": limit, "archived": archived}
+    if cursor is not None:
+        params["cursor_created_at"], params["cursor_id"] = cursor
+    client = await get_async_supabase()
+    response = await client.rpc("documents_page", params).execute()
+    return response.data
+
+
+async def aexport_user_data(
+    user_id: str, page_size: int = HISTORY_EXPORT_PAGE_SIZE
+) -> AsyncIterator[Tuple[str, Dict]]:
+    """
+    Every memory_logs row, thread summary and long-term memory (archived ones
+    included, embeddings left out) of a user as (kind, row) pairs, oldest
+    first. Only one page is held at a time, however large the account.
+    """
+    cursor = None
+    while True:
+        rows = await amemory_logs_page(user_id, page_size, cursor, newest_first=False)
+        for row in rows:
+            yield "memory_log", row
+        if len(rows) < page_size:
+            break
+        cursor = (rows[-1]["timestamp"], rows[-1]["id"])
+
+    client = await get_async_supabase()
+    response = await (
+        client.table("thread_summaries")
+        .select("thread_id, summary, window_start_id, updated_at")
+        .eq("user_id", user_id)
+        .execute()
+    )
+    for row in response.data:
+        yield "thread_summary", row
+
+    for archived, kind in ((False, "document"), (True, "archived_document")):
+        cursor = None
+        while True:
+            rows = await _adocuments_page(user_id, page_size, cursor, archived)
+            for row in rows:
+                yield kind, row
+            if len(rows) < page_size:
+                break
+            cursor = (rows[-1]["created_at"], rows[-1]["id"])
+
+
+# === THREAD SUMMARIES ===
+# Rolling summary of the turns that have scrolled out of a conversation's
+# prompt window, with the id of the first message still in the window. Read
+# every turn, so kept in a small in-process cache (written through on save).
+_thread_summaries: "OrderedDict[Tuple[str, str], Tuple[Optional[Dict], float]]" = OrderedDict()
+_thread_summaries_lock = threading.Lock()
+
+
+def _cached_thread_summary(key: Tuple[str, str]):
+    with _thread_summaries_lock:
+        entry = _thread_summaries.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            return _SUMMARY_MISS
+        _thread_summaries.move_to_end(key)
+        return entry[0]
+
+
+def _cache_thread_summary(key: Tuple[str, str], summary: Optional[Dict]) -> None:
+    with _thread_summaries_lock:
+        _thread_summaries[key] = (summary, time.monotonic() + short_term_cache.ttl)
+        _thread_summaries.move_to_end(key)
+        while len(_thread_summaries) > short_term_cache.max_conversations:
+            _thread_summaries.popitem(last=False)
+
+
+@timed_operation("supabase", "thread_summaries.read")
+def get_thread_summary(user_id: str, thread_id: str) -> Optional[Dict]:
+    """Return {"summary", "window_start_id"} for a conversation, or None if it has none yet."""
+    key = (user_id, thread_id)
+    summary = _cached_thread_summary(key)
+    if summary is _SUMMARY_MISS:
+        response = (
+            get_supabase().table("thread_summaries")
+            .select("summary, window_start_id")
+            .eq("user_id", user_id)
+            .eq("thread_id", thread_id)
+            .limit(1)
+            .execute()
+        )
+        summary = response.data[0] if response.data else None
+        _cache_thread_summary(key, summary)
+    return summary
+
+
+@timed_operation("supabase", "thread_summaries.read")
+async def aget_thread_summary(user_id: str, thread_id: str) -> Optional[Dict]:
+    """Async variant of get_thread_summary."""
+    key = (user_id, thread_id)
+    summary = _cached_thread_summary(key)
+    if summary is _SUMMARY_MISS:
+        client = await get_async_supabase()
+        response = await (
+            client.table("thread_summaries")
+            .select("summary, window_start_id")
+            .eq("user_id", user_id)
+            .eq("thread_id", thread_id)
+            .limit(1)
+            .execute()
+        )
+        summary = response.data[0] if response.data else None
+        _cache_thread_summary(key, summary)
+    return summary
+
+
+@timed_operation("supabase", "thread_summaries.write")
+def save_thread_summary(user_id: str, thread_id: str, summary: str, window_start_id: str) -> None:
+    """Store a conversation's updated rolling summary."""
+    record = {"summary": summary, "window_start_id": window_start_id}
+    get_supabase().table("thread_summaries").upsert(
+        {
+            "user_id": user_id,
+            "thread_id": thread_id,
+            **record,
+            "updated_at": datetime.datetime.utcnow().isoformat(),
+        },
+        on_conflict="user_id,thread_id",
+    ).execute()
+    _cache_thread_summary((user_id, thread_id), record)
+
+
+def _long_term_document(user_id: str, content: str, metadata: Optional[Dict]) -> Document:
+    metadata = {
+        "timestamp": datetime.datetime.utcnow().isoformat(),
+        "document_id": str(uuid4()),
+        "content_hash": content_hash(content),
+        **(metadata or {}),
+        "user_id": user_id,
+    }
+    metadata.setdefault("period", memory_period(metadata["timestamp"]))
+    return Document(page_content=content, metadata=metadata)
+
+
+def memory_period(timestamp) -> str:
+    """The month ("YYYY-MM", UTC) a long-term memory is bucketed in."""
+    return utc_datetime(timestamp).strftime("%Y-%m")
 
 
+def content_hash(content: str) -> str:
+    """Hash of the text ignoring case, spacing and trailing punctuation."""
+    normalized = " ".join(content.lower().split()).rstrip(".!?")
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def _duplicate_search(user_id: str) -> Dict:
+    since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=LONG_TERM_DEDUP_WINDOW_DAYS)
+    return {"k": LONG_TERM_DEDUP_CANDIDATES, "filter": {"user_id": user_id}, "created_after": since}
+
+
+def _pick_duplicate(document: Document, candidates: List[Tuple[Document, float]]) -> Optional[Document]:
+    for candidate, similarity in candidates:
+        if candidate.metadata.get("type") != document.metadata.get("type"):
+            continue
+        if candidate.metadata.get("content_hash") == document.metadata["content_hash"] or (
+            similarity >= LONG_TERM_DEDUP_THRESHOLD
+        ):
+            return candidate
+    return None
+
+
+def _merged_metadata(existing: Document, document: Document) -> Dict:
+    return {
+        **existing.metadata,
+        "occurrences": existing.metadata.get("occurrences", 1) + 1,
+        "last_seen": document.metadata["timestamp"],
+    }
+
+
+def _count_write(outcome: str) -> None:
+    if METRICS_ENABLED:
+        memory_writes.inc(1, outcome)
+
+
+@timed_operation("vector", "add")
 def save_to_long_term_memory(
     user_id: str, content: str, metadata: Optional[Dict] = None
 ):
-    """Save content and embedding to Supabase."""
-    metadata = metadata or {}
-    document = Document(
-        page_content=content,
-        metadata={
-            "user_id": user_id,
-            "timestamp": datetime.datetime.utcnow().isoformat(),
-            "document_id": str(uuid4()),
-            **metadata,
-        },
-    )
-    vector_store.add_documents([document])
+    """Save content and embedding to Supabase, or merge it into a recent near-duplicate."""
+    document = _long_term_document(user_id, content, metadata)
+    vector_store = get_vector_store()
+    vector = vector_store.embeddings.embed_query(content)
+    duplicate = None
+    if LONG_TERM_DEDUP_WINDOW_DAYS > 0:
+        duplicate = _pick_duplicate(
+            document,
+            vector_store.similarity_search_by_vector_with_relevance_scores(vector, **_duplicate_search(user_id)),
+        )
+    if duplicate is not None:
+        vector_store.update_document_metadata(duplicate.id, _merged_metadata(duplicate, document))
+        _count_write("merged")
+        return
+    vector_store.add_vectors([vector], [document], ids=[document.metadata["document_id"]])
+    _count_write("stored")
 
 
-def search_long_term_memory(user_id: str, query: str, k: int = 3) -> List[Document]:
-    """Search relevant documents from Supabase vector store."""
-    results = vector_store.similarity_search(
-        query=query, k=k, filter={"user_id": user_id}
-    )
-    for doc in results:
-        print(f"[Memory Hit] {doc.page_content[:80]}... (metadata: {doc.metadata})")
+@timed_operation("vector", "add_batch")
+def save_batch_to_long_term_memory(
+    user_id: str, contents: List[str], metadatas: Optional[List[Dict]] = None
+) -> List[str]:
+    """
+    Bulk variant of save_to_long_term_memory: embeds the contents in large
+    batches and writes them in pages of LONG_TERM_WRITE_PAGE_SIZE. A
+    document_id in the metadata becomes the document's id, so writing the
+    same batch again overwrites it in Supabase instead of duplicating it.
+    """
+    metadatas = metadatas or [{} for _ in contents]
+    documents = [_long_term_document(user_id, c, m) for c, m in zip(contents, metadatas)]
+    vector_store = get_vector_store()
+    vectors = get_embeddings().embed_bulk([d.page_content for d in documents], EMBEDDING_BULK_BATCH_SIZE)
+    ids = [d.metadata["document_id"] for d in documents]
+    for start in range(0, len(documents), LONG_TERM_WRITE_PAGE_SIZE):
+        end = start + LONG_TERM_WRITE_PAGE_SIZE
+        vector_store.add_vectors(vectors[start:end], documents[start:end], ids=ids[start:end])
+    return ids
+
+
+@timed_operation("vector", "add")
+async def asave_to_long_term_memory(
+    user_id: str, content: str, metadata: Optional[Dict] = None
+):
+    """Async variant of save_to_long_term_memory."""
+    document = _long_term_document(user_id, content, metadata)
+    vector_store = await asyncio.to_thread(get_vector_store)
+    vector = await vector_store.embeddings.aembed_query(content)
+    duplicate = None
+    if LONG_TERM_DEDUP_WINDOW_DAYS > 0:
+        candidates = await asyncio.to_thread(
+            vector_store.similarity_search_by_vector_with_relevance_scores, vector, **_duplicate_search(user_id)
+        )
+        duplicate = _pick_duplicate(document, candidates)
+    if duplicate is not None:
+        await asyncio.to_thread(
+            vector_store.update_document_metadata, duplicate.id, _merged_metadata(duplicate, document)
+        )
+        _count_write("merged")
+        return
+    await asyncio.to_thread(vector_store.add_vectors, [vector], [document], ids=[document.metadata["document_id"]])
+    _count_write("stored")
+
+
+def _time_window(created_after, created_before) -> Dict:
+    """Search kwargs for an optional [created_after, created_before) window."""
+    window = {}
+    if created_after is not None:
+        window["created_after"] = created_after
+    if created_before is not None:
+        window["created_before"] = created_before
+    return window
+
+
+def _search_tiers(user_id: str, k: int, created_after, created_before) -> List[Dict]:
+    """
+    Search kwargs for the recent months, then for everything older, each
+    clipped to the caller's [created_after, created_before) window.
+    """
+    search = {"k": k * LONG_TERM_MMR_FETCH_FACTOR, "filter": {"user_id": user_id}}
+    if LONG_TERM_RECENT_DAYS <= 0:
+        return [{**search, **_time_window(created_after, created_before)}]
+    boundary = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=LONG_TERM_RECENT_DAYS)
+    after = utc_datetime(created_after) if created_after is not None else None
+    before = utc_datetime(created_before) if created_before is not None else None
+    tiers = []
+    if before is None or before > boundary:
+        tiers.append({**search, **_time_window(max(after or boundary, boundary), before)})
+    if after is None or after < boundary:
+        tiers.append({**search, **_time_window(after, min(before or boundary, boundary))})
+    return tiers
+
+
+def _enough(found: List[Tuple[Document, float, List[float]]], k: int) -> bool:
+    return sum(score >= LONG_TERM_RECENT_MIN_SIMILARITY for _, score, _ in found) >= k
+
+
+def _recency(doc: Document, now: datetime.datetime) -> float:
+    """1.0 for a memory seen just now, halving every LONG_TERM_RECENCY_HALF_LIFE_DAYS."""
+    seen = doc.metadata.get("last_seen") or doc.metadata.get("timestamp")
+    if not seen:
+        return 0.0
+    age_days = max((now - utc_datetime(seen)).total_seconds() / 86400, 0.0)
+    return 0.5 ** (age_days / LONG_TERM_RECENCY_HALF_LIFE_DAYS)
+
+
+def _rank(found: List[Tuple[Document, float, List[float]]], k: int) -> List[Document]:
+    """
+    The k candidates (document, similarity, stored embedding) chosen by
+    maximal marginal relevance, with relevance the similarity blended with
+    recency, so near-identical memories don't fill every slot and stale ones
+    give way to recent ones.
+    """
+    if len(found) <= 1:
+        return [doc for doc, _, _ in found]
+    now = datetime.datetime.now(datetime.timezone.utc)
+    relevance = np.array([
+        (1 - LONG_TERM_RECENCY_WEIGHT) * score + LONG_TERM_RECENCY_WEIGHT * _recency(doc, now)
+        for doc, score, _ in found
+    ])
+    matrix = np.asarray([vector for _, _, vector in found], dtype=np.float32)
+    matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    redundancy = matrix @ matrix.T
+    selected = [int(np.argmax(relevance))]
+    while len(selected) < min(k, len(found)):
+        scores = LONG_TERM_MMR_LAMBDA * relevance - (1 - LONG_TERM_MMR_LAMBDA) * redundancy[:, selected].max(axis=1)
+        scores[selected] = -np.inf
+        selected.append(int(np.argmax(scores)))
+    return [found[i][0] for i in selected]
+
+
+def _count_search_results(results: List[Document]) -> None:
+    # Counts only: the memories themselves never leave the process.
+    if METRICS_ENABLED:
+        for doc in results:
+            memory_search_results.inc(1, doc.metadata.get("type") or "unknown")
+
+
+@timed_operation("vector", "search")
+def search_long_term_memory(
+    user_id: str,
+    query: str,
+    k: int = 3,
+    created_after: Optional[datetime.datetime] = None,
+    created_before: Optional[datetime.datetime] = None,
+) -> List[Document]:
+    """
+    Search relevant documents from Supabase vector store, optionally within a
+    time window: recent months first, older ones only if those fall short.
+    Results are ranked by similarity and recency and diversified with MMR,
+    using the candidates' stored embeddings.
+    """
+    vector_store = get_vector_store()
+    vector = vector_store.embeddings.embed_query(query)
+    found = []
+    for search in _search_tiers(user_id, k, created_after, created_before):
+        found += vector_store.similarity_search_by_vector_with_embeddings(vector, **search)
+        if _enough(found, k):
+            break
+    results = _rank(found, k)
+    _count_search_results(results)
+    return results
+
+
+@timed_operation("vector", "search")
+async def asearch_long_term_memory(
+    user_id: str,
+    query: str,
+    k: int = 3,
+    created_after: Optional[datetime.datetime] = None,
+    created_before: Optional[datetime.datetime] = None,
+) -> List[Document]:
+    """Async variant of search_long_term_memory."""
+    vector_store = await asyncio.to_thread(get_vector_store)
+    vector = await vector_store.embeddings.aembed_query(query)
+    found = []
+    for search in _search_tiers(user_id, k, created_after, created_before):
+        found += await asyncio.to_thread(vector_store.similarity_search_by_vector_with_embeddings, vector, **search)
+        if _enough(found, k):
+            break
+    results = _rank(found, k)
+    _count_search_results(results)
     return results
 
 
-# TODO: Integrate this
-def recent_filter(doc: Document, days=30) -> bool:
+def recent_filter(doc: Document, days: float = 30) -> bool:
+    """
+    Whether a memory was saved, or last seen again, within the last `days`
+    days. Memories without a readable timestamp count as recent.
+    """
+    seen = doc.metadata.get("last_seen") or doc.metadata.get("timestamp", "")
     try:
-        ts = datetime.datetime.fromisoformat(doc.metadata.get("timestamp", ""))
-        return ts >= datetime.utcnow() - datetime.timedelta(days=days)
-    except Exception as e:
+        return utc_datetime(seen) >= datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days)
+    except ValueError as e:
         print(f"Error parsing timestamp: {e}")
         return True
@@ -0,0 +1,174 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+import dotenv
+import litellm
+from langchain_core.messages import BaseMessage, HumanMessage
+from AIFlow.memory.memory_manager import save_thread_summary
+from AIFlow.memory.state import PROMPT_HISTORY_MESSAGES
+from AIFlow.tools.llm_client import GENERATOR, role_model
+from AIFlow.tools.summarizer import summarize_tool
+
+dotenv.load_dotenv()
+
+PROMPT_MODEL = role_model(GENERATOR)
+# Upper bound on the tokens of a therapy prompt, whatever the conversation's
+# length (a single message longer than the budget is still sent whole).
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))
+# Shares of the budget for retrieved memories and the rolling summary; recent
+# messages get whatever is left.
+PROMPT_MEMORY_TOKENS = int(os.getenv("PROMPT_MEMORY_TOKENS", "600"))
+PROMPT_SUMMARY_TOKENS = int(os.getenv("PROMPT_SUMMARY_TOKENS", "400"))
+
+# Summaries are updated off the request path, one update per thread at a time.
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="thread-summary")
+_summaries_in_progress: Set[Tuple[str, str]] = set()
+_summaries_lock = threading.Lock()
+
+
+def count_tokens(text: str) -> int:
+    return litellm.token_counter(model=PROMPT_MODEL, text=text)
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut text down to at most max_tokens tokens."""
+    if max_tokens <= 0:
+        return ""
+    tokens = litellm.encode(model=PROMPT_MODEL, text=text)
+    if len(tokens) <= max_tokens:
+        return text
+    return litellm.decode(model=PROMPT_MODEL, tokens=tokens[: max_tokens - 1]) + "…"
+
+
+def _normalized(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+
+def select_memories(memories: List[str], exclude: Set[str], max_tokens: int) -> List[str]:
+    """
+    Keep retrieved memories in rank order, skipping duplicates and anything
+    already in the prompt, until max_tokens is used up (the last one that
+    fits is truncated).
+    """
+    selected, seen, used = [], set(exclude), 0
+    for memory in memories:
+        key = _normalized(memory)
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        memory = truncate_tokens(memory, max_tokens - used)
+        if not memory:
+            break
+        selected.append(memory)
+        used += count_tokens(memory)
+    return selected
+
+
+@dataclass
+class TherapyPrompt:
+    messages: List[Dict]
+    tokens: int
+    window_start: int  # index of the oldest history message sent verbatim
+
+
+def build_therapy_prompt(
+    emotion: Optional[str],
+    user_input: str,
+    history: List[BaseMessage],
+    memories: List[str],
+    summary: Optional[Dict] = None,
+    budget: int = PROMPT_TOKEN_BUDGET,
+) -> TherapyPrompt:
+    """
+    Assemble the therapy prompt within a token budget: the system prompt and
+    the user's input once each, the rolling summary of older turns, the
+    top-ranked retrieved memories, and as many recent messages (newest first)
+    as still fit.
+    """
+    system = {
+        "role": "system",
+        "content": f"You are a compassionate therapist. The user currently feels {emotion}.",
+    }
+    user = {"role": "user", "content": user_input}
+    used = count_tokens(system["content"]) + count_tokens(user_input)
+    context = []
+
+    if summary and summary.get("summary"):
+        text = truncate_tokens(summary["summary"], min(PROMPT_SUMMARY_TOKENS, budget - used))
+        if text:
+            content = f"Summary of the earlier conversation:\n{text}"
+            context.append({"role": "system", "content": content})
+            used += count_tokens(content)
+
+    recent = {_normalized(m.content) for m in history} | {_normalized(user_input)}
+    selected = select_memories(memories, recent, min(PROMPT_MEMORY_TOKENS, budget - used))
+    if selected:
+        memory_str = "\n\n".join(selected)
+        content = f"The user previously shared the following relevant context:\n{memory_str}"
+        context.append({"role": "system", "content": content})
+        used += count_tokens(content)
+
+    # Messages the summary already covers are never repeated verbatim.
+    ids = [m.id for m in history]
+    covered = summary.get("window_start_id") if summary else None
+    floor = ids.index(covered) if covered in ids else 0
+    window_start = len(history)
+    while window_start > floor:
+        cost = count_tokens(history[window_start - 1].content)
+        if used + cost > budget:
+            break
+        used += cost
+        window_start -= 1
+    window = [
+        {"role": "user" if isinstance(m, HumanMessage) else "assistant", "content": m.content}
+        for m in history[window_start:]
+    ]
+    return TherapyPrompt([system, *context, *window, user], used, window_start)
+
+
+def update_thread_summary(
+    user_id: str,
+    thread_id: str,
+    history: List[BaseMessage],
+    window_start: int,
+    summary: Optional[Dict],
+) -> None:
+    """
+    Fold the history messages that dropped out of the prompt window since the
+    last update into the thread's summary, in the background. Only those new
+    messages are sent to the summarizer, together with the current summary.
+
+    The state only keeps the newest PROMPT_HISTORY_MESSAGES, so once the
+    history is that long its older half is folded in too, even if it still
+    fits the prompt: otherwise it would fall off the end unsummarized.
+    """
+    if len(history) >= PROMPT_HISTORY_MESSAGES:
+        window_start = max(window_start, len(history) - PROMPT_HISTORY_MESSAGES // 2)
+    if window_start <= 0 or window_start >= len(history) or history[window_start].id is None:
+        return
+    ids = [m.id for m in history]
+    previous_start = summary.get("window_start_id") if summary else None
+    # A window start that is no longer in the loaded history is older than
+    # all of it, so every message before the window is new to the summary.
+    first_new = ids.index(previous_start) if previous_start in ids else 0
+    if first_new >= window_start:
+        return
+    key = (user_id, thread_id)
+    with _summaries_lock:
+        if key in _summaries_in_progress:
+            return
+        _summaries_in_progress.add(key)
+
+    def fold():
+        try:
+            text = summarize_tool(summary.get("summary") if summary else None, history[first_new:window_start])
+            save_thread_summary(user_id, thread_id, text, history[window_start].id)
+        except Exception as e:
+            print(f"Thread summary update failed for {user_id}/{thread_id}: {e}")
+        finally:
+            with _summaries_lock:
+                _summaries_in_progress.discard(key)
+
+    _summary_executor.submit(fold)
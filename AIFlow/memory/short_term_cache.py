@@ -0,0 +1,87 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Tuple
+from langchain_core.messages import BaseMessage
+
+
+class ShortTermCache:
+    """
+    In-process cache of each conversation's most recent messages.
+
+    Every (user_id, thread_id) conversation keeps a ring buffer of its last
+    `max_messages` messages. Entries are primed from the database on a miss,
+    kept current by append(), evicted least-recently-used once more than
+    `max_conversations` are cached, and expire `ttl` seconds after they were
+    loaded so writes from other workers are eventually picked up.
+    """
+
+    def __init__(
+        self,
+        max_conversations: int = 10_000,
+        max_messages: int = 20,
+        ttl: float = 900.0,
+    ):
+        self.max_conversations = max_conversations
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[deque, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: str, thread_id: str, limit: int) -> Optional[List[BaseMessage]]:
+        """Return the last `limit` messages, or None if the conversation must be loaded."""
+        key = (user_id, thread_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None or limit > self.max_messages:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            messages = list(entry[0])
+        return messages[-limit:] if limit > 0 else []
+
+    def prime(self, user_id: str, thread_id: str, messages: List[BaseMessage]) -> None:
+        """
+        Cache a conversation loaded from the database. `messages` must be the
+        last `max_messages` messages (or the whole conversation if shorter).
+        """
+        key = (user_id, thread_id)
+        buffer = deque(messages[-self.max_messages:], maxlen=self.max_messages)
+        with self._lock:
+            self._entries[key] = (buffer, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_conversations:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def append(self, user_id: str, thread_id: str, message: BaseMessage) -> None:
+        """Write-through: add a message to a cached conversation, if it is cached."""
+        with self._lock:
+            entry = self._entries.get((user_id, thread_id))
+            if entry is not None:
+                entry[0].append(message)
+
+    def invalidate(self, user_id: str, thread_id: Optional[str] = None) -> None:
+        """Drop one conversation, or every conversation of a user."""
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] == user_id and (thread_id is None or key[1] == thread_id):
+                    del self._entries[key]
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "conversations": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -1,17 +1,34 @@
+import os
 from typing import TypedDict, List, Optional, Annotated
+import dotenv
 from langchain_core.messages import BaseMessage
 from langgraph.graph.message import add_messages
 
+dotenv.load_dotenv()
+
+# Recent messages kept in the (checkpointed) state; older turns are covered
+# by memory_logs and the thread summary.
+PROMPT_HISTORY_MESSAGES = int(os.getenv("PROMPT_HISTORY_MESSAGES", "20"))
+
+
+def recent_messages(current: List[BaseMessage], update: List[BaseMessage]) -> List[BaseMessage]:
+    """Replace the message list, keeping only the newest PROMPT_HISTORY_MESSAGES."""
+    return update[-PROMPT_HISTORY_MESSAGES:]
+
 
 class TherapyState(TypedDict):
     user_id: str  # user ID
+    thread_id: Optional[str]  # conversation thread within the user's history
     input: str  # latest user input
     # messages: Annotated[List[BaseMessage], add_messages]  # short-term memory
-    messages: List[BaseMessage]  # short-term memory
+    messages: Annotated[List[BaseMessage], recent_messages]  # short-term memory
     response: Optional[str]  # response from the model
     relevant_memories: Optional[List[str]]  # vector recall results
     emotion: Optional[str]  # output of emotion analyzer
     is_crisis: Optional[bool]  # output of crisis detection
+    crisis_tier: Optional[str]  # crisis cascade tier that decided: 'lexical', 'embedding' or 'llm'
     mode: Optional[str]  # 'chat' or 'journal' (from classifier)
+    classifier_confidence: Optional[float]  # self-reported confidence of the combined classifier
     journal_entry: Optional[str]  # if journal, store full entry
-    attack: Optional[str]
\ No newline at end of file
+    attack: Optional[str]
+    guardrail_matches: Optional[List[dict]]  # category, label and span of each guardrail hit
\ No newline at end of file
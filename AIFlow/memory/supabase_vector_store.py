@@ -0,0 +1,165 @@
+import datetime
+import json
+from typing import Any, Dict, List, Optional, Tuple, Union
+from uuid import uuid4
+
+from langchain_community.vectorstores import SupabaseVectorStore
+from langchain_core.documents import Document
+
+Timestamp = Union[datetime.datetime, str, None]
+
+
+def _isoformat(value: Timestamp) -> Optional[str]:
+    return value.isoformat() if isinstance(value, datetime.datetime) else value
+
+
+class PgVectorStore(SupabaseVectorStore):
+    """
+    SupabaseVectorStore for the match_documents RPC of
+    supabase_schema_002_documents_vector_index.sql.
+
+    Rows are written with their user_id and created_at columns, and searches
+    pass the user, the match count and an optional [created_after,
+    created_before) window to the function, which filters on the columns
+    while walking the HNSW index instead of extracting them from metadata;
+    searches that rank by MMR have it return the stored embeddings too
+    (supabase_schema_006_match_documents_embeddings.sql). Compaction moves
+    old rows to documents_archive through the RPCs of
+    supabase_schema_003_documents_compaction.sql, one pass at a time under
+    the lease of supabase_schema_005_compaction_lease.sql.
+    """
+
+    def add_vectors(
+        self,
+        vectors: List[List[float]],
+        documents: List[Document],
+        ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        rows = []
+        for i, (vector, document) in enumerate(zip(vectors, documents)):
+            metadata = document.metadata
+            if not metadata.get("user_id"):
+                raise ValueError("Long-term memory documents need a user_id in their metadata")
+            row = {
+                "id": ids[i] if ids else str(uuid4()),
+                "user_id": metadata["user_id"],
+                "content": document.page_content,
+                "metadata": metadata,
+                "embedding": vector,
+            }
+            if metadata.get("timestamp"):
+                row["created_at"] = metadata["timestamp"]
+            rows.append(row)
+
+        for start in range(0, len(rows), self.chunk_size):
+            self._client.from_(self.table_name).upsert(rows[start:start + self.chunk_size]).execute()
+        return [row["id"] for row in rows]
+
+    def update_document_metadata(self, doc_id: str, metadata: Dict) -> None:
+        self._client.from_(self.table_name).update({"metadata": metadata}).eq("id", doc_id).execute()
+
+    # === Compaction (supabase_schema_003_documents_compaction.sql) ===
+    def compactable_periods(self, older_than: Timestamp, limit: int = 100) -> List[Tuple[str, str]]:
+        """(user_id, "YYYY-MM") buckets with memories not saved or seen since older_than, oldest first."""
+        res = self._client.rpc(
+            "compactable_periods", {"older_than": _isoformat(older_than), "max_periods": limit}
+        ).execute()
+        return [(str(row["user_id"]), row["period"]) for row in res.data]
+
+    def period_documents(self, user_id: str, start: Timestamp, end: Timestamp, limit: int = 1000) -> List[Document]:
+        """A user's documents created in [start, end), oldest first."""
+        res = (
+            self._client.from_(self.table_name)
+            .select("id, content, metadata")
+            .eq("user_id", user_id)
+            .gte("created_at", _isoformat(start))
+            .lt("created_at", _isoformat(end))
+            .order("created_at")
+            .limit(limit)
+            .execute()
+        )
+        return [Document(id=str(row["id"]), page_content=row["content"], metadata=row.get("metadata") or {})
+                for row in res.data]
+
+    def archive_documents(self, user_id: str, ids: List[str]) -> int:
+        """Move documents to documents_archive, out of the searchable table."""
+        if not ids:
+            return 0
+        res = self._client.rpc("archive_documents", {"archive_user_id": user_id, "doc_ids": ids}).execute()
+        return int(res.data or 0)
+
+    def acquire_compaction_lease(self, holder: str, seconds: float) -> bool:
+        """Take (or renew) the lease on compaction for `seconds`; False while another holder has it."""
+        res = self._client.rpc(
+            "acquire_lease", {"lease_name": "compaction", "lease_holder": holder, "lease_seconds": seconds}
+        ).execute()
+        return bool(res.data)
+
+    def release_compaction_lease(self, holder: str) -> None:
+        self._client.rpc("release_lease", {"lease_name": "compaction", "lease_holder": holder}).execute()
+
+    def similarity_search_by_vector_with_embeddings(
+        self,
+        query: List[float],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        created_after: Timestamp = None,
+        created_before: Timestamp = None,
+    ) -> List[Tuple[Document, float, List[float]]]:
+        """(document, similarity, stored embedding) of the k nearest of a user's documents."""
+        return [
+            (doc, score, json.loads(embedding) if isinstance(embedding, str) else embedding)
+            for doc, score, embedding in self._match(
+                query, k, filter, created_after, created_before, with_embeddings=True
+            )
+        ]
+
+    def similarity_search_by_vector_with_relevance_scores(
+        self,
+        query: List[float],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        created_after: Timestamp = None,
+        created_before: Timestamp = None,
+        score_threshold: Optional[float] = None,
+        **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        results = [
+            (doc, score) for doc, score, _ in self._match(query, k, filter, created_after, created_before)
+        ]
+        if score_threshold is not None:
+            results = [(doc, score) for doc, score in results if score >= score_threshold]
+        return results
+
+    def _match(
+        self,
+        query: List[float],
+        k: int,
+        filter: Optional[Dict[str, Any]],
+        created_after: Timestamp,
+        created_before: Timestamp,
+        with_embeddings: bool = False,
+    ) -> List[Tuple[Document, float, Any]]:
+        filter = dict(filter or {})
+        user_id = filter.pop("user_id", None)
+        if user_id is None:
+            raise ValueError("Long-term memory searches are per user: pass filter={'user_id': ...}")
+        if filter:
+            raise ValueError(f"match_documents only filters on user_id, not {sorted(filter)}")
+
+        params = {"query_embedding": query, "match_user_id": user_id, "match_count": k}
+        if created_after is not None:
+            params["created_after"] = _isoformat(created_after)
+        if created_before is not None:
+            params["created_before"] = _isoformat(created_before)
+        if with_embeddings:
+            params["with_embeddings"] = True
+        res = self._client.rpc(self.query_name, params).execute()
+
+        # pgvector values come back as "[0.1,0.2,...]" strings.
+        return [
+            (Document(id=str(row["id"]), page_content=row["content"], metadata=row.get("metadata") or {}),
+             row.get("similarity", 0.0), row.get("embedding"))
+            for row in res.data
+            if row.get("content")
+        ]
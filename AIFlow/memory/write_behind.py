@@ -0,0 +1,192 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+
+class MemoryLogWriter:
+    """
+    Write-behind buffer for memory_logs rows.
+
+    Rows from every user and turn are queued in arrival order and written by a
+    single background thread in bulk inserts, flushed when `batch_size` rows
+    are waiting, every `flush_interval` seconds, or on close(). A failed batch
+    stays at the head of the queue and is retried with jittered exponential
+    backoff, so per-user ordering is preserved. Rows must carry a client
+    generated "id" so a retried insert can be made idempotent.
+
+    A batch that fails with an error `is_permanent` recognises (one caused by
+    the rows themselves, e.g. a constraint violation), or fails `max_attempts`
+    times in a row, is split in half until the rows at fault are found; a
+    single such row is handed to `dead_letter` and skipped, so one bad row
+    can't hold up everything queued behind it.
+
+    At most `max_pending` rows are held in memory; beyond that submit() blocks
+    until the writer catches up.
+    """
+
+    def __init__(
+        self,
+        insert_rows: Callable[[List[Dict]], None],
+        batch_size: int = 50,
+        flush_interval: float = 0.5,
+        max_pending: int = 10_000,
+        max_backoff: float = 30.0,
+        max_attempts: int = 8,
+        is_permanent: Optional[Callable[[Exception], bool]] = None,
+        dead_letter: Optional[Callable[[List[Dict], Exception], None]] = None,
+    ):
+        self._insert_rows = insert_rows
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self._is_permanent = is_permanent or (lambda e: False)
+        self._dead_letter = dead_letter or _drop
+
+        self._rows: deque = deque()
+        self._cond = threading.Condition()
+        self._closing = False
+        self._flush_requested = False
+        self._in_flight = 0
+        self._thread = threading.Thread(
+            target=self._run, name="memory-log-writer", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, row: Dict) -> None:
+        """Queue a row, blocking while the buffer is full."""
+        with self._cond:
+            if self._closing:
+                raise RuntimeError("MemoryLogWriter is closed")
+            while len(self._rows) >= self.max_pending:
+                self._cond.wait()
+            self._rows.append(row)
+            if len(self._rows) >= self.batch_size:
+                self._cond.notify_all()
+
+    async def asubmit(self, row: Dict) -> None:
+        """Queue a row without blocking the event loop when the buffer is full."""
+        with self._cond:
+            if not self._closing and len(self._rows) < self.max_pending:
+                self._rows.append(row)
+                if len(self._rows) >= self.batch_size:
+                    self._cond.notify_all()
+                return
+        await asyncio.to_thread(self.submit, row)
+
+    def pending(self, user_id: str, thread_id: Optional[str] = None) -> List[Dict]:
+        """Rows for a user (and optionally thread) not yet confirmed written, oldest first."""
+        with self._cond:
+            return [
+                row
+                for row in self._rows
+                if row["user_id"] == user_id
+                and (thread_id is None or row.get("thread_id") == thread_id)
+            ]
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued row has been written. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            while self._rows:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = 10.0) -> bool:
+        """Flush outstanding rows and stop the writer thread."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        with self._cond:
+            return not self._rows
+
+    def _next_batch(self, limit: int) -> List[Dict]:
+        with self._cond:
+            deadline = time.monotonic() + self.flush_interval
+            while not self._closing and not self._flush_requested and len(self._rows) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    if self._rows:
+                        break
+                    deadline = time.monotonic() + self.flush_interval
+                    remaining = self.flush_interval
+                self._cond.wait(remaining)
+            # Rows stay in the queue (visible to pending()) until written.
+            batch = [self._rows[i] for i in range(min(limit, len(self._rows)))]
+            self._in_flight = len(batch)
+            if not batch:
+                self._flush_requested = False
+            return batch
+
+    def _run(self) -> None:
+        attempt = 0
+        # Shrinks while a failing batch is being split, grows back as the
+        # halves are written.
+        limit = self.batch_size
+        while True:
+            batch = self._next_batch(limit)
+            if not batch:
+                with self._cond:
+                    if self._closing:
+                        return
+                continue
+            try:
+                self._insert_rows(batch)
+            except Exception as e:
+                attempt += 1
+                permanent = self._is_permanent(e)
+                print(f"memory_logs flush failed (attempt {attempt}, {len(batch)} rows): {e}")
+                if not permanent and self._closing and attempt >= 5:
+                    with self._cond:
+                        rows = list(self._rows)
+                    print(f"Giving up on {len(rows)} unwritten memory_logs rows on shutdown")
+                    self._give_up(rows, e)
+                    return
+                if permanent or attempt >= self.max_attempts:
+                    attempt = 0
+                    if len(batch) > 1:
+                        limit = len(batch) // 2
+                    else:
+                        print(f"Giving up on memory_logs row {batch[0].get('id')}: {e}")
+                        self._give_up(batch, e)
+                    continue
+                delay = min(self.max_backoff, 0.1 * 2 ** attempt)
+                with self._cond:
+                    retry_at = time.monotonic() + random.uniform(delay / 2, delay)
+                    while not self._closing and time.monotonic() < retry_at:
+                        self._cond.wait(retry_at - time.monotonic())
+                continue
+            attempt = 0
+            limit = min(self.batch_size, limit * 2)
+            self._written(len(batch))
+
+    def _give_up(self, rows: List[Dict], error: Exception) -> None:
+        try:
+            self._dead_letter(rows, error)
+        except Exception as e:
+            print(f"memory_logs dead letter failed, {len(rows)} rows lost: {e}")
+        self._written(len(rows))
+
+    def _written(self, count: int) -> None:
+        """Remove the first `count` queued rows, which are no longer pending."""
+        with self._cond:
+            for _ in range(count):
+                self._rows.popleft()
+            self._in_flight = 0
+            if not self._rows:
+                self._flush_requested = False
+            self._cond.notify_all()
+
+
+def _drop(rows: List[Dict], error: Exception) -> None:
+    pass
@@ -0,0 +1,397 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import dotenv
+import litellm
+from litellm.integrations.custom_logger import CustomLogger
+
+dotenv.load_dotenv()
+
+# Set METRICS_ENABLED=0 to turn all instrumentation into no-ops.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# JSONL file that gets one trace (every node, LLM call and backend operation
+# with its duration) per turn; tracing is off when unset.
+TURN_TRACE_FILE = os.getenv("TURN_TRACE_FILE")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# How often the event loop lag is sampled, in seconds.
+EVENT_LOOP_LAG_INTERVAL = float(os.getenv("EVENT_LOOP_LAG_INTERVAL", "0.25"))
+
+LabelValues = Tuple[str, ...]
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label combination, Prometheus style."""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...], buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series: Dict[LabelValues, List] = {}  # labels -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def quantile(self, q: float, *label_values: str) -> Optional[float]:
+        """Estimate a quantile from the buckets, interpolating like histogram_quantile."""
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None or series[2] == 0:
+                return None
+            counts, _, total = series[0][:], series[1], series[2]
+        rank, seen = q * total, 0
+        for i, count in enumerate(counts):
+            if seen + count >= rank and count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """{"label=value,...": {"count", "p50", "p99"}} for every series."""
+        with self._lock:
+            keys = list(self._series)
+        return {
+            ",".join(f"{k}={v}" for k, v in zip(self.labels, key)): {
+                "count": self._series[key][2],
+                "p50": self.quantile(0.5, *key),
+                "p99": self.quantile(0.99, *key),
+            }
+            for key in keys
+        }
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: (counts[:], total, count) for key, (counts, total, count) in self._series.items()}
+        for key, (counts, total, count) in sorted(series.items()):
+            labels = _labels(self.labels, key)
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{{{labels + ',' if labels else ''}{le}}} {cumulative}")
+            lines.append(f"{self.name}_sum{_braced(labels)} {total}")
+            lines.append(f"{self.name}_count{_braced(labels)} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...]):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float, *label_values: str) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_braced(_labels(self.labels, key))} {value}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: LabelValues) -> str:
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _braced(labels: str) -> str:
+    return f"{{{labels}}}" if labels else ""
+
+
+node_duration = Histogram(
+    "therapy_node_duration_seconds", "Wall time of each therapy graph node.", ("node", "status")
+)
+turn_duration = Histogram(
+    "therapy_turn_duration_seconds", "Wall time of a whole therapy turn.", ("mode", "status")
+)
+llm_duration = Histogram(
+    "llm_request_duration_seconds", "Wall time of LiteLLM calls.", ("model", "status")
+)
+llm_first_token = Histogram(
+    "llm_time_to_first_token_seconds", "Time to the first streamed token of LiteLLM calls.", ("model",)
+)
+llm_tokens = Counter("llm_tokens_total", "Tokens sent to and received from LLMs.", ("model", "direction"))
+backend_duration = Histogram(
+    "backend_operation_duration_seconds",
+    "Wall time of Supabase and vector store operations.",
+    ("backend", "operation", "status"),
+)
+errors = Counter("therapy_errors_total", "Exceptions raised, by component.", ("component", "name"))
+llm_attempts = Counter(
+    "llm_client_attempts_total",
+    "LLM client requests by role, model, kind (primary, retry, hedge, fallback) and outcome.",
+    ("role", "model", "kind", "outcome"),
+)
+memory_writes = Counter(
+    "long_term_memory_writes_total",
+    "Long-term memory saves, by outcome (stored, or merged into a near-duplicate).",
+    ("outcome",),
+)
+memory_search_results = Counter(
+    "long_term_memory_search_results_total",
+    "Memories returned by long-term memory searches, by memory type.",
+    ("type",),
+)
+memory_compaction = Counter(
+    "long_term_memory_compaction_total",
+    "Long-term memory compaction: documents archived, digests written and months that failed.",
+    ("result",),
+)
+llm_queue_wait = Histogram(
+    "llm_queue_wait_seconds", "Time LLM calls waited for a slot in the process-wide limiter.", ("priority",)
+)
+event_loop_lag = Histogram(
+    "event_loop_lag_seconds", "How late the event loop ran a timer it had scheduled.", (), buckets=LAG_BUCKETS
+)
+
+# Metrics read when /metrics is scraped, e.g. the hit counts the caches keep
+# themselves: (name, help, type, callable returning (labels, value) samples).
+Collect = Callable[[], List[Tuple[Dict[str, str], float]]]
+_collectors: List[Tuple[str, str, str, Collect]] = []
+
+
+def register_collector(name: str, help: str, collect: Collect, kind: str = "gauge") -> None:
+    _collectors.append((name, help, kind, collect))
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in (node_duration, turn_duration, llm_duration, llm_first_token, llm_tokens, backend_duration, errors,
+                   llm_attempts, memory_writes, memory_compaction, llm_queue_wait, event_loop_lag):
+        lines += metric.render()
+    for name, help, kind, collect in _collectors:
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+        try:
+            samples = collect()
+        except Exception as e:
+            print(f"Metrics collector {name} failed: {e}")
+            continue
+        for labels, value in samples:
+            lines.append(f"{name}{_braced(_labels(tuple(labels), tuple(labels.values())))} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def latency_summary() -> Dict[str, Dict]:
+    """p50/p99 per node, LLM model and backend operation, for a quick look without Prometheus."""
+    return {
+        "nodes": node_duration.summary(),
+        "turns": turn_duration.summary(),
+        "llm": llm_duration.summary(),
+        "llm_queue_wait": llm_queue_wait.summary(),
+        "backend": backend_duration.summary(),
+        "event_loop_lag": event_loop_lag.summary(),
+    }
+
+
+async def monitor_event_loop_lag(interval: float = EVENT_LOOP_LAG_INTERVAL) -> None:
+    """
+    Sleep for interval over and over, recording how much later than asked the
+    loop woke up. Sustained lag means something is blocking the loop.
+    """
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        event_loop_lag.observe(max(0.0, time.perf_counter() - start - interval))
+
+
+# === Per-turn traces ===
+
+# (turn start, spans) of the turn being traced in this context.
+_current_trace: contextvars.ContextVar[Optional[Tuple[float, List[Dict]]]] = contextvars.ContextVar(
+    "turn_trace", default=None
+)
+_trace_lock = threading.Lock()
+
+
+def _span(kind: str, name: str, started: float, seconds: float, status: str, **extra) -> None:
+    trace = _current_trace.get()
+    if trace is not None:
+        turn_start, spans = trace
+        spans.append({"kind": kind, "name": name, "start_ms": round((started - turn_start) * 1000, 3),
+                      "ms": round(seconds * 1000, 3), "status": status, **extra})
+
+
+@contextmanager
+def turn_trace(user_id: str, thread_id: str) -> Iterator[Dict]:
+    """
+    Time a whole turn. The yielded dict can be given a "mode"; with
+    TURN_TRACE_FILE set, the turn's spans are appended to it as one JSON line.
+    """
+    turn = {"mode": "unknown"}
+    start, status = time.perf_counter(), "ok"
+    spans = [] if TURN_TRACE_FILE else None
+    token = _current_trace.set((start, spans)) if spans is not None else None
+    try:
+        yield turn
+    except asyncio.CancelledError:
+        status = "cancelled"
+        raise
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        if token is not None:
+            try:
+                _current_trace.reset(token)
+            except ValueError:
+                pass  # an async generator finalized from another context
+        if METRICS_ENABLED:
+            turn_duration.observe(seconds, turn["mode"], status)
+            _span("turn", turn["mode"], start, seconds, status)
+        if spans is not None:
+            record = {
+                "turn_id": str(uuid.uuid4()),
+                "ts": time.time(),
+                "user_id": user_id,
+                "thread_id": thread_id,
+                "mode": turn["mode"],
+                "status": status,
+                "ms": round(seconds * 1000, 3),
+                "spans": sorted(spans, key=lambda span: span["start_ms"]),
+            }
+            with _trace_lock, open(TURN_TRACE_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+
+
+@contextmanager
+def capture_spans() -> Iterator[List[Dict]]:
+    """
+    Collect the spans (turns, nodes, backend operations) of everything run
+    in this context, including tasks and threads started from it; used by
+    the benchmarks to get exact per-node latencies.
+    """
+    spans: List[Dict] = []
+    token = _current_trace.set((time.perf_counter(), spans))
+    try:
+        yield spans
+    finally:
+        _current_trace.reset(token)
+
+
+# === Instrumentation ===
+
+def _timed(histogram: Histogram, kind: str, name: str, labels: Tuple[str, ...], component: str):
+    """Decorator recording a sync or async function's wall time and errors."""
+
+    def decorator(fn):
+        if not METRICS_ENABLED:
+            return fn
+
+        def record(start: float, status: str) -> None:
+            seconds = time.perf_counter() - start
+            histogram.observe(seconds, *labels, status)
+            _span(kind, name, start, seconds, status)
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    result = await fn(*args, **kwargs)
+                except Exception as e:
+                    errors.inc(1, component, type(e).__name__)
+                    record(start, "error")
+                    raise
+                record(start, "ok")
+                return result
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                errors.inc(1, component, type(e).__name__)
+                record(start, "error")
+                raise
+            record(start, "ok")
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def timed_node(name: str, fn):
+    """Wrap a graph node so its wall time lands in therapy_node_duration_seconds."""
+    return _timed(node_duration, "node", name, (name,), f"node:{name}")(fn)
+
+
+def timed_operation(backend: str, operation: str):
+    """Decorator for Supabase / vector store calls (backend_operation_duration_seconds)."""
+    return _timed(backend_duration, backend, operation, (backend, operation), backend)
+
+
+class LLMMetricsLogger(CustomLogger):
+    """LiteLLM callback recording latency, time to first token and token usage of every call."""
+
+    def _record(self, kwargs, response_obj, start_time, end_time, status: str) -> None:
+        payload = kwargs.get("standard_logging_object") or {}
+        model = payload.get("model") or kwargs.get("model") or "unknown"
+        seconds = (end_time - start_time).total_seconds()
+        llm_duration.observe(seconds, model, status)
+        first_token = kwargs.get("completion_start_time")
+        if kwargs.get("stream") and first_token and first_token != end_time:
+            llm_first_token.observe((first_token - start_time).total_seconds(), model)
+        usage = payload or getattr(response_obj, "usage", None) or {}
+        get = usage.get if isinstance(usage, dict) else lambda key: getattr(usage, key, None)
+        prompt_tokens, completion_tokens = get("prompt_tokens") or 0, get("completion_tokens") or 0
+        llm_tokens.inc(prompt_tokens, model, "in")
+        llm_tokens.inc(completion_tokens, model, "out")
+        if status == "error":
+            errors.inc(1, "llm", type(kwargs.get("exception")).__name__)
+        _span("llm", model, time.perf_counter() - seconds, seconds, status,
+              tokens_in=prompt_tokens, tokens_out=completion_tokens)
+
+    def log_success_event(self, kwargs, response_obj, start_time, end_time):
+        self._record(kwargs, response_obj, start_time, end_time, "ok")
+
+    def log_failure_event(self, kwargs, response_obj, start_time, end_time):
+        self._record(kwargs, response_obj, start_time, end_time, "error")
+
+    async def async_log_success_event(self, kwargs, response_obj, start_time, end_time):
+        self._record(kwargs, response_obj, start_time, end_time, "ok")
+
+    async def async_log_failure_event(self, kwargs, response_obj, start_time, end_time):
+        self._record(kwargs, response_obj, start_time, end_time, "error")
+
+
+llm_metrics_logger = LLMMetricsLogger()
+if METRICS_ENABLED:
+    litellm.callbacks.append(llm_metrics_logger)
@@ -0,0 +1,238 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+import dotenv
+
+dotenv.load_dotenv()
+
+CLASSIFIER_CACHE_SIZE = int(os.getenv("CLASSIFIER_CACHE_SIZE", "10000"))  # 0 disables the cache
+CLASSIFIER_CACHE_TTL = float(os.getenv("CLASSIFIER_CACHE_TTL", "3600"))
+# Long messages rarely repeat, so only short ones are worth caching.
+CLASSIFIER_CACHE_MAX_CHARS = int(os.getenv("CLASSIFIER_CACHE_MAX_CHARS", "200"))
+# Directory for a SQLite cache shared by every worker on the host; unset keeps
+# the cache per-process.
+CLASSIFIER_CACHE_DIR = os.getenv("CLASSIFIER_CACHE_DIR")
+
+_MISS = object()
+# Only sentence punctuation: emoticons and emoji change the classification.
+_PUNCTUATION_EDGES = re.compile(r"^[\s.,!?]+|[\s.,!?]+$")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Case-fold, collapse whitespace and trim surrounding punctuation ("Hi!! " -> "hi")."""
+    text = _WHITESPACE.sub(" ", text.casefold())
+    return _PUNCTUATION_EDGES.sub("", text)
+
+
+def prompt_version(model: str, messages: list) -> str:
+    """
+    Fingerprint of a classifier's model and prompt template, so editing either
+    stops old results from being served.
+    """
+    source = json.dumps([model, messages], sort_keys=True)
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()[:12]
+
+
+class SqliteClassifierBackend:
+    """
+    Classifier results in a SQLite file, shared by the workers on one host.
+    Expired rows are deleted at most every `sweep_interval` seconds, on a write.
+    """
+
+    def __init__(self, cache_dir: str, sweep_interval: float = 300.0):
+        os.makedirs(cache_dir, exist_ok=True)
+        self._db = sqlite3.connect(
+            os.path.join(cache_dir, "classifier_cache.sqlite"), check_same_thread=False, timeout=1.0
+        )
+        self._db.execute("pragma journal_mode=wal")
+        self._db.execute(
+            "create table if not exists classifications (key text primary key, value text, expires_at real)"
+        )
+        self._db.execute(
+            "create index if not exists classifications_expires_at_idx on classifications (expires_at)"
+        )
+        self.sweep_interval = sweep_interval
+        self._next_sweep = time.monotonic() + sweep_interval
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        with self._lock:
+            row = self._db.execute(
+                "select value, expires_at from classifications where key = ? and expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def put(self, key: str, value: Any, expires_at: float) -> None:
+        with self._lock:
+            self._db.execute(
+                "insert or replace into classifications (key, value, expires_at) values (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+            # Expired rows are otherwise never read again.
+            if time.monotonic() >= self._next_sweep:
+                self._db.execute("delete from classifications where expires_at <= ?", (time.time(),))
+                self._next_sweep = time.monotonic() + self.sweep_interval
+            self._db.commit()
+
+
+class ClassifierCache:
+    """
+    Results of the temperature-0 classifiers, keyed by classifier, prompt
+    version and normalized input text.
+
+    Entries live in an in-process LRU of `max_entries` and expire `ttl`
+    seconds after they were computed. With a shared backend, local misses
+    are looked up there (and results written there) so workers share their
+    results. Inputs longer than `max_text_length` are never cached.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10_000,
+        ttl: float = 3600.0,
+        max_text_length: int = 200,
+        backend: Optional[SqliteClassifierBackend] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_text_length = max_text_length
+        self.backend = backend
+        # key -> (value, expires_at as wall-clock time, shared with the backend)
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def key(self, classifier: str, version: str, text: str) -> Optional[str]:
+        """Cache key for an input, or None if the input shouldn't be cached."""
+        if self.max_entries <= 0 or len(text) > self.max_text_length:
+            return None
+        normalized = normalize_text(text)
+        return hashlib.sha256(f"{classifier}\0{version}\0{normalized}".encode("utf-8")).hexdigest()
+
+    def get(self, classifier: str, key: str, serve: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        Return the cached result, or _MISS. A result `serve` rejects is
+        treated as a miss (counted as a bypass) so the classifier runs again.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None and self.backend is not None:
+            try:
+                entry = self.backend.get(key)
+            except sqlite3.Error as e:
+                print(f"Classifier cache read failed: {e}")
+            if entry is not None:
+                self._remember(key, entry)
+
+        if entry is None:
+            self._count(classifier, "misses")
+            return _MISS
+        if serve is not None and not serve(entry[0]):
+            self._count(classifier, "bypassed")
+            return _MISS
+        self._count(classifier, "hits")
+        return entry[0]
+
+    def put(self, key: str, value: Any) -> None:
+        entry = (value, time.time() + self.ttl)
+        self._remember(key, entry)
+        if self.backend is not None:
+            try:
+                self.backend.put(key, value, entry[1])
+            except sqlite3.Error as e:
+                print(f"Classifier cache write failed: {e}")
+
+    def _remember(self, key: str, entry: Tuple[Any, float]) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _count(self, classifier: str, outcome: str) -> None:
+        with self._lock:
+            counts = self._counts.setdefault(classifier, {"hits": 0, "misses": 0, "bypassed": 0})
+            counts[outcome] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            per_classifier = {}
+            for classifier, counts in self._counts.items():
+                lookups = sum(counts.values())
+                per_classifier[classifier] = {
+                    **counts,
+                    "hit_rate": counts["hits"] / lookups if lookups else 0.0,
+                }
+            hits = sum(c["hits"] for c in self._counts.values())
+            lookups = sum(sum(c.values()) for c in self._counts.values())
+            return {
+                "entries": len(self._entries),
+                "hits": hits,
+                "lookups": lookups,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "classifiers": per_classifier,
+            }
+
+
+classifier_cache = ClassifierCache(
+    max_entries=CLASSIFIER_CACHE_SIZE,
+    ttl=CLASSIFIER_CACHE_TTL,
+    max_text_length=CLASSIFIER_CACHE_MAX_CHARS,
+    backend=SqliteClassifierBackend(CLASSIFIER_CACHE_DIR) if CLASSIFIER_CACHE_DIR else None,
+)
+
+
+def cached_classification(
+    classifier: str,
+    version: str,
+    text: str,
+    classify: Callable[[str], Any],
+    serve: Optional[Callable[[Any], bool]] = None,
+) -> Any:
+    """
+    Return classify(text), served from the classifier cache when possible.
+    Results must be JSON-serializable. `serve` is the safety policy: a cached
+    result it rejects is never returned.
+    """
+    key = classifier_cache.key(classifier, version, text)
+    if key is None:
+        return classify(text)
+    result = classifier_cache.get(classifier, key, serve)
+    if result is _MISS:
+        result = classify(text)
+        classifier_cache.put(key, result)
+    return result
+
+
+async def acached_classification(
+    classifier: str,
+    version: str,
+    text: str,
+    classify: Callable[[str], Awaitable[Any]],
+    serve: Optional[Callable[[Any], bool]] = None,
+) -> Any:
+    """Async variant of cached_classification."""
+    key = classifier_cache.key(classifier, version, text)
+    if key is None:
+        return await classify(text)
+    result = classifier_cache.get(classifier, key, serve)
+    if result is _MISS:
+        result = await classify(text)
+        classifier_cache.put(key, result)
+    return result
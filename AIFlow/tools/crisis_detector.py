@@ -1,17 +1,63 @@
-from litellm import completion
+from dataclasses import dataclass
+from AIFlow.tools.llm_client import CLASSIFIER, acomplete, complete, role_model
+from AIFlow.tools.llm_limiter import PRIORITY_CRISIS
 from pydantic import BaseModel
+from typing import Optional
+from AIFlow.guardrails.engine import GuardrailEngine
+from AIFlow.guardrails.input_moderation import contains_unsafe_content
+from AIFlow.memory.memory_manager import get_embeddings
+from AIFlow.tools.classifier_cache import acached_classification, cached_classification, prompt_version
+from AIFlow.tools.local_classifier import SEED_DIR, ExemplarScorer
 import json
+import os
+import dotenv
+
+dotenv.load_dotenv()
+
+CRISIS_MODEL = role_model(CLASSIFIER)
+# Cascade thresholds on the similarity to the nearest crisis exemplar (see
+# detect_crisis). Messages scoring in between go to the LLM. Both lean towards
+# recall: only clearly unrelated messages are cleared without the LLM.
+CRISIS_LOW_THRESHOLD = float(os.getenv("CRISIS_LOW_THRESHOLD", "0.35"))
+CRISIS_HIGH_THRESHOLD = float(os.getenv("CRISIS_HIGH_THRESHOLD", "0.8"))
+
+# Explicit statements of suicidal intent, self-harm or danger; any of these
+# flags a crisis without further checks.
+CRISIS_PHRASES = [
+    "suicide", "suicidal", "kill myself", "killing myself", "end my life", "ending my life",
+    "take my own life", "taking my own life", "want to die", "wanna die", "want to be dead",
+    "better off dead", "better off without me", "no reason to live", "not worth living",
+    "don't want to be alive", "don't want to live", "self-harm", "self harm", "self-harming",
+    "hurt myself", "hurting myself", "cut myself", "cutting myself", "overdose", "overdosed",
+]
+
+crisis_screen = GuardrailEngine(keywords={"crisis": CRISIS_PHRASES})
+crisis_exemplars = ExemplarScorer.from_file(os.path.join(SEED_DIR, "crisis_exemplars.json"))
+
+
+def warm_up_crisis_detector() -> None:
+    """Embed the crisis exemplars, which every classifier mode scores messages against."""
+    crisis_exemplars.fit(get_embeddings())
+
+
+@dataclass(frozen=True)
+class CrisisVerdict:
+    crisis: bool
+    tier: str  # which tier decided: 'lexical', 'embedding' or 'llm'
+    score: Optional[float] = None  # similarity to the nearest crisis exemplar, if computed
+
+
+def contains_crisis_language(text: str) -> bool:
+    """Tier one of the cascade: an explicit crisis phrase."""
+    return crisis_screen.first(text) is not None
+
 
 class CrisisAnalyzer(BaseModel):
     crisis: bool
 
 
-def crisis_tool(text: str) -> bool:
-    """
-    Uses LiteLLM to detect if the message contains a mental health crisis.
-    Returns True if the message indicates suicidal thoughts, self-harm, or emergency.
-    """
-    messages = [
+def _crisis_messages(text: str) -> list:
+    return [
         {"role": "system", "content": "You are a mental health safety checker."},
         {
             "role": "user",
@@ -25,12 +71,98 @@ If it's safe or neutral, respond with ONLY False.
         },
     ]
 
-    response = completion(
-        model="gemini/gemini-2.0-flash-lite",
-        messages=messages,
-        temperature=0.0,
-        response_format=CrisisAnalyzer,
-    )
+
+def _parse_crisis(response) -> bool:
     response = response["choices"][0]["message"]["content"]
     response = json.loads(response)
     return response.get("crisis", False)
+
+
+CRISIS_PROMPT_VERSION = prompt_version(CRISIS_MODEL, _crisis_messages("{text}"))
+
+
+def serve_cached_crisis(text: str):
+    """
+    Safety policy for cached crisis verdicts: a cached "no crisis" is never
+    served for input the lexical moderation or crisis screen flags; it is
+    re-checked instead.
+    """
+    return lambda crisis: bool(crisis) or not (contains_unsafe_content(text) or contains_crisis_language(text))
+
+
+def _classify_crisis(text: str) -> bool:
+    response = complete(
+        CLASSIFIER,
+        _crisis_messages(text),
+        temperature=0.0,
+        response_format=CrisisAnalyzer,
+        priority=PRIORITY_CRISIS,
+    )
+    return _parse_crisis(response)
+
+
+async def _aclassify_crisis(text: str) -> bool:
+    response = await acomplete(
+        CLASSIFIER,
+        _crisis_messages(text),
+        temperature=0.0,
+        response_format=CrisisAnalyzer,
+        priority=PRIORITY_CRISIS,
+    )
+    return _parse_crisis(response)
+
+
+def crisis_tool(text: str) -> bool:
+    """
+    Uses LiteLLM to detect if the message contains a mental health crisis.
+    Returns True if the message indicates suicidal thoughts, self-harm, or emergency.
+    """
+    return cached_classification(
+        "crisis", CRISIS_PROMPT_VERSION, text, _classify_crisis, serve_cached_crisis(text)
+    )
+
+
+async def acrisis_tool(text: str) -> bool:
+    """Async variant of crisis_tool."""
+    return await acached_classification(
+        "crisis", CRISIS_PROMPT_VERSION, text, _aclassify_crisis, serve_cached_crisis(text)
+    )
+
+
+def _embedding_verdict(score: Optional[float]) -> Optional[CrisisVerdict]:
+    if score is None:
+        return None
+    if score >= CRISIS_HIGH_THRESHOLD:
+        return CrisisVerdict(True, "embedding", score)
+    if score < CRISIS_LOW_THRESHOLD:
+        return CrisisVerdict(False, "embedding", score)
+    return None
+
+
+def detect_crisis(text: str) -> CrisisVerdict:
+    """
+    Crisis-detection cascade. An explicit crisis phrase decides at once; then
+    the similarity to curated crisis exemplars decides clear cases either way;
+    only the uncertain band between CRISIS_LOW_THRESHOLD and
+    CRISIS_HIGH_THRESHOLD (or an embedding failure) is sent to crisis_tool.
+    """
+    if contains_crisis_language(text):
+        return CrisisVerdict(True, "lexical")
+    try:
+        score = crisis_exemplars.score(text, get_embeddings())
+    except Exception as e:
+        print(f"Crisis exemplar scoring failed, using LLM: {e}")
+        score = None
+    return _embedding_verdict(score) or CrisisVerdict(crisis_tool(text), "llm", score)
+
+
+async def adetect_crisis(text: str) -> CrisisVerdict:
+    """Async variant of detect_crisis."""
+    if contains_crisis_language(text):
+        return CrisisVerdict(True, "lexical")
+    try:
+        score = await crisis_exemplars.ascore(text, get_embeddings())
+    except Exception as e:
+        print(f"Crisis exemplar scoring failed, using LLM: {e}")
+        score = None
+    return _embedding_verdict(score) or CrisisVerdict(await acrisis_tool(text), "llm", score)
@@ -1,22 +1,50 @@
-from litellm import completion
+from AIFlow.tools.llm_client import CLASSIFIER, acomplete, complete, role_model
 from pydantic import BaseModel
+from AIFlow.tools.classifier_cache import acached_classification, cached_classification, prompt_version
 import json
 
+EMOTION_MODEL = role_model(CLASSIFIER)
+
+
 class EmotionAnalyzer(BaseModel):
     emotion: str
 
-def emotion_tool(text: str) -> str:
-    """
-    Uses LiteLLM to classify the user's emotional state.
-    Returns one-word emotion like 'sad', 'anxious', 'angry', etc.
-    """
-    messages = [
+
+def _emotion_messages(text: str) -> list:
+    return [
         {"role": "system", "content": "You are an expert emotional classifier."},
         {"role": "user", "content": f"What emotion is being expressed in this message: '{text}'? Reply with one word only."}
     ]
 
-    response = completion(model="gemini/gemini-2.0-flash-lite", messages=messages, temperature=0.0, response_format=EmotionAnalyzer)
+
+def _parse_emotion(response) -> str:
     response = response["choices"][0]["message"]["content"]
     response = json.loads(response)
-    
     return response.get("emotion", "").strip().lower()
+
+
+EMOTION_PROMPT_VERSION = prompt_version(EMOTION_MODEL, _emotion_messages("{text}"))
+
+
+def _classify_emotion(text: str) -> str:
+    response = complete(CLASSIFIER, _emotion_messages(text), temperature=0.0, response_format=EmotionAnalyzer)
+    return _parse_emotion(response)
+
+
+async def _aclassify_emotion(text: str) -> str:
+    response = await acomplete(CLASSIFIER, _emotion_messages(text), temperature=0.0, response_format=EmotionAnalyzer)
+    return _parse_emotion(response)
+
+
+def emotion_tool(text: str) -> str:
+    """
+    Uses LiteLLM to classify the user's emotional state.
+    Returns one-word emotion like 'sad', 'anxious', 'angry', etc.
+    Results for short, repeated messages come from the classifier cache.
+    """
+    return cached_classification("emotion", EMOTION_PROMPT_VERSION, text, _classify_emotion)
+
+
+async def aemotion_tool(text: str) -> str:
+    """Async variant of emotion_tool."""
+    return await acached_classification("emotion", EMOTION_PROMPT_VERSION, text, _aclassify_emotion)
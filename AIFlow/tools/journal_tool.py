@@ -1,17 +1,16 @@
-from litellm import completion
+from AIFlow.tools.llm_client import CLASSIFIER, GENERATOR, acomplete, astream, complete, role_model
 from pydantic import BaseModel
+from AIFlow.tools.classifier_cache import acached_classification, cached_classification, prompt_version
 # import json
 
+JOURNAL_INTENT_MODEL = role_model(CLASSIFIER)
+
 # class JournalAnalyzer(BaseModel):
 #     journal_entry: str
-    
-    
-def journal_tool(entry: str) -> str:
-    """
-    Reflects on a user's journal entry and provides a supportive, therapeutic response.
-    Can be used for journaling, mood tracking, or self-awareness.
-    """
-    messages = [
+
+
+def _journal_messages(entry: str) -> list:
+    return [
         {"role": "system", "content": (
             "You are an empathetic AI therapist. A user has written a journal entry. "
             "Read it, reflect on the feelings expressed, and provide a thoughtful and supportive response. "
@@ -19,8 +18,67 @@ def journal_tool(entry: str) -> str:
         )},
         {"role": "user", "content": f"Journal Entry:\n{entry}"}
     ]
-    
-    response = completion(model="gemini/gemini-2.0-flash", messages=messages, temperature=0.0)
+
+
+def journal_tool(entry: str) -> str:
+    """
+    Reflects on a user's journal entry and provides a supportive, therapeutic response.
+    Can be used for journaling, mood tracking, or self-awareness.
+    """
+    response = complete(GENERATOR, _journal_messages(entry), temperature=0.0)
+    response = response["choices"][0]["message"]["content"]
+    return response
+
+
+async def ajournal_tool(entry: str) -> str:
+    """Async variant of journal_tool."""
+    response = await acomplete(GENERATOR, _journal_messages(entry), temperature=0.0)
     response = response["choices"][0]["message"]["content"]
     return response
-    
+
+
+async def astream_journal_tool(entry: str):
+    """Streaming variant of ajournal_tool; yields the reflection as it is generated."""
+    async for chunk in astream(GENERATOR, _journal_messages(entry), temperature=0.0):
+        delta = chunk.choices[0].delta.content
+        if delta:
+            yield delta
+
+
+def _journal_intent_messages(text: str) -> list:
+    return [
+        {
+            "role": "system",
+            "content": "You classify if a user message is a journal entry or a request for therapy chat. Reply ONLY with 'journal' or 'chat'.",
+        },
+        {"role": "user", "content": f"Message: {text}"},
+    ]
+
+
+JOURNAL_INTENT_PROMPT_VERSION = prompt_version(JOURNAL_INTENT_MODEL, _journal_intent_messages("{text}"))
+
+
+def _classify_journal_intent(text: str) -> str:
+    response = complete(CLASSIFIER, _journal_intent_messages(text), temperature=0.0)
+    return response["choices"][0]["message"]["content"].strip().lower()
+
+
+async def _aclassify_journal_intent(text: str) -> str:
+    response = await acomplete(CLASSIFIER, _journal_intent_messages(text), temperature=0.0)
+    return response["choices"][0]["message"]["content"].strip().lower()
+
+
+def journal_intent_tool(text: str) -> str:
+    """
+    Classifies a user message as a 'journal' entry or a therapy 'chat' request.
+    """
+    return cached_classification(
+        "journal_intent", JOURNAL_INTENT_PROMPT_VERSION, text, _classify_journal_intent
+    )
+
+
+async def ajournal_intent_tool(text: str) -> str:
+    """Async variant of journal_intent_tool."""
+    return await acached_classification(
+        "journal_intent", JOURNAL_INTENT_PROMPT_VERSION, text, _aclassify_journal_intent
+    )
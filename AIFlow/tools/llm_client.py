@@ -0,0 +1,403 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+import dotenv
+import litellm
+from AIFlow.monitoring.metrics import METRICS_ENABLED, llm_attempts
+from AIFlow.tools.llm_limiter import PRIORITY_BACKGROUND, PRIORITY_TURN, LimitedStream, LLMOverloaded, llm_limiter
+
+dotenv.load_dotenv()
+
+# Roles: what a call is for decides its models, deadlines and priority.
+CLASSIFIER = "classifier"  # short structured answers on the turn's critical path
+GENERATOR = "generator"  # the therapist's replies
+SUMMARIZER = "summarizer"  # background thread summaries
+
+# A duplicate request is sent once a call has taken longer than this
+# quantile of the model's recent latencies (LLM_HEDGE_DEFAULT_DELAY until
+# LLM_HEDGE_MIN_SAMPLES calls have been seen).
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "2.0"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.05"))
+# First retry backoff in seconds; doubles per retry, +/- 50% jitter.
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "0.25"))
+# After this many failures in a row a model is tried after the role's other
+# models for LLM_MODEL_COOLDOWN seconds.
+LLM_MODEL_FAILURES = int(os.getenv("LLM_MODEL_FAILURES", "3"))
+LLM_MODEL_COOLDOWN = float(os.getenv("LLM_MODEL_COOLDOWN", "30"))
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "200"))
+
+# Worth another try on the same model; anything else moves on to the fallback.
+RETRYABLE_ERRORS = (
+    TimeoutError,
+    litellm.Timeout,
+    litellm.RateLimitError,
+    litellm.APIConnectionError,
+    litellm.ServiceUnavailableError,
+    litellm.InternalServerError,
+)
+
+
+class LLMUnavailable(RuntimeError):
+    """Every model of a role failed, or the role's deadline passed."""
+
+
+@dataclass(frozen=True)
+class RoleConfig:
+    model: str
+    fallbacks: Tuple[str, ...]
+    timeout: float  # per attempt, in seconds; for streams, to the first chunk and between chunks
+    deadline: float  # for the whole call, retries and fallbacks included
+    retries: int  # further attempts on the same model after a transient error
+    hedge: bool
+    priority: int
+
+
+def _role_config(role: str, model: str, fallbacks: str, timeout: float, deadline: float,
+                 retries: int, hedge: bool, priority: int) -> RoleConfig:
+    """Defaults for a role, each overridable with LLM_<ROLE>_<SETTING>."""
+    def env(setting: str, default) -> str:
+        return os.getenv(f"LLM_{role.upper()}_{setting}", str(default))
+
+    return RoleConfig(
+        model=env("MODEL", model),
+        fallbacks=tuple(name.strip() for name in env("FALLBACKS", fallbacks).split(",") if name.strip()),
+        timeout=float(env("TIMEOUT", timeout)),
+        deadline=float(env("DEADLINE", deadline)),
+        retries=int(env("RETRIES", retries)),
+        hedge=env("HEDGE", hedge).lower() in ("1", "true", "yes"),
+        priority=priority,
+    )
+
+
+ROLES: Dict[str, RoleConfig] = {
+    CLASSIFIER: _role_config(
+        CLASSIFIER, "gemini/gemini-2.0-flash-lite", "gemini/gemini-2.0-flash", 8, 20, 1, True, PRIORITY_TURN
+    ),
+    GENERATOR: _role_config(
+        GENERATOR, "gemini/gemini-2.0-flash", "gemini/gemini-2.0-flash-lite", 20, 45, 1, True, PRIORITY_TURN
+    ),
+    SUMMARIZER: _role_config(
+        SUMMARIZER, "gemini/gemini-2.0-flash-lite", "gemini/gemini-2.0-flash", 30, 90, 2, False, PRIORITY_BACKGROUND
+    ),
+}
+
+
+def role_model(role: str) -> str:
+    """The model a role normally uses (prompt versions and token counting are keyed on it)."""
+    return ROLES[role].model
+
+
+# === Per-model latency ===
+
+class ModelStats:
+    """Recent latencies (time to first chunk for streams) and failures of one model."""
+
+    def __init__(self, window: int = LLM_LATENCY_WINDOW):
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+
+    def record_success(self, seconds: float) -> None:
+        with self._lock:
+            self._latencies.append(seconds)
+            self.successes += 1
+            self.consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= LLM_MODEL_FAILURES:
+                self.cooldown_until = time.monotonic() + LLM_MODEL_COOLDOWN
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if len(self._latencies) < LLM_HEDGE_MIN_SAMPLES:
+                return None
+            values = sorted(self._latencies)
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    @property
+    def cooling_down(self) -> bool:
+        return time.monotonic() < self.cooldown_until
+
+    def snapshot(self) -> Dict:
+        p50, p95 = self.quantile(0.5), self.quantile(0.95)
+        return {
+            "successes": self.successes,
+            "failures": self.failures,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "cooling_down": self.cooling_down,
+        }
+
+
+_model_stats: Dict[str, ModelStats] = {}
+_model_stats_lock = threading.Lock()
+
+
+def model_stats(model: str) -> ModelStats:
+    stats = _model_stats.get(model)
+    if stats is None:
+        with _model_stats_lock:
+            stats = _model_stats.setdefault(model, ModelStats())
+    return stats
+
+
+def llm_model_stats() -> Dict[str, Dict]:
+    return {model: stats.snapshot() for model, stats in sorted(_model_stats.items())}
+
+
+def route(role: str) -> List[str]:
+    """A role's models in the order to try them; models cooling down after repeated failures go last."""
+    config = ROLES[role]
+    models = list(dict.fromkeys([config.model, *config.fallbacks]))
+    return sorted(models, key=lambda model: model_stats(model).cooling_down)
+
+
+def hedge_delay(model: str) -> float:
+    latency = model_stats(model).quantile(LLM_HEDGE_QUANTILE)
+    return max(LLM_HEDGE_MIN_DELAY, LLM_HEDGE_DEFAULT_DELAY if latency is None else latency)
+
+
+def _record(role: str, model: str, kind: str, outcome: str) -> None:
+    if METRICS_ENABLED:
+        llm_attempts.inc(1, role, model, kind, outcome)
+
+
+def _outcome(error: BaseException) -> str:
+    return "timeout" if isinstance(error, (TimeoutError, litellm.Timeout)) else "error"
+
+
+class _CallPlan:
+    """
+    The attempts of one call: each model of the role in route order, retried
+    after transient errors, all within the role's deadline.
+    """
+
+    def __init__(self, role: str):
+        self.role = role
+        self.config = ROLES[role]
+        self.deadline = time.monotonic() + self.config.deadline
+        self.error: Optional[BaseException] = None
+        self._may_retry = False
+        self._retry = 0
+
+    def attempts(self) -> Iterator[Tuple[str, str, float]]:
+        """Yield (model, kind, timeout) until the caller stops after a success."""
+        for position, model in enumerate(route(self.role)):
+            for retry in range(self.config.retries + 1):
+                remaining = self.deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                self._retry, self._may_retry = retry, retry < self.config.retries
+                kind = "retry" if retry else "primary" if position == 0 else "fallback"
+                yield model, kind, min(self.config.timeout, remaining)
+                if not self._may_retry:
+                    break
+
+    def failed(self, model: str, kind: str, error: BaseException) -> float:
+        """Note a failed attempt; returns the backoff before retrying the same model."""
+        self.error = error
+        print(f"LLM {self.role} {kind} call to {model} failed: {error!r}")
+        if not isinstance(error, RETRYABLE_ERRORS):
+            self._may_retry = False
+        if not self._may_retry:
+            return 0.0
+        backoff = LLM_RETRY_BACKOFF * 2 ** self._retry * random.uniform(0.5, 1.5)
+        return max(0.0, min(backoff, self.deadline - time.monotonic()))
+
+    def unavailable(self) -> LLMUnavailable:
+        return LLMUnavailable(f"No model answered the {self.role} call: {self.error!r}")
+
+
+# === Single attempts ===
+
+def _attempt(role: str, model: str, kind: str, timeout: float, priority: int, kwargs: Dict):
+    llm_limiter.acquire(priority)
+    started = time.monotonic()
+    try:
+        # litellm enforces the timeout on the request itself.
+        response = litellm.completion(model=model, timeout=timeout, **kwargs)
+    except Exception as e:
+        model_stats(model).record_failure()
+        _record(role, model, kind, _outcome(e))
+        raise
+    finally:
+        llm_limiter.release()
+    model_stats(model).record_success(time.monotonic() - started)
+    _record(role, model, kind, "ok")
+    return response
+
+
+async def _aattempt(role: str, model: str, kind: str, timeout: float, priority: int, kwargs: Dict,
+                    acquired: bool = False):
+    if not acquired:
+        await llm_limiter.aacquire(priority)
+    started = time.monotonic()
+    try:
+        response = await asyncio.wait_for(litellm.acompletion(model=model, timeout=timeout, **kwargs), timeout)
+    except asyncio.CancelledError:
+        _record(role, model, kind, "cancelled")
+        raise
+    except Exception as e:
+        model_stats(model).record_failure()
+        _record(role, model, kind, _outcome(e))
+        raise
+    finally:
+        llm_limiter.release()
+    model_stats(model).record_success(time.monotonic() - started)
+    _record(role, model, kind, "ok")
+    return response
+
+
+async def _astream_attempt(role: str, model: str, kind: str, timeout: float, priority: int, kwargs: Dict,
+                           acquired: bool = False) -> Tuple[Any, LimitedStream]:
+    """Open a stream and wait for its first chunk (None for an empty stream)."""
+    if not acquired:
+        await llm_limiter.aacquire(priority)
+    started = time.monotonic()
+    stream: Optional[LimitedStream] = None
+
+    async def first_chunk():
+        nonlocal stream
+        response = await litellm.acompletion(model=model, stream=True, timeout=timeout, **kwargs)
+        stream = LimitedStream(response, llm_limiter)  # owns the slot from here on
+        try:
+            return await stream.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    try:
+        first = await asyncio.wait_for(first_chunk(), timeout)
+    except BaseException as e:
+        if stream is None:
+            llm_limiter.release()
+        else:
+            stream.close()
+        if isinstance(e, asyncio.CancelledError):
+            _record(role, model, kind, "cancelled")
+        elif isinstance(e, Exception):
+            model_stats(model).record_failure()
+            _record(role, model, kind, _outcome(e))
+        raise
+    model_stats(model).record_success(time.monotonic() - started)
+    _record(role, model, kind, "ok")
+    return first, stream
+
+
+async def _ahedged(attempt: Callable[[str, bool], Awaitable], model: str, kind: str, hedge: bool,
+                   discard: Callable[[Any], None] = lambda result: None):
+    """
+    Run attempt(kind, acquired=False). If it is still running after the
+    model's hedge delay and a limiter slot is free right away, race it
+    against a duplicate; the first success wins and the other is cancelled.
+    """
+    if not hedge:
+        return await attempt(kind, False)
+    tasks = [asyncio.create_task(attempt(kind, False))]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_delay(model))
+        if done or not llm_limiter.try_acquire():
+            return await tasks[0]
+        tasks.append(asyncio.create_task(attempt("hedge", True)))
+        pending, error = set(tasks), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winners = [task for task in done if task.exception() is None]
+            if winners:
+                for extra in winners[1:]:
+                    discard(extra.result())
+                return winners[0].result()
+            error = next(iter(done)).exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+# === Calls ===
+
+def complete(role: str, messages: List[Dict], priority: Optional[int] = None, **kwargs):
+    """
+    litellm.completion for a role, with its models, timeouts, retries and
+    fallbacks. Not hedged: a blocked thread can't be cancelled, only timed out.
+    """
+    plan = _CallPlan(role)
+    priority = plan.config.priority if priority is None else priority
+    for model, kind, timeout in plan.attempts():
+        try:
+            return _attempt(role, model, kind, timeout, priority, {"messages": messages, **kwargs})
+        except LLMOverloaded:
+            raise
+        except Exception as e:
+            time.sleep(plan.failed(model, kind, e))
+    raise plan.unavailable() from plan.error
+
+
+async def acomplete(role: str, messages: List[Dict], priority: Optional[int] = None, **kwargs):
+    """Async variant of complete, with hedged requests for roles that enable them."""
+    plan = _CallPlan(role)
+    priority = plan.config.priority if priority is None else priority
+    for model, kind, timeout in plan.attempts():
+        def attempt(attempt_kind: str, acquired: bool):
+            return _aattempt(role, model, attempt_kind, timeout, priority,
+                             {"messages": messages, **kwargs}, acquired)
+
+        try:
+            return await _ahedged(attempt, model, kind, plan.config.hedge)
+        except LLMOverloaded:
+            raise
+        except Exception as e:
+            await asyncio.sleep(plan.failed(model, kind, e))
+    raise plan.unavailable() from plan.error
+
+
+async def astream(role: str, messages: List[Dict], priority: Optional[int] = None, **kwargs) -> AsyncIterator:
+    """
+    Stream a completion for a role, yielding litellm chunks. Failures before
+    the first chunk are retried, hedged and fall back like acomplete; once
+    text has been yielded, an error or a stall longer than the role's
+    timeout is raised.
+    """
+    plan = _CallPlan(role)
+    priority = plan.config.priority if priority is None else priority
+    opened = None
+    for model, kind, timeout in plan.attempts():
+        def attempt(attempt_kind: str, acquired: bool):
+            return _astream_attempt(role, model, attempt_kind, timeout, priority,
+                                    {"messages": messages, **kwargs}, acquired)
+
+        try:
+            opened = await _ahedged(attempt, model, kind, plan.config.hedge, discard=lambda result: result[1].close())
+            break
+        except LLMOverloaded:
+            raise
+        except Exception as e:
+            await asyncio.sleep(plan.failed(model, kind, e))
+    if opened is None:
+        raise plan.unavailable() from plan.error
+
+    first, stream = opened
+    try:
+        if first is None:
+            return
+        yield first
+        while True:
+            try:
+                chunk = await asyncio.wait_for(stream.__anext__(), plan.config.timeout)
+            except StopAsyncIteration:
+                return
+            yield chunk
+    finally:
+        stream.close()
@@ -0,0 +1,265 @@
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+import dotenv
+from AIFlow.monitoring.metrics import METRICS_ENABLED, llm_queue_wait, register_collector
+
+dotenv.load_dotenv()
+
+# Most LLM calls in flight at once in this process, across all sessions and
+# threads; 0 disables the limit.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+# Sustained LLM requests per second (a token bucket holding LLM_RATE_BURST
+# requests); 0 disables rate limiting.
+LLM_RATE_LIMIT = float(os.getenv("LLM_RATE_LIMIT", "0"))
+LLM_RATE_BURST = int(os.getenv("LLM_RATE_BURST", str(max(1, LLM_MAX_CONCURRENCY))))
+# A call that hasn't got a slot after this many seconds fails with
+# LLMOverloaded instead of queueing indefinitely.
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "10"))
+
+# Queued calls start in priority order (lowest first), then arrival order.
+PRIORITY_CRISIS = 0  # crisis detection: never waits behind ordinary traffic
+PRIORITY_TURN = 1  # everything else a user is waiting on
+PRIORITY_BACKGROUND = 2  # summaries and other off-request work
+PRIORITY_NAMES = {PRIORITY_CRISIS: "crisis", PRIORITY_TURN: "turn", PRIORITY_BACKGROUND: "background"}
+
+
+class LLMOverloaded(RuntimeError):
+    """No LLM slot became free within LLM_QUEUE_TIMEOUT."""
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """Take a token, returning how many seconds to wait before it may be used."""
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def try_take(self) -> bool:
+        """Take a token only if one is available right now."""
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class _Waiter:
+    __slots__ = ("priority", "notify", "granted", "abandoned")
+
+    def __init__(self, priority: int, notify: Callable[[], None]):
+        self.priority = priority
+        self.notify = notify
+        self.granted = False
+        self.abandoned = False
+
+
+class PriorityLimiter:
+    """
+    Concurrency limit shared by threads and event loops, handing freed slots
+    to the highest-priority waiter; optionally rate limited by a TokenBucket.
+    """
+
+    def __init__(self, max_concurrency: int, bucket: Optional[TokenBucket] = None):
+        self.max_concurrency = max_concurrency
+        self.bucket = bucket
+        self._active = 0
+        self._queue: List = []  # heap of (priority, seq, waiter)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._rejected: Dict[int, int] = {}
+
+    def _enqueue(self, priority: int, notify: Callable[[], None]) -> Optional[_Waiter]:
+        """Take a free slot (None) or join the queue."""
+        with self._lock:
+            if self.max_concurrency <= 0 or (self._active < self.max_concurrency and not self._queue):
+                self._active += 1
+                return None
+            waiter = _Waiter(priority, notify)
+            heapq.heappush(self._queue, (priority, next(self._seq), waiter))
+            return waiter
+
+    def try_acquire(self) -> bool:
+        """
+        Take a slot only if one is free, nobody is waiting and the rate limit
+        allows a request right now (e.g. for a hedged request).
+        """
+        with self._lock:
+            if self.max_concurrency > 0 and (self._active >= self.max_concurrency or self._queue):
+                return False
+            if self.bucket and not self.bucket.try_take():
+                return False
+            self._active += 1
+            return True
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Leave the queue; True if a slot was granted meanwhile, which the caller now owns."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.abandoned = True
+            return False
+
+    def release(self) -> None:
+        with self._lock:
+            while self._queue:
+                _, _, waiter = heapq.heappop(self._queue)
+                if not waiter.abandoned:
+                    waiter.granted = True  # the slot passes straight to the waiter
+                    break
+            else:
+                self._active -= 1
+                return
+        waiter.notify()
+
+    def _overloaded(self, priority: int, started: float) -> LLMOverloaded:
+        with self._lock:
+            self._rejected[priority] = self._rejected.get(priority, 0) + 1
+        return LLMOverloaded(f"No LLM capacity after waiting {time.monotonic() - started:.1f}s")
+
+    def _waited(self, priority: int, started: float) -> None:
+        if METRICS_ENABLED:
+            llm_queue_wait.observe(time.monotonic() - started, PRIORITY_NAMES.get(priority, str(priority)))
+
+    def acquire(self, priority: int = PRIORITY_TURN, timeout: float = LLM_QUEUE_TIMEOUT) -> None:
+        """Block until a slot is free (and the rate limit allows a request)."""
+        started = time.monotonic()
+        granted = threading.Event()
+        waiter = self._enqueue(priority, granted.set)
+        if waiter is not None and not granted.wait(timeout) and not self._abandon(waiter):
+            raise self._overloaded(priority, started)
+        self._waited(priority, started)
+        delay = self.bucket.reserve() if self.bucket else 0.0
+        if delay:
+            time.sleep(delay)
+
+    async def aacquire(self, priority: int = PRIORITY_TURN, timeout: float = LLM_QUEUE_TIMEOUT) -> None:
+        """Async variant of acquire; waiting doesn't block the event loop."""
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def notify():
+            try:
+                loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+            except RuntimeError:  # the waiting loop is gone
+                self.release()
+
+        waiter = self._enqueue(priority, notify)
+        try:
+            if waiter is not None:
+                try:
+                    await asyncio.wait_for(granted, timeout)
+                except asyncio.TimeoutError:
+                    if not self._abandon(waiter):
+                        raise self._overloaded(priority, started) from None
+            self._waited(priority, started)
+            delay = self.bucket.reserve() if self.bucket else 0.0
+            if delay:
+                await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            if waiter is None or self._abandon(waiter):
+                self.release()
+            raise
+
+    def stats(self) -> Dict:
+        with self._lock:
+            waiting: Dict[str, int] = {}
+            for priority, _, waiter in self._queue:
+                if not waiter.abandoned:
+                    name = PRIORITY_NAMES.get(priority, str(priority))
+                    waiting[name] = waiting.get(name, 0) + 1
+            return {
+                "max_concurrency": self.max_concurrency,
+                "active": self._active,
+                "waiting": waiting,
+                "rejected": {PRIORITY_NAMES.get(p, str(p)): n for p, n in self._rejected.items()},
+            }
+
+
+class LimitedStream:
+    """A streamed response that frees its limiter slot once it ends, fails, is closed or is dropped."""
+
+    def __init__(self, stream, limiter: PriorityLimiter):
+        self._stream = stream
+        self._iterator = None
+        self._limiter = limiter
+        self._released = False
+
+    def _release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._limiter.release()
+
+    def close(self) -> None:
+        self._release()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            if self._iterator is None:
+                self._iterator = self._stream.__aiter__()
+            return await self._iterator.__anext__()
+        except BaseException:
+            self._release()
+            raise
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            if self._iterator is None:
+                self._iterator = iter(self._stream)
+            return next(self._iterator)
+        except BaseException:
+            self._release()
+            raise
+
+    def __del__(self):
+        self._release()
+
+
+llm_limiter = PriorityLimiter(
+    LLM_MAX_CONCURRENCY, TokenBucket(LLM_RATE_LIMIT, LLM_RATE_BURST) if LLM_RATE_LIMIT > 0 else None
+)
+
+
+def llm_limiter_stats() -> Dict:
+    return llm_limiter.stats()
+
+
+def _limiter_samples():
+    stats = llm_limiter.stats()
+    samples = [({"state": "active"}, stats["active"])]
+    samples += [({"state": "waiting", "priority": name}, count) for name, count in stats["waiting"].items()]
+    return samples
+
+
+register_collector("llm_limiter_calls", "LLM calls holding or waiting for a limiter slot.", _limiter_samples)
+register_collector(
+    "llm_limiter_rejected_total",
+    "LLM calls that gave up waiting for a slot (LLMOverloaded).",
+    lambda: [({"priority": name}, count) for name, count in llm_limiter.stats()["rejected"].items()],
+    kind="counter",
+)
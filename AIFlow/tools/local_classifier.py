@@ -0,0 +1,232 @@
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+import dotenv
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from AIFlow.memory.memory_manager import get_embeddings
+from AIFlow.tools.emotions_analyzer import emotion_tool, aemotion_tool
+from AIFlow.tools.journal_tool import journal_intent_tool, ajournal_intent_tool
+
+dotenv.load_dotenv()
+
+# Local predictions below this confidence are handed to the LLM classifier.
+LOCAL_CLASSIFIER_MIN_CONFIDENCE = float(os.getenv("LOCAL_CLASSIFIER_MIN_CONFIDENCE", "0.6"))
+# Inputs less similar than this to every label are out of the seed set's
+# range and always go to the LLM.
+LOCAL_CLASSIFIER_MIN_SIMILARITY = float(os.getenv("LOCAL_CLASSIFIER_MIN_SIMILARITY", "0.3"))
+SEED_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+
+class CentroidClassifier:
+    """
+    Nearest-centroid text classifier over sentence embeddings.
+
+    Each label's centroid is the normalized mean embedding of its seed
+    examples; a text gets the label of the most cosine-similar centroid.
+    Confidence is that label's softmax probability over the similarities
+    (sharpened by `temperature`), or 0 if even the best similarity is below
+    `min_similarity`. Centroids are computed on first use.
+    """
+
+    def __init__(
+        self,
+        examples: Dict[str, List[str]],
+        temperature: float = 0.05,
+        min_similarity: float = 0.3,
+    ):
+        self.examples = examples
+        self.labels = sorted(examples)
+        self.temperature = temperature
+        self.min_similarity = min_similarity
+        self._centroids: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        self.confident = 0
+        self.deferred = 0
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "CentroidClassifier":
+        """Load seed examples from a JSON object of label -> list of texts."""
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f), **kwargs)
+
+    def _seed_texts(self) -> List[str]:
+        return [text for label in self.labels for text in self.examples[label]]
+
+    def _set_centroids(self, vectors: List[List[float]]) -> None:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        centroids, row = [], 0
+        for label in self.labels:
+            count = len(self.examples[label])
+            centroids.append(matrix[row:row + count].mean(axis=0))
+            row += count
+        centroids = np.stack(centroids)
+        self._centroids = centroids / np.linalg.norm(centroids, axis=1, keepdims=True)
+
+    def fit(self, embeddings: Embeddings) -> None:
+        with self._lock:
+            if self._centroids is None:
+                self._set_centroids(embeddings.embed_documents(self._seed_texts()))
+
+    async def afit(self, embeddings: Embeddings) -> None:
+        if self._centroids is None:
+            vectors = await embeddings.aembed_documents(self._seed_texts())
+            with self._lock:
+                if self._centroids is None:
+                    self._set_centroids(vectors)
+
+    def predict_vector(self, vector: List[float]) -> Tuple[str, float]:
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        similarities = self._centroids @ (query / norm if norm else query)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.min_similarity:
+            return self.labels[best], 0.0
+        logits = (similarities - similarities[best]) / self.temperature
+        probabilities = np.exp(logits) / np.exp(logits).sum()
+        return self.labels[best], float(probabilities[best])
+
+    def predict(self, text: str, embeddings: Embeddings) -> Tuple[str, float]:
+        """Return (label, confidence) for a text."""
+        self.fit(embeddings)
+        return self.predict_vector(embeddings.embed_query(text))
+
+    async def apredict(self, text: str, embeddings: Embeddings) -> Tuple[str, float]:
+        """Async variant of predict."""
+        await self.afit(embeddings)
+        return self.predict_vector(await embeddings.aembed_query(text))
+
+    def record(self, confident: bool) -> None:
+        with self._lock:
+            if confident:
+                self.confident += 1
+            else:
+                self.deferred += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.confident + self.deferred
+            return {
+                "local": self.confident,
+                "llm_fallback": self.deferred,
+                "local_rate": self.confident / total if total else 0.0,
+            }
+
+
+class ExemplarScorer:
+    """
+    Scores a text by its highest cosine similarity to any of a set of
+    exemplar texts, which are embedded on first use. Unlike a centroid, this
+    still matches a text close to a single unusual exemplar.
+    """
+
+    def __init__(self, exemplars: List[str]):
+        self.exemplars = exemplars
+        self._matrix: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: str) -> "ExemplarScorer":
+        """Load exemplars from a JSON list of texts."""
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def _set_matrix(self, vectors: List[List[float]]) -> None:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        self._matrix = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+    def fit(self, embeddings: Embeddings) -> None:
+        with self._lock:
+            if self._matrix is None:
+                self._set_matrix(embeddings.embed_documents(self.exemplars))
+
+    async def afit(self, embeddings: Embeddings) -> None:
+        if self._matrix is None:
+            vectors = await embeddings.aembed_documents(self.exemplars)
+            with self._lock:
+                if self._matrix is None:
+                    self._set_matrix(vectors)
+
+    def score_vector(self, vector: List[float]) -> float:
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        return float((self._matrix @ (query / norm if norm else query)).max())
+
+    def score(self, text: str, embeddings: Embeddings) -> float:
+        self.fit(embeddings)
+        return self.score_vector(embeddings.embed_query(text))
+
+    async def ascore(self, text: str, embeddings: Embeddings) -> float:
+        await self.afit(embeddings)
+        return self.score_vector(await embeddings.aembed_query(text))
+
+
+emotion_classifier = CentroidClassifier.from_file(
+    os.path.join(SEED_DIR, "emotion_seed.json"), min_similarity=LOCAL_CLASSIFIER_MIN_SIMILARITY
+)
+journal_intent_classifier = CentroidClassifier.from_file(
+    os.path.join(SEED_DIR, "journal_intent_seed.json"), min_similarity=LOCAL_CLASSIFIER_MIN_SIMILARITY
+)
+
+
+def _local_prediction(classifier: CentroidClassifier, text: str) -> Optional[str]:
+    try:
+        label, confidence = classifier.predict(text, get_embeddings())
+    except Exception as e:
+        print(f"Local classifier failed, using LLM: {e}")
+        label, confidence = None, 0.0
+    confident = confidence >= LOCAL_CLASSIFIER_MIN_CONFIDENCE
+    classifier.record(confident)
+    return label if confident else None
+
+
+async def _alocal_prediction(classifier: CentroidClassifier, text: str) -> Optional[str]:
+    try:
+        label, confidence = await classifier.apredict(text, get_embeddings())
+    except Exception as e:
+        print(f"Local classifier failed, using LLM: {e}")
+        label, confidence = None, 0.0
+    confident = confidence >= LOCAL_CLASSIFIER_MIN_CONFIDENCE
+    classifier.record(confident)
+    return label if confident else None
+
+
+def local_emotion_tool(text: str) -> str:
+    """
+    Classifies the user's emotional state with the local embedding classifier,
+    calling emotion_tool only when the local prediction isn't confident.
+    """
+    return _local_prediction(emotion_classifier, text) or emotion_tool(text)
+
+
+async def alocal_emotion_tool(text: str) -> str:
+    """Async variant of local_emotion_tool."""
+    return await _alocal_prediction(emotion_classifier, text) or await aemotion_tool(text)
+
+
+def local_journal_intent_tool(text: str) -> str:
+    """
+    Classifies a message as 'journal' or 'chat' with the local embedding
+    classifier, calling journal_intent_tool only when it isn't confident.
+    """
+    return _local_prediction(journal_intent_classifier, text) or journal_intent_tool(text)
+
+
+async def alocal_journal_intent_tool(text: str) -> str:
+    """Async variant of local_journal_intent_tool."""
+    return await _alocal_prediction(journal_intent_classifier, text) or await ajournal_intent_tool(text)
+
+
+def warm_up_local_classifiers() -> None:
+    """Embed the seed sets so the first turn doesn't pay for it."""
+    embeddings = get_embeddings()
+    emotion_classifier.fit(embeddings)
+    journal_intent_classifier.fit(embeddings)
+
+
+def local_classifier_stats() -> Dict[str, Dict[str, float]]:
+    return {
+        "emotion": emotion_classifier.stats(),
+        "journal_intent": journal_intent_classifier.stats(),
+    }
@@ -0,0 +1,64 @@
+from AIFlow.tools.llm_client import SUMMARIZER, complete, role_model
+from langchain_core.messages import BaseMessage, HumanMessage
+from typing import List, Optional
+
+SUMMARY_MODEL = role_model(SUMMARIZER)
+
+
+def _summary_messages(summary: Optional[str], messages: List[BaseMessage], max_words: int) -> list:
+    turns = "\n".join(
+        f"{'User' if isinstance(m, HumanMessage) else 'Therapist'}: {m.content}" for m in messages
+    )
+    return [
+        {
+            "role": "system",
+            "content": (
+                "You maintain a running summary of a therapy conversation for the therapist. "
+                "Update the summary with the new turns: keep what the user shared about their "
+                "situation, feelings, people in their life, goals and anything they asked to remember. "
+                f"Drop small talk. Write in the third person, at most {max_words} words. "
+                "Reply with the updated summary only."
+            ),
+        },
+        {
+            "role": "user",
+            "content": f"Current summary:\n{summary or '(none yet)'}\n\nNew turns:\n{turns}",
+        },
+    ]
+
+
+def summarize_tool(summary: Optional[str], messages: List[BaseMessage], max_words: int = 200) -> str:
+    """
+    Folds new conversation turns into an existing summary, so the summary is
+    updated incrementally instead of being regenerated from the whole history.
+    """
+    response = complete(SUMMARIZER, _summary_messages(summary, messages, max_words), temperature=0.0)
+    return response["choices"][0]["message"]["content"].strip()
+
+
+def _digest_messages(digest: Optional[str], period: str, entries: List[str], max_words: int) -> list:
+    notes = "\n".join(f"- {entry}" for entry in entries)
+    return [
+        {
+            "role": "system",
+            "content": (
+                "You write the monthly digest of a user's long-term memory for their therapist. "
+                "Fold the month's memories into the current digest: keep recurring themes, feelings, "
+                "events, people in their life, goals and progress, and anything they asked to remember. "
+                f"Write in the third person, at most {max_words} words. Reply with the digest only."
+            ),
+        },
+        {
+            "role": "user",
+            "content": f"Month: {period}\n\nCurrent digest:\n{digest or '(none yet)'}\n\nMemories:\n{notes}",
+        },
+    ]
+
+
+def digest_tool(digest: Optional[str], period: str, entries: List[str], max_words: int = 250) -> str:
+    """
+    Condenses a month of long-term memories into one digest, folding them
+    into the month's existing digest if compaction already wrote one.
+    """
+    response = complete(SUMMARIZER, _digest_messages(digest, period, entries, max_words), temperature=0.0)
+    return response["choices"][0]["message"]["content"].strip()
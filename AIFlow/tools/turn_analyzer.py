@@ -0,0 +1,152 @@
+from AIFlow.tools.llm_client import CLASSIFIER, acomplete, complete, role_model
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from typing import Literal, Optional
+from concurrent.futures import ThreadPoolExecutor
+from AIFlow.tools.classifier_cache import acached_classification, cached_classification, prompt_version
+from AIFlow.tools.emotions_analyzer import emotion_tool, aemotion_tool
+from AIFlow.tools.crisis_detector import crisis_tool, acrisis_tool, serve_cached_crisis
+from AIFlow.tools.journal_tool import journal_intent_tool, ajournal_intent_tool
+import asyncio
+import json
+import re
+
+TURN_ANALYSIS_MODEL = role_model(CLASSIFIER)
+
+
+class TurnAnalysis(BaseModel):
+    emotion: str
+    crisis: bool
+    mode: Literal["chat", "journal"]
+    confidence: Optional[float] = Field(default=None, ge=0.0, le=1.0)
+
+    @field_validator("emotion", mode="before")
+    @classmethod
+    def _normalize_emotion(cls, value):
+        return str(value).strip().lower()
+
+    @field_validator("mode", mode="before")
+    @classmethod
+    def _normalize_mode(cls, value):
+        return str(value).strip().lower()
+
+    @field_validator("confidence", mode="before")
+    @classmethod
+    def _clamp_confidence(cls, value):
+        if value is None:
+            return None
+        return min(max(float(value), 0.0), 1.0)
+
+
+def _turn_analysis_messages(text: str) -> list:
+    return [
+        {
+            "role": "system",
+            "content": (
+                "You analyze a single message sent to an AI therapist and return JSON with:\n"
+                "- emotion: the emotion expressed, as one lowercase word (e.g. 'sad', 'anxious', 'angry').\n"
+                "- crisis: true if the message mentions suicide, self-harm, or extreme emotional distress, otherwise false.\n"
+                "- mode: 'journal' if the message is a journal entry, 'chat' if it is a request for therapy chat.\n"
+                "- confidence: your overall confidence in this analysis, between 0 and 1."
+            ),
+        },
+        {"role": "user", "content": f"Message: {text}"},
+    ]
+
+
+def parse_turn_analysis(content: Optional[str]) -> TurnAnalysis:
+    """
+    Parse a model reply into a TurnAnalysis, tolerating code fences and
+    surrounding prose. Raises ValueError if no valid object can be extracted.
+    """
+    if not content:
+        raise ValueError("Empty turn analysis response")
+    match = re.search(r"\{.*\}", content, re.DOTALL)
+    if not match:
+        raise ValueError(f"No JSON object in turn analysis response: {content[:200]!r}")
+    try:
+        return TurnAnalysis.model_validate(json.loads(match.group(0)))
+    except (json.JSONDecodeError, ValidationError) as e:
+        raise ValueError(f"Invalid turn analysis response: {e}") from e
+
+
+def _fallback_turn_analysis(text: str) -> TurnAnalysis:
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        emotion = pool.submit(emotion_tool, text)
+        crisis = pool.submit(crisis_tool, text)
+        mode = pool.submit(journal_intent_tool, text)
+        return TurnAnalysis(
+            emotion=emotion.result(),
+            crisis=crisis.result(),
+            mode="journal" if mode.result() == "journal" else "chat",
+        )
+
+
+async def _afallback_turn_analysis(text: str) -> TurnAnalysis:
+    emotion, crisis, mode = await asyncio.gather(
+        aemotion_tool(text), acrisis_tool(text), ajournal_intent_tool(text)
+    )
+    return TurnAnalysis(
+        emotion=emotion,
+        crisis=crisis,
+        mode="journal" if mode == "journal" else "chat",
+    )
+
+
+TURN_ANALYSIS_PROMPT_VERSION = prompt_version(TURN_ANALYSIS_MODEL, _turn_analysis_messages("{text}"))
+
+
+def _serve_cached_turn_analysis(text: str):
+    serve_crisis = serve_cached_crisis(text)
+    return lambda analysis: serve_crisis(analysis["crisis"])
+
+
+def _analyze_turn(text: str) -> dict:
+    response = complete(
+        CLASSIFIER,
+        _turn_analysis_messages(text),
+        temperature=0.0,
+        response_format=TurnAnalysis,
+    )
+    try:
+        analysis = parse_turn_analysis(response["choices"][0]["message"]["content"])
+    except ValueError as e:
+        print(f"Turn analysis fallback: {e}")
+        analysis = _fallback_turn_analysis(text)
+    return analysis.model_dump()
+
+
+async def _aanalyze_turn(text: str) -> dict:
+    response = await acomplete(
+        CLASSIFIER,
+        _turn_analysis_messages(text),
+        temperature=0.0,
+        response_format=TurnAnalysis,
+    )
+    try:
+        analysis = parse_turn_analysis(response["choices"][0]["message"]["content"])
+    except ValueError as e:
+        print(f"Turn analysis fallback: {e}")
+        analysis = await _afallback_turn_analysis(text)
+    return analysis.model_dump()
+
+
+def turn_analysis_tool(text: str) -> TurnAnalysis:
+    """
+    Classifies emotion, crisis and journal/chat mode with a single structured
+    LiteLLM call. Falls back to the individual classifier tools if the reply
+    doesn't match the schema.
+    """
+    return TurnAnalysis.model_validate(
+        cached_classification(
+            "turn_analysis", TURN_ANALYSIS_PROMPT_VERSION, text, _analyze_turn, _serve_cached_turn_analysis(text)
+        )
+    )
+
+
+async def aturn_analysis_tool(text: str) -> TurnAnalysis:
+    """Async variant of turn_analysis_tool."""
+    return TurnAnalysis.model_validate(
+        await acached_classification(
+            "turn_analysis", TURN_ANALYSIS_PROMPT_VERSION, text, _aanalyze_turn, _serve_cached_turn_analysis(text)
+        )
+    )
@@ -1,11 +1,73 @@
 # app/main.py
 import sys
 sys.path.append("..")
+import asyncio
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from backend.routes import auth
+from fastapi.responses import JSONResponse, PlainTextResponse
+from backend.routes import auth, history, journal
 from backend.websocket_routes import chat
-app = FastAPI()
+from AIFlow.memory.compaction import LONG_TERM_COMPACT_INTERVAL, run_compaction_loop
+from AIFlow.monitoring.metrics import METRICS_ENABLED, monitor_event_loop_lag, render_metrics
+from backend.services.graph_services import cache_stats, is_ready, shut_down, warm_up
+
+# Set WARM_UP_ON_STARTUP=0 to defer graph compilation and model loading to the first turn.
+WARM_UP_ON_STARTUP = os.getenv("WARM_UP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+# A failed warm-up (e.g. Supabase unreachable) is retried after this many
+# seconds, doubling up to WARM_UP_MAX_RETRY_DELAY.
+WARM_UP_RETRY_DELAY = float(os.getenv("WARM_UP_RETRY_DELAY", "5"))
+WARM_UP_MAX_RETRY_DELAY = float(os.getenv("WARM_UP_MAX_RETRY_DELAY", "300"))
+
+
+async def warm_up_until_done() -> None:
+    """Run warm_up off the event loop, retrying with backoff until it succeeds."""
+    delay = WARM_UP_RETRY_DELAY
+    while True:
+        try:
+            await asyncio.to_thread(warm_up)
+            return
+        except Exception as e:
+            print(f"Warm-up failed, retrying in {delay:g}s: {e!r}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, WARM_UP_MAX_RETRY_DELAY)
+
+
+def _log_failure(task: asyncio.Task) -> None:
+    """Done callback: a background task's exception is otherwise never seen."""
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Background task {task.get_name()} failed: {task.exception()!r}")
+
+
+def _background(coro, name: str) -> asyncio.Task:
+    task = asyncio.create_task(coro, name=name)
+    task.add_done_callback(_log_failure)
+    return task
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up in the background so the worker accepts connections (and answers
+    # /ready with 503) while the embedding model is still loading. Without it
+    # the worker becomes ready after its first completed turn.
+    warm_up_task = _background(warm_up_until_done(), "warm-up") if WARM_UP_ON_STARTUP else None
+    lag_task = _background(monitor_event_loop_lag(), "event-loop-lag") if METRICS_ENABLED else None
+    # Old long-term memory is folded into monthly digests in the background.
+    compaction_task = None
+    if LONG_TERM_COMPACT_INTERVAL > 0:
+        compaction_task = _background(run_compaction_loop(LONG_TERM_COMPACT_INTERVAL), "compaction")
+    yield
+    if lag_task:
+        lag_task.cancel()
+    if compaction_task:
+        compaction_task.cancel()
+    if warm_up_task and not warm_up_task.done():
+        warm_up_task.cancel()
+    await asyncio.to_thread(shut_down)
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow CORS (customize origin in production)
 app.add_middleware(
@@ -19,8 +81,27 @@ app.add_middleware(
 # Routers
 app.include_router(auth.router, prefix="/auth", tags=["Auth"])
 app.include_router(chat.router, prefix="/chat", tags=["Chat"])
-# app.include_router(journal.router, prefix="/journal", tags=["Journal"])
+app.include_router(journal.router, prefix="/journal", tags=["Journal"])
+app.include_router(history.router, prefix="/history", tags=["History"])
 
 @app.get("/")
 def root():
     return {"message": "AI Therapist API is live."}
+
+
+@app.get("/ready")
+def ready():
+    if not is_ready():
+        return JSONResponse(status_code=503, content={"ready": False})
+    return {"ready": True}
+
+
+@app.get("/stats")
+def stats():
+    return cache_stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
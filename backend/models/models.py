@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional
+from typing import List, Optional
 
 class SignInRequest(BaseModel):
     email: EmailStr
@@ -18,3 +18,19 @@ class User(BaseModel):
     access_token: Optional[str] = None
     refresh_token: Optional[str] = None
     expires_in: Optional[int] = None
+
+class MemoryLog(BaseModel):
+    id: str
+    thread_id: str
+    role: str
+    content: str
+    timestamp: str
+    emotion: Optional[str] = None
+    is_crisis: Optional[bool] = None
+    mode: Optional[str] = None
+    journal_entry: Optional[str] = None
+    attack: Optional[str] = None
+
+class HistoryPage(BaseModel):
+    messages: List[MemoryLog]
+    next_cursor: Optional[str] = None  # pass back as ?cursor= for the next page; None on the last one
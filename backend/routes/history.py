@@ -0,0 +1,78 @@
+import asyncio
+import base64
+import binascii
+import json
+from typing import Dict, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from AIFlow.memory.memory_manager import aexport_user_data, amemory_logs_page, flush_memory_logs
+from backend.models.models import HistoryPage, User
+from backend.services.auth_services import get_current_user
+
+router = APIRouter()
+
+
+def encode_cursor(row: Dict) -> str:
+    """Opaque cursor for the page after `row`."""
+    raw = json.dumps([row["timestamp"], row["id"]]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return str(timestamp), str(row_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+@router.get("", response_model=HistoryPage)
+async def history(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    thread_id: Optional[str] = None,
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    user: User = Depends(get_current_user),
+):
+    """
+    One page of the user's messages, newest first (order=asc for oldest
+    first), optionally for one thread. Follow next_cursor for the next page.
+    """
+    rows = await amemory_logs_page(
+        user.id,
+        limit + 1,
+        decode_cursor(cursor) if cursor else None,
+        newest_first=order == "desc",
+        thread_id=thread_id,
+    )
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return HistoryPage(messages=rows[:limit], next_cursor=next_cursor)
+
+
+@router.get("/export")
+async def export(user: User = Depends(get_current_user)):
+    """
+    Everything stored for the user as NDJSON: "memory_log", "thread_summary",
+    "document" and "archived_document" lines, oldest first, then a "done"
+    line with the counts (or "error" if the export broke off). Streamed page
+    by page, so memory use stays flat however large the account.
+    """
+    # This worker's buffered messages belong in the export too.
+    await asyncio.to_thread(flush_memory_logs)
+
+    async def stream():
+        counts: Dict[str, int] = {}
+        try:
+            async for kind, row in aexport_user_data(user.id):
+                counts[kind] = counts.get(kind, 0) + 1
+                yield json.dumps({"type": kind, **row}, default=str) + "\n"
+            yield json.dumps({"type": "done", "counts": counts}) + "\n"
+        except Exception as e:
+            print(f"History export failed for {user.id}: {e!r}")
+            yield json.dumps({"type": "error", "error": str(e), "counts": counts}) + "\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="history.ndjson"'},
+    )
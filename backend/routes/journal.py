@@ -0,0 +1,79 @@
+import asyncio
+import codecs
+import json
+import os
+import tempfile
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from AIFlow.memory.journal_import import READERS, ImportProgress, import_journal
+from backend.models.models import User
+from backend.services.auth_services import get_current_user
+
+router = APIRouter()
+
+# Largest upload /journal/import accepts; bigger imports go through the CLI.
+JOURNAL_IMPORT_MAX_BYTES = int(os.getenv("JOURNAL_IMPORT_MAX_BYTES", str(50 * 2**20)))
+
+
+@router.post("/import")
+async def import_entries(
+    request: Request,
+    format: Optional[str] = None,
+    start: int = 0,
+    user: User = Depends(get_current_user),
+):
+    """
+    Import journal entries (NDJSON, or CSV with format=csv or a text/csv body)
+    into the user's long-term memory. The response is NDJSON: a "progress"
+    line after every saved batch, then "done" or "error". Both carry
+    `records`; after an error, posting the same body with start=<records>
+    resumes the import.
+    """
+    fmt = format or ("csv" if request.headers.get("content-type", "").startswith("text/csv") else "ndjson")
+    if fmt not in READERS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unsupported format: {fmt}")
+
+    # The body is spooled to disk, so memory use doesn't grow with the upload.
+    upload = tempfile.TemporaryFile()
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > JOURNAL_IMPORT_MAX_BYTES:
+            upload.close()
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Import too large")
+        await asyncio.to_thread(upload.write, chunk)
+    upload.seek(0)
+
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+
+    def emit(event: Optional[dict]) -> None:
+        loop.call_soon_threadsafe(events.put_nowait, event)
+
+    def run() -> None:
+        last = ImportProgress(records=start)
+
+        def on_batch(progress: ImportProgress) -> None:
+            last.records = progress.records
+            emit({"type": "progress", **progress.as_dict()})
+
+        try:
+            lines = codecs.iterdecode(upload, "utf-8")
+            progress = import_journal(user.id, READERS[fmt](lines), start, on_batch=on_batch)
+            emit({"type": "done", **progress.as_dict()})
+        except Exception as e:
+            print(f"Journal import failed for {user.id}: {e!r}")
+            emit({"type": "error", "error": str(e), "records": last.records})
+        finally:
+            upload.close()
+            emit(None)
+
+    async def stream():
+        # The import runs to completion even if the client disconnects.
+        worker = asyncio.create_task(asyncio.to_thread(run))
+        while (event := await events.get()) is not None:
+            yield json.dumps(event) + "\n"
+        await worker
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
@@ -1,30 +1,160 @@
 import sys
 sys.path.append("..")  # Adjust the path as necessary to import AIFlow modules
-from AIFlow.graphs.therapy_flow import build_therapy_graph
-from AIFlow.memory.memory_manager import get_memory
+from AIFlow.graphs.therapy_flow import CLASSIFIER_MODE, get_therapy_graph
+from AIFlow.memory.memory_manager import checkpoint_thread_id, flush_memory_logs, short_term_cache, warm_up_memory
+from AIFlow.monitoring.metrics import latency_summary, register_collector, turn_trace
+from AIFlow.tools.classifier_cache import classifier_cache
+from AIFlow.tools.crisis_detector import warm_up_crisis_detector
+from AIFlow.tools.llm_client import llm_model_stats
+from AIFlow.tools.llm_limiter import llm_limiter_stats
+from AIFlow.tools.local_classifier import local_classifier_stats, warm_up_local_classifiers
 
-def run_therapy_flow(user_id: str, user_input: str, thread_id: str = "default"):
-    """Run the therapy flow for a user."""
-    # Initialize the therapy graph
-    therapy_graph = build_therapy_graph()
-    
-    history = get_memory({"user_id": user_id}, limit=6, from_db=True)
+_ready = False
+
+
+def warm_up():
+    """Compile the therapy graph and load heavy clients/models ahead of the first turn."""
+    global _ready
+    get_therapy_graph()
+    get_therapy_graph(use_async=True)
+    warm_up_memory()
+    warm_up_crisis_detector()
+    if CLASSIFIER_MODE == "local":
+        warm_up_local_classifiers()
+    _ready = True
+
+
+def shut_down():
+    """Flush buffered writes before the process exits."""
+    flush_memory_logs()
+
+
+def is_ready() -> bool:
+    """Whether warm_up, or a whole turn, has completed in this process."""
+    return _ready
+
+
+def _turn_completed() -> None:
+    # A turn loads everything warm_up would have, e.g. with
+    # WARM_UP_ON_STARTUP=0 or while a failed warm-up waits to retry.
+    global _ready
+    _ready = True
+
+
+def cache_stats() -> dict:
+    """
+    Hit rates of this worker's in-process caches and local classifiers, LLM
+    limiter occupancy, and p50/p99 latencies.
+    """
+    return {
+        "classifier_cache": classifier_cache.stats(),
+        "short_term_cache": short_term_cache.stats(),
+        "local_classifiers": local_classifier_stats(),
+        "llm_limiter": llm_limiter_stats(),
+        "llm_models": llm_model_stats(),
+        "latency": latency_summary(),
+    }
+
+
+def _cache_samples():
+    counts = {"short_term": short_term_cache.stats()}
+    for classifier, stats in classifier_cache.stats()["classifiers"].items():
+        counts[f"classifier:{classifier}"] = stats
+    for classifier, stats in local_classifier_stats().items():
+        counts[f"local_classifier:{classifier}"] = {"hits": stats["local"], "misses": stats["llm_fallback"]}
+    return [
+        ({"cache": cache, "result": result}, stats[key])
+        for cache, stats in counts.items()
+        for key, result in (("hits", "hit"), ("misses", "miss"), ("bypassed", "bypass"))
+        if key in stats
+    ]
 
-    # Create initial state
-    initial_state = {
+
+register_collector(
+    "therapy_cache_lookups_total",
+    "Cache lookups by result; local classifier hits are turns answered without the LLM.",
+    _cache_samples,
+    kind="counter",
+)
+
+
+def _turn_input(user_id: str, thread_id: str, user_input: str) -> dict:
+    # Messages (and the last emotion) carry over from the thread's checkpoint;
+    # everything decided per turn is reset.
+    return {
         "user_id": user_id,
+        "thread_id": thread_id,
         "input": user_input,
-        "messages": history,
         "response": None,
         "relevant_memories": None,
-        "emotion": None,
         "is_crisis": None,
+        "crisis_tier": None,
         "mode": None,
+        "classifier_confidence": None,
         "journal_entry": None,
         "attack": None,
+        "guardrail_matches": None,
     }
 
-    # Run the graph with the initial state
-    final_state =  therapy_graph.invoke(initial_state, config={"configurable": {"thread_id": "1"}})
 
+def _config(user_id: str, thread_id: str) -> dict:
+    return {"configurable": {"thread_id": checkpoint_thread_id(user_id, thread_id)}}
+
+
+def turn_outcome(state: dict) -> str:
+    """How a turn ended, as the mode label of therapy_turn_duration_seconds."""
+    if not state:
+        return "unknown"
+    if state.get("attack") not in (None, "safe"):
+        return state["attack"]
+    if state.get("is_crisis"):
+        return "crisis"
+    return state.get("mode") or "unknown"
+
+
+def run_therapy_flow(user_id: str, user_input: str, thread_id: str = "default"):
+    """Run the therapy flow for a user."""
+    # Reuse the process-wide compiled graph
+    therapy_graph = get_therapy_graph()
+    with turn_trace(user_id, thread_id) as turn:
+        final_state = therapy_graph.invoke(
+            _turn_input(user_id, thread_id, user_input), config=_config(user_id, thread_id)
+        )
+        turn["mode"] = turn_outcome(final_state)
+    _turn_completed()
+    return final_state
+
+
+async def arun_therapy_flow(user_id: str, user_input: str, thread_id: str = "default"):
+    """Run the therapy flow for a user without blocking the event loop."""
+    therapy_graph = get_therapy_graph(use_async=True)
+    with turn_trace(user_id, thread_id) as turn:
+        final_state = await therapy_graph.ainvoke(
+            _turn_input(user_id, thread_id, user_input), config=_config(user_id, thread_id)
+        )
+        turn["mode"] = turn_outcome(final_state)
+    _turn_completed()
     return final_state
+
+
+async def astream_therapy_flow(user_id: str, user_input: str, thread_id: str = "default"):
+    """
+    Run the therapy flow and yield ("token", chunk) events while the response
+    is generated, followed by a single ("final", state) event.
+    """
+    therapy_graph = get_therapy_graph(use_async=True)
+
+    final_state = None
+    with turn_trace(user_id, thread_id) as turn:
+        async for mode, chunk in therapy_graph.astream(
+            _turn_input(user_id, thread_id, user_input),
+            config=_config(user_id, thread_id),
+            stream_mode=["custom", "values"],
+        ):
+            if mode == "custom":
+                yield "token", chunk
+            else:
+                final_state = chunk
+        turn["mode"] = turn_outcome(final_state)
+    _turn_completed()
+    yield "final", final_state
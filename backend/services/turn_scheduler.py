@@ -0,0 +1,142 @@
+import asyncio
+import os
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Optional, Tuple
+import dotenv
+
+dotenv.load_dotenv()
+
+# Messages a session may have waiting behind its running turn; further ones
+# are rejected with a backpressure frame.
+TURN_QUEUE_SIZE = int(os.getenv("TURN_QUEUE_SIZE", "3"))
+# "queue":     turns run one after another, in arrival order.
+# "supersede": a new message cancels the running turn and any waiting ones;
+#              their text is prepended to the new message, so the reply
+#              answers everything the user wrote.
+TURN_POLICY = os.getenv("TURN_POLICY", "queue")
+# Seconds a client is asked to wait before resending a rejected message.
+TURN_RETRY_AFTER = float(os.getenv("TURN_RETRY_AFTER", "2"))
+
+TURN_POLICIES = ("queue", "supersede")
+
+Send = Callable[[dict], Awaitable[None]]
+# (turn_id, text) -> whether the session should stay open
+RunTurn = Callable[[Any, str], Awaitable[bool]]
+
+
+class TurnScheduler:
+    """
+    Runs one websocket session's turns one at a time from a bounded queue,
+    telling the client with frames when a message is queued, rejected or
+    cancelled. Must be created inside the session's event loop.
+    """
+
+    def __init__(
+        self,
+        run_turn: RunTurn,
+        send: Send,
+        max_queue: int = TURN_QUEUE_SIZE,
+        policy: str = TURN_POLICY,
+    ):
+        if policy not in TURN_POLICIES:
+            raise ValueError(f"Unknown turn policy: {policy}")
+        self.max_queue = max_queue
+        self.policy = policy
+        self._run_turn = run_turn
+        self._send = send
+        self._pending: Deque[Tuple[Any, str]] = deque()
+        self._wakeup = asyncio.Event()
+        self._current: Optional[asyncio.Task] = None
+        self._current_turn: Optional[Tuple[Any, str]] = None
+        self._worker = asyncio.create_task(self._work())
+
+    @property
+    def busy(self) -> bool:
+        return self._current is not None and not self._current.done()
+
+    async def submit(self, turn_id: Any, text: str) -> bool:
+        """Queue a message; False if it was rejected because the queue is full."""
+        if self.policy == "supersede":
+            text = await self._supersede(text)
+        elif len(self._pending) >= self.max_queue:
+            await self._send({
+                "type": "backpressure",
+                "reason": "queue_full",
+                "turn_id": turn_id,
+                "queued": len(self._pending),
+                "retry_after": TURN_RETRY_AFTER,
+            })
+            return False
+        self._pending.append((turn_id, text))
+        if self.busy or len(self._pending) > 1:
+            await self._send({"type": "queued", "turn_id": turn_id, "position": len(self._pending)})
+        self._wakeup.set()
+        return True
+
+    async def _supersede(self, text: str) -> str:
+        # Waiting turns are taken off the queue before the running one is
+        # cancelled, so the worker can't start one of them in between.
+        superseded = list(self._pending)
+        self._pending.clear()
+        running = self._current_turn
+        if await self._cancel_current():
+            superseded.insert(0, running)
+        for turn_id, _ in superseded:
+            await self._send({"type": "cancelled", "turn_id": turn_id, "reason": "superseded"})
+        # Bound what a burst can carry over.
+        carried = [previous for _, previous in superseded][-self.max_queue:]
+        return "\n".join([*carried, text])
+
+    async def cancel(self, turn_id: Any = None) -> bool:
+        """
+        Cancel the given turn, waiting or running, or the running turn when
+        turn_id is None. False if there was nothing to cancel.
+        """
+        if turn_id is not None:
+            for item in self._pending:
+                if item[0] == turn_id:
+                    self._pending.remove(item)
+                    await self._send({"type": "cancelled", "turn_id": turn_id, "reason": "client"})
+                    return True
+        current = self._current_turn
+        if current is None or turn_id not in (None, current[0]) or not await self._cancel_current():
+            return False
+        await self._send({"type": "cancelled", "turn_id": current[0], "reason": "client"})
+        return True
+
+    async def _cancel_current(self) -> bool:
+        task = self._current
+        if task is None or task.done():
+            return False
+        task.cancel()
+        await asyncio.wait({task})
+        return task.cancelled()
+
+    async def _work(self) -> None:
+        while True:
+            while not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            self._current_turn = self._pending.popleft()
+            task = self._current = asyncio.create_task(self._run_turn(*self._current_turn))
+            try:
+                await asyncio.wait({task})
+            except asyncio.CancelledError:
+                task.cancel()
+                await asyncio.wait({task})
+                raise
+            finally:
+                self._current_turn = None
+            if task.cancelled():
+                continue
+            if task.exception() is not None:
+                print(f"Turn failed: {task.exception()!r}")
+                return
+            if not task.result():
+                return
+
+    async def close(self) -> None:
+        """Cancel the running turn and drop waiting ones (the client has gone)."""
+        self._pending.clear()
+        self._worker.cancel()
+        await asyncio.gather(self._worker, return_exceptions=True)
@@ -1,18 +1,27 @@
 # app/api/websocket/chat.py
+import asyncio
+import itertools
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from starlette.websockets import WebSocketState
+from AIFlow.tools.llm_client import LLMUnavailable
+from AIFlow.tools.llm_limiter import LLMOverloaded
 from backend.services.auth_services import SupabaseAuthService
-from backend.services.graph_services import run_therapy_flow
+from backend.services.graph_services import arun_therapy_flow, astream_therapy_flow
+from backend.services.turn_scheduler import TURN_RETRY_AFTER, TurnScheduler
 
 router = APIRouter()
 
 @router.websocket("/ws/chat")
 async def chat_ws(websocket: WebSocket):
     await websocket.accept()
+    scheduler = None
     try:
         # Step 1: Authenticate and validate initial data BEFORE accepting the connection
         init_data = await websocket.receive_json()
         access_token = init_data.get("access_token")
         thread_id = init_data.get("thread_id", "default")
+        # Clients opt into incremental token frames
+        stream = bool(init_data.get("stream", False))
 
         # Validate required fields
         if not access_token:
@@ -30,15 +39,30 @@ async def chat_ws(websocket: WebSocket):
 
 
         print(f"WebSocket connection established for user {user_id} with thread {thread_id}")
-  
-        # Step 2: Process incoming messages
+        send = locked_sender(websocket)
+
+        async def run_turn(turn_id, input_text: str) -> bool:
+            if stream:
+                sent = await stream_therapy_response(send, user_id, input_text, thread_id, turn_id)
+            else:
+                sent = await send_therapy_response(send, user_id, input_text, thread_id, turn_id)
+            if not sent and websocket.application_state != WebSocketState.DISCONNECTED:
+                await websocket.close(code=1011, reason="Internal server error")
+            return sent
+
+        # Step 2: Keep reading while a turn runs; the scheduler queues, rejects
+        # or supersedes messages and runs them one at a time.
+        scheduler = TurnScheduler(run_turn, send)
+        turn_ids = itertools.count(1)
         async for message in websocket.iter_json():
+            if message.get("type") == "cancel":
+                await scheduler.cancel(message.get("turn_id"))
+                continue
             input_text = message.get("input")
             if input_text:
-                if not await send_therapy_response(websocket, user_id, input_text, thread_id):
-                    break
+                await scheduler.submit(message.get("id") or next(turn_ids), input_text)
             else:
-                await websocket.send_json({"error": "Invalid message format"})
+                await send({"error": "Invalid message format"})
 
     except WebSocketDisconnect:
         print("WebSocket disconnected")
@@ -47,27 +71,89 @@ async def chat_ws(websocket: WebSocket):
         traceback.print_exc()
         await websocket.send_json({"error": str(e)})
         await websocket.close()
+    finally:
+        if scheduler:
+            await scheduler.close()
+
+
+def locked_sender(websocket: WebSocket):
+    """send_json for frames coming from both the reader and the running turn, one at a time."""
+    lock = asyncio.Lock()
+
+    async def send(frame: dict) -> None:
+        async with lock:
+            await websocket.send_json(frame)
+
+    return send
 
-async def send_therapy_response(websocket: WebSocket, user_id: str, input_text: str, thread_id: str) -> bool:
+
+def overloaded_frame(turn_id, reason: str = "overloaded") -> dict:
+    return {"type": "backpressure", "reason": reason, "turn_id": turn_id, "retry_after": TURN_RETRY_AFTER}
+
+
+async def send_therapy_response(send, user_id: str, input_text: str, thread_id: str, turn_id=None) -> bool:
     try:
-        result = run_therapy_flow(user_id=user_id, user_input=input_text, thread_id=thread_id)
+        result = await arun_therapy_flow(user_id=user_id, user_input=input_text, thread_id=thread_id)
         if not result:
-            await websocket.send_json({"error": "Failed to run therapy flow"})
-            await websocket.close(code=5000, reason="Internal server error")
+            await send({"error": "Failed to run therapy flow", "turn_id": turn_id})
             return False
-        
-        response = {
-            "response": result.get("response"),
-            # "relevant_memories": result.get("relevant_memories"),
-            "emotion": result.get("emotion"),
-            "is_crisis": result.get("is_crisis"),
-            "mode": result.get("mode"),
-            "journal_entry": result.get("journal_entry"),
-            "attack": result.get("attack"),
-        }
-        
-        await websocket.send_json(response)
+
+        await send({"turn_id": turn_id, **response_payload(result)})
+        return True
+    except LLMOverloaded:
+        # The turn is dropped, not the session; the client may resend later.
+        await send(overloaded_frame(turn_id))
+        return True
+    except LLMUnavailable:
+        # Every model timed out or failed; likewise worth a later retry.
+        await send(overloaded_frame(turn_id, "unavailable"))
         return True
     except Exception as e:
-        await websocket.send_json({"error": str(e)})
+        await send({"error": str(e), "turn_id": turn_id})
+        return False
+
+
+def response_payload(result: dict) -> dict:
+    return {
+        "response": result.get("response"),
+        # "relevant_memories": result.get("relevant_memories"),
+        "emotion": result.get("emotion"),
+        "is_crisis": result.get("is_crisis"),
+        "crisis_tier": result.get("crisis_tier"),
+        "mode": result.get("mode"),
+        "journal_entry": result.get("journal_entry"),
+        "attack": result.get("attack"),
+        # Why the input was flagged; spans are left out so PII isn't echoed back
+        "attack_reasons": [
+            {"category": m["category"], "label": m["label"]}
+            for m in result.get("guardrail_matches") or []
+        ],
+    }
+
+
+async def stream_therapy_response(send, user_id: str, input_text: str, thread_id: str, turn_id=None) -> bool:
+    """
+    Send {"type": "token"} frames as the response is generated, then a
+    {"type": "final"} frame carrying the validated response and metadata.
+    Clients should replace the streamed text with the final response, which
+    differs when output validation blocked the message.
+    """
+    try:
+        async for event, data in astream_therapy_flow(user_id=user_id, user_input=input_text, thread_id=thread_id):
+            if event == "token":
+                await send({"type": "token", "turn_id": turn_id, "node": data["node"], "delta": data["delta"]})
+            elif not data:
+                await send({"error": "Failed to run therapy flow", "turn_id": turn_id})
+                return False
+            else:
+                await send({"type": "final", "turn_id": turn_id, **response_payload(data)})
+        return True
+    except LLMOverloaded:
+        await send(overloaded_frame(turn_id))
+        return True
+    except LLMUnavailable:
+        await send(overloaded_frame(turn_id, "unavailable"))
+        return True
+    except Exception as e:
+        await send({"error": str(e), "turn_id": turn_id})
         return False
@@ -0,0 +1,102 @@
+"""
+Offline evaluation of the crisis-detection cascade.
+
+Runs every labelled message in a JSONL file ({"text": ..., "crisis": bool})
+through detect_crisis and reports recall, precision and how many turns each
+tier resolved, i.e. the share that needed no LLM call. Needs the embedding
+model; the LLM tier needs the usual API key unless --llm is "assume-crisis"
+(the middle band is escalated, as a fail-safe would) or "oracle" (the LLM is
+assumed right, isolating the errors of the local tiers).
+
+    python -m benchmarks.crisis_eval [--data benchmarks/data/crisis_eval.jsonl]
+        [--low 0.35] [--high 0.8] [--llm call|assume-crisis|oracle] [--sweep]
+"""
+import argparse
+import json
+import os
+from collections import Counter
+
+import AIFlow.tools.crisis_detector as crisis_detector
+from AIFlow.memory.memory_manager import get_embeddings
+
+DEFAULT_DATA = os.path.join(os.path.dirname(__file__), "data", "crisis_eval.jsonl")
+
+
+def load(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def metrics(rows: list) -> dict:
+    """rows: (expected, predicted, tier) tuples."""
+    tp = sum(1 for expected, predicted, _ in rows if expected and predicted)
+    fp = sum(1 for expected, predicted, _ in rows if not expected and predicted)
+    fn = sum(1 for expected, predicted, _ in rows if expected and not predicted)
+    tiers = Counter(tier for _, _, tier in rows)
+    return {
+        "recall": tp / (tp + fn) if tp + fn else 1.0,
+        "precision": tp / (tp + fp) if tp + fp else 1.0,
+        "false_negatives": fn,
+        "false_positives": fp,
+        "tiers": dict(tiers),
+        "without_llm": 1 - tiers["llm"] / len(rows) if rows else 0.0,
+    }
+
+
+def simulate(examples: list, scores: list, low: float, high: float, llm: str) -> list:
+    """Replay the cascade with precomputed exemplar scores (no LLM unless llm == 'call')."""
+    rows = []
+    for example, score in zip(examples, scores):
+        expected = bool(example["crisis"])
+        if crisis_detector.contains_crisis_language(example["text"]):
+            rows.append((expected, True, "lexical"))
+        elif score >= high:
+            rows.append((expected, True, "embedding"))
+        elif score < low:
+            rows.append((expected, False, "embedding"))
+        elif llm == "oracle":
+            rows.append((expected, expected, "llm"))
+        elif llm == "assume-crisis":
+            rows.append((expected, True, "llm"))
+        else:
+            rows.append((expected, crisis_detector.crisis_tool(example["text"]), "llm"))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default=DEFAULT_DATA)
+    parser.add_argument("--low", type=float, default=crisis_detector.CRISIS_LOW_THRESHOLD)
+    parser.add_argument("--high", type=float, default=crisis_detector.CRISIS_HIGH_THRESHOLD)
+    parser.add_argument("--llm", choices=["call", "assume-crisis", "oracle"], default="call")
+    parser.add_argument("--sweep", action="store_true", help="also tabulate other thresholds (LLM as oracle)")
+    args = parser.parse_args()
+
+    examples = load(args.data)
+    embeddings = get_embeddings()
+    scores = [crisis_detector.crisis_exemplars.score(e["text"], embeddings) for e in examples]
+
+    result = metrics(simulate(examples, scores, args.low, args.high, args.llm))
+    print(f"{len(examples)} messages, thresholds low={args.low} high={args.high}, llm={args.llm}")
+    print(f"recall     {result['recall']:.3f}  ({result['false_negatives']} missed)")
+    print(f"precision  {result['precision']:.3f}  ({result['false_positives']} false alarms)")
+    print(f"tiers      {result['tiers']}")
+    print(f"no LLM     {result['without_llm']:.1%} of turns")
+
+    misses = [
+        (e["text"], s) for e, s, row in zip(examples, scores, simulate(examples, scores, args.low, args.high, "oracle"))
+        if row[0] and not row[1]
+    ]
+    for text, score in misses:
+        print(f"  missed by local tiers ({score:.2f}): {text}")
+
+    if args.sweep:
+        print(f"\n{'low':>6}{'high':>6}{'recall':>8}{'prec':>8}{'no LLM':>8}")
+        for low in (0.2, 0.25, 0.3, 0.35, 0.4, 0.45):
+            for high in (0.6, 0.7, 0.8, 0.9):
+                r = metrics(simulate(examples, scores, low, high, "oracle"))
+                print(f"{low:>6}{high:>6}{r['recall']:>8.3f}{r['precision']:>8.3f}{r['without_llm']:>8.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Microbenchmark for the input guardrails.
+
+Compares the original per-rule checks (a substring test per keyword, one
+re.search per injection and PII pattern) with the compiled single-pass
+GuardrailEngine on ~10 KB messages, including the inputs that made the old
+credit-card and email patterns backtrack.
+
+    python -m benchmarks.guardrails_bench [--size 10000] [--repeat 50]
+"""
+import argparse
+import random
+import re
+import string
+import time
+
+from AIFlow.guardrails.input_moderation import scan_input
+
+# === The checks as they were before the engine ===
+LEGACY_UNSAFE = [
+    "kill myself", "suicide", "abuse", "rape", "murder",
+    "hate speech", "bomb", "school shooting", "cut myself",
+    "terrorism", "kill", "hurt", "self-harm", "violence",
+]
+LEGACY_INJECTION = [
+    r"ignore (the )?previous", r"disregard (the )?above",
+    r"act as", r"simulate", r"pretend to", r"bypass",
+    r"jailbreak", r"you are now",
+]
+LEGACY_PII = [
+    r"\b\d{3}-\d{2}-\d{4}\b",
+    r"\b\d{10}\b",
+    r"\b\d{5}(-\d{4})?\b",
+    r"\b[\w.-]+@[\w.-]+\.\w{2,4}\b",
+    r"\b(?:\d[ -]*?){13,16}\b",
+]
+
+
+def legacy_scan(text: str) -> bool:
+    lowered = text.lower()
+    unsafe = any(word in lowered for word in LEGACY_UNSAFE)
+    injected = any(re.search(p, lowered) for p in LEGACY_INJECTION)
+    pii = any(re.search(p, text) for p in LEGACY_PII)
+    return unsafe or injected or pii
+
+
+# === Inputs ===
+def make_inputs(size: int) -> dict:
+    rng = random.Random(0)
+    words = ["i", "feel", "today", "really", "tired", "work", "sleep", "friend", "talk", "about", "the", "and"]
+    prose = " ".join(rng.choice(words) for _ in range(size // 5))[:size]
+    return {
+        "prose": prose,
+        "prose_with_hit": prose[: size // 2] + " pretend to be my doctor " + prose[size // 2:],
+        "digit_groups": " ".join("".join(rng.choice(string.digits) for _ in range(4)) for _ in range(size // 5))[:size],
+        "dashed_digits": "-".join(rng.choice(string.digits) for _ in range(size // 2))[:size],
+        "long_word": "a" * size,
+        "dotted_words": ".".join("word" for _ in range(size // 5))[:size],
+    }
+
+
+def time_per_call(fn, text: str, repeat: int) -> float:
+    fn(text)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(text)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=10_000, help="message size in characters")
+    parser.add_argument("--repeat", type=int, default=50, help="calls per measurement")
+    args = parser.parse_args()
+
+    print(f"{'input':<16}{'legacy µs':>12}{'engine µs':>12}{'speedup':>10}")
+    for name, text in make_inputs(args.size).items():
+        legacy = time_per_call(legacy_scan, text, args.repeat)
+        engine = time_per_call(scan_input, text, args.repeat)
+        print(f"{name:<16}{legacy:>12.1f}{engine:>12.1f}{legacy / engine:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,514 @@
+"""
+In-process stand-ins for the therapy flow's external services, so the graph
+can be benchmarked offline and deterministically.
+
+- FakeLLM replaces litellm completion/acompletion (including streaming) with
+  canned replies chosen by prompt, after a configurable, seeded latency.
+- InMemorySupabase / AsyncInMemorySupabase implement the subset of the
+  postgrest query builder the app uses, with an optional per-query latency.
+- InMemoryVectorStore keeps documents in memory and filters by metadata.
+- HashEmbeddings is a fast deterministic bag-of-words embedder (no model).
+
+install() wires them into AIFlow.memory.memory_manager and every AIFlow
+module that imported completion/acompletion. Import the graph modules
+first; call it before the first turn.
+"""
+import asyncio
+import datetime
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+import litellm
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import InMemoryVectorStore as _InMemoryVectorStore
+from AIFlow.memory.local_vector_store import utc_datetime
+
+CRISIS_MARKERS = ("end my life", "ending my life", "kill myself", "suicide", "hurt myself", "no reason to live")
+JOURNAL_MARKERS = ("journal", "dear diary")
+REPLY = (
+    "Thank you for sharing that with me. It sounds like a lot has been weighing on you, "
+    "and it makes sense that you feel this way. What do you think would help most right now?"
+)
+
+
+# === LLM ===
+
+class FakeLLM:
+    """
+    Deterministic stand-in for litellm completion/acompletion.
+
+    Each call sleeps `latency_ms` (+/- `jitter` as a fraction, from a seeded
+    RNG); streamed replies deliver the first chunk after `ttft_fraction` of
+    that and spread the rest over the remaining time. A `stall_rate` share of
+    calls take `stall_ms` instead (a slow tail), and an `error_rate` share
+    fail with ServiceUnavailableError. `models` overrides any of these per
+    model, e.g. {"gemini/gemini-2.0-flash-lite": {"error_rate": 1.0}}. A
+    call slower than its `timeout` argument raises litellm.Timeout once the
+    timeout has passed, as the real provider would. Calls are counted per
+    purpose in `calls` and per model in `model_calls`.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, jitter: float = 0.0, ttft_fraction: float = 0.3,
+                 chunk_chars: int = 16, seed: int = 0, stall_rate: float = 0.0, stall_ms: float = 10000.0,
+                 error_rate: float = 0.0, models: Optional[Dict[str, Dict[str, float]]] = None):
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter
+        self.ttft_fraction = ttft_fraction
+        self.chunk_chars = chunk_chars
+        self.stall_rate = stall_rate
+        self.stall = stall_ms / 1000.0
+        self.error_rate = error_rate
+        self.models = models or {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls: Dict[str, int] = {}
+        self.model_calls: Dict[str, int] = {}
+
+    def _delay(self, model: Optional[str] = None, timeout: Optional[float] = None) -> Tuple[float, Optional[Exception]]:
+        """Seconds the call takes, and the error it ends with (if any)."""
+        overrides = self.models.get(model, {})
+        latency = overrides.get("latency_ms", self.latency * 1000) / 1000.0
+        jitter = overrides.get("jitter", self.jitter)
+        with self._lock:
+            self.model_calls[model] = self.model_calls.get(model, 0) + 1
+            delay = max(0.0, latency * (1 + self._rng.uniform(-jitter, jitter)))
+            if self._rng.random() < overrides.get("stall_rate", self.stall_rate):
+                delay = overrides.get("stall_ms", self.stall * 1000) / 1000.0
+            failed = self._rng.random() < overrides.get("error_rate", self.error_rate)
+        if timeout is not None and delay > float(timeout):
+            return float(timeout), litellm.Timeout(f"Fake call took longer than {timeout}s", model, "fake")
+        if failed:
+            return delay, litellm.ServiceUnavailableError("Fake provider outage", "fake", model)
+        return delay, None
+
+    def reply(self, messages: List[Dict], response_format=None) -> Tuple[str, str]:
+        """(purpose, content) for a prompt."""
+        system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+        text = messages[-1]["content"].lower()
+        # Classifier prompts quote the message; only the quote is judged, not
+        # the instructions around it (which mention suicide themselves).
+        quoted = re.search(r"^'(.*)'$", text, re.S | re.M)
+        if quoted:
+            text = quoted.group(1)
+        crisis = any(marker in text for marker in CRISIS_MARKERS)
+        journal = any(marker in text for marker in JOURNAL_MARKERS)
+        name = getattr(response_format, "__name__", "")
+        if name == "EmotionAnalyzer":
+            return "emotion", json.dumps({"emotion": "sad" if crisis else "anxious"})
+        if name == "CrisisAnalyzer":
+            return "crisis", json.dumps({"crisis": crisis})
+        if name == "TurnAnalysis":
+            return "turn_analysis", json.dumps(
+                {"emotion": "anxious", "crisis": crisis, "mode": "journal" if journal else "chat", "confidence": 0.9}
+            )
+        if "journal entry or a request" in system:
+            return "journal_intent", "journal" if journal else "chat"
+        if "monthly digest" in system:
+            return "digest", "That month the user often wrote about stress at work and trouble sleeping."
+        if "running summary" in system:
+            return "summary", "The user has been talking about stress at work and trouble sleeping."
+        if "journal entry" in system:
+            return "journal", REPLY
+        return "chat", REPLY
+
+    def _count(self, purpose: str) -> None:
+        with self._lock:
+            self.calls[purpose] = self.calls.get(purpose, 0) + 1
+
+    @staticmethod
+    def _response(content: str) -> Dict:
+        return {"choices": [{"message": {"role": "assistant", "content": content}}]}
+
+    def completion(self, model: str = None, messages: List[Dict] = None, stream: bool = False,
+                   response_format=None, **kwargs):
+        purpose, content = self.reply(messages, response_format)
+        self._count(purpose)
+        delay, error = self._delay(model, kwargs.get("timeout"))
+        time.sleep(delay)
+        if error:
+            raise error
+        if stream:
+            return iter(self._chunks(content))
+        return self._response(content)
+
+    async def acompletion(self, model: str = None, messages: List[Dict] = None, stream: bool = False,
+                          response_format=None, **kwargs):
+        purpose, content = self.reply(messages, response_format)
+        self._count(purpose)
+        delay, error = self._delay(model, kwargs.get("timeout"))
+        if error:
+            await asyncio.sleep(delay)
+            raise error
+        if not stream:
+            await asyncio.sleep(delay)
+            return self._response(content)
+        await asyncio.sleep(delay * self.ttft_fraction)
+        chunks = self._chunks(content)
+        gap = delay * (1 - self.ttft_fraction) / max(len(chunks) - 1, 1)
+
+        async def generate():
+            for i, chunk in enumerate(chunks):
+                if i:
+                    await asyncio.sleep(gap)
+                yield chunk
+
+        return generate()
+
+    def _chunks(self, content: str) -> List[SimpleNamespace]:
+        return [
+            SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content[i:i + self.chunk_chars]))])
+            for i in range(0, len(content), self.chunk_chars)
+        ]
+
+
+# === Supabase ===
+
+class _Result(SimpleNamespace):
+    pass
+
+
+class _Query:
+    """Chainable subset of the postgrest builder: select/insert/upsert/update/delete with filters."""
+
+    _OPS = {
+        "eq": lambda a, b: a == b,
+        "neq": lambda a, b: a != b,
+        "gt": lambda a, b: a is not None and a > b,
+        "gte": lambda a, b: a is not None and a >= b,
+        "lt": lambda a, b: a is not None and a < b,
+        "lte": lambda a, b: a is not None and a <= b,
+        "in_": lambda a, b: a in b,
+        "is_": lambda a, b: a is None if b in (None, "null") else a == b,
+    }
+
+    def __init__(self, db: "InMemorySupabase", table: str):
+        self.db = db
+        self.table = table
+        self.action = "select"
+        self.columns: Optional[List[str]] = None
+        self.payload = None
+        self.on_conflict: Optional[List[str]] = None
+        self.ignore_duplicates = False
+        self.filters: List[Tuple[str, str, Any]] = []
+        self.orders: List[Tuple[str, bool]] = []
+        self.max_rows: Optional[int] = None
+        self.offset = 0
+
+    def __getattr__(self, name):
+        if name in self._OPS:
+            def add_filter(column, value):
+                self.filters.append((name, column, value))
+                return self
+            return add_filter
+        raise AttributeError(name)
+
+    def select(self, columns: str = "*", **kwargs):
+        self.columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        return self
+
+    def insert(self, rows, **kwargs):
+        self.action, self.payload = "insert", rows
+        return self
+
+    def upsert(self, rows, on_conflict: str = "id", ignore_duplicates: bool = False, **kwargs):
+        self.action, self.payload = "upsert", rows
+        self.on_conflict = [c.strip() for c in on_conflict.split(",")]
+        self.ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, values: Dict, **kwargs):
+        self.action, self.payload = "update", values
+        return self
+
+    def delete(self, **kwargs):
+        self.action = "delete"
+        return self
+
+    def order(self, column: str, desc: bool = False, **kwargs):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, count: int, **kwargs):
+        self.max_rows = count
+        return self
+
+    def range(self, start: int, end: int, **kwargs):
+        self.offset, self.max_rows = start, end - start + 1
+        return self
+
+    def _matches(self, row: Dict) -> bool:
+        return all(self._OPS[op](row.get(column), value) for op, column, value in self.filters)
+
+    def _run(self) -> List[Dict]:
+        with self.db.lock:
+            table = self.db.tables.setdefault(self.table, [])
+            if self.action in ("insert", "upsert"):
+                rows = self.payload if isinstance(self.payload, list) else [self.payload]
+                keys = tuple(self.on_conflict or ["id"])
+                index = self.db.index(self.table, keys)
+                written = []
+                for row in rows:
+                    row = dict(row)
+                    key = tuple(row.get(k) for k in keys)
+                    existing = index.get(key) if self.action == "upsert" else None
+                    if existing is None:
+                        table.append(row)
+                        self.db.indexed(self.table, row)
+                        written.append(row)
+                    elif not self.ignore_duplicates:
+                        existing.update(row)
+                        written.append(existing)
+                return [dict(r) for r in written]
+            if self.action == "update":
+                rows = [r for r in table if self._matches(r)]
+                for row in rows:
+                    row.update(self.payload)
+                return [dict(r) for r in rows]
+            if self.action == "delete":
+                rows = [r for r in table if self._matches(r)]
+                self.db.tables[self.table] = [r for r in table if not self._matches(r)]
+                self.db.drop_indexes(self.table)
+                return rows
+            rows = [r for r in table if self._matches(r)]
+        for column, desc in reversed(self.orders):
+            rows.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+        end = None if self.max_rows is None else self.offset + self.max_rows
+        rows = rows[self.offset:end]
+        if self.columns:
+            rows = [{c: r.get(c) for c in self.columns} for r in rows]
+        return [dict(r) for r in rows]
+
+    def execute(self) -> _Result:
+        self.db.wait()
+        return _Result(data=self._run(), count=None)
+
+
+class _AsyncQuery(_Query):
+    async def execute(self) -> _Result:
+        await self.db.await_()
+        return _Result(data=self._run(), count=None)
+
+
+class InMemorySupabase:
+    """Tables as lists of dicts; every query waits `latency_ms` like a network round trip."""
+
+    query_class = _Query
+
+    def __init__(self, latency_ms: float = 0.0, tables: Optional[Dict[str, List[Dict]]] = None):
+        self.latency = latency_ms / 1000.0
+        self.tables: Dict[str, List[Dict]] = tables if tables is not None else {}
+        self.lock = threading.RLock()
+        self.queries = 0
+        self._indexes: Dict[Tuple[str, Tuple[str, ...]], Dict[Tuple, Dict]] = {}
+
+    def index(self, table: str, keys: Tuple[str, ...]) -> Dict[Tuple, Dict]:
+        """Rows of a table by the values of `keys` (the upsert conflict target), built on first use."""
+        index = self._indexes.get((table, keys))
+        if index is None:
+            index = {tuple(row.get(k) for k in keys): row for row in self.tables.get(table, [])}
+            self._indexes[(table, keys)] = index
+        return index
+
+    def indexed(self, table: str, row: Dict) -> None:
+        for (name, keys), index in self._indexes.items():
+            if name == table:
+                index[tuple(row.get(k) for k in keys)] = row
+
+    def drop_indexes(self, table: str) -> None:
+        for key in [key for key in self._indexes if key[0] == table]:
+            del self._indexes[key]
+
+    def table(self, name: str) -> _Query:
+        self.queries += 1
+        return self.query_class(self, name)
+
+    def wait(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+    async def await_(self) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+
+class AsyncInMemorySupabase(InMemorySupabase):
+    """Async client view; pass the sync client's `tables` to share data."""
+
+    query_class = _AsyncQuery
+
+
+# === Vector store and embeddings ===
+
+class HashEmbeddings(Embeddings):
+    """Deterministic hashed bag-of-words vectors; similar texts share words, so they score closer."""
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.dim] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class InMemoryVectorStore(_InMemoryVectorStore):
+    """
+    LangChain's in-memory store with the PgVectorStore calls the app makes
+    (dict filters, time windows, add_vectors, compaction).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.archive: List[Dict] = []
+        self.lease_holder: Optional[str] = None
+
+    @staticmethod
+    def _filter(filter, created_after=None, created_before=None):
+        if not isinstance(filter, dict):
+            return filter
+        window = [bound and utc_datetime(bound) for bound in (created_after, created_before)]
+
+        def keep(doc) -> bool:
+            if any(doc.metadata.get(k) != v for k, v in filter.items()):
+                return False
+            if window == [None, None]:
+                return True
+            created = utc_datetime(doc.metadata.get("timestamp") or "1970-01-01")
+            return (window[0] is None or created >= window[0]) and (window[1] is None or created < window[1])
+        return keep
+
+    def update_document_metadata(self, doc_id: str, metadata: Dict) -> None:
+        if doc_id in self.store:
+            self.store[doc_id]["metadata"] = metadata
+
+    def _documents(self, user_id: Optional[str] = None) -> List[Tuple[Dict, datetime.datetime]]:
+        return [
+            (doc, utc_datetime(doc["metadata"]["timestamp"]))
+            for doc in list(self.store.values())
+            if doc["metadata"].get("timestamp") and user_id in (None, doc["metadata"].get("user_id"))
+        ]
+
+    def compactable_periods(self, older_than, limit: int = 100) -> List[Tuple[str, str]]:
+        older_than = utc_datetime(older_than)
+        periods = {
+            (doc["metadata"].get("user_id"), created.strftime("%Y-%m"))
+            for doc, created in self._documents()
+            if doc["metadata"].get("type") != "digest"
+            and utc_datetime(doc["metadata"].get("last_seen") or created) < older_than
+        }
+        return sorted(periods, key=lambda period: (period[1], period[0]))[:limit]
+
+    def period_documents(self, user_id: str, start, end, limit: int = 1000) -> List[Document]:
+        found = sorted(
+            ((doc, created) for doc, created in self._documents(user_id)
+             if utc_datetime(start) <= created < utc_datetime(end)),
+            key=lambda item: item[1],
+        )
+        return [Document(id=doc["id"], page_content=doc["text"], metadata=doc["metadata"]) for doc, _ in found[:limit]]
+
+    def acquire_compaction_lease(self, holder: str, seconds: float) -> bool:
+        if self.lease_holder in (None, holder):
+            self.lease_holder = holder
+            return True
+        return False
+
+    def release_compaction_lease(self, holder: str) -> None:
+        if self.lease_holder == holder:
+            self.lease_holder = None
+
+    def archive_documents(self, user_id: str, ids: List[str]) -> int:
+        archived = [self.store.pop(doc_id) for doc_id in ids if doc_id in self.store]
+        self.archive.extend(archived)
+        return len(archived)
+
+    def similarity_search_by_vector_with_embeddings(self, embedding: List[float], k: int = 4, filter=None,
+                                                    created_after=None, created_before=None):
+        return self._similarity_search_with_score_by_vector(
+            embedding, k=k, filter=self._filter(filter, created_after, created_before)
+        )
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding: List[float], k: int = 4, filter=None,
+                                                          created_after=None, created_before=None, **kwargs):
+        return self.similarity_search_with_score_by_vector(
+            embedding, k=k, filter=self._filter(filter, created_after, created_before)
+        )
+
+    def add_vectors(self, vectors: List[List[float]], documents: List[Document], **kwargs) -> List[str]:
+        ids = []
+        for vector, document in zip(vectors, documents):
+            doc_id = document.metadata.get("document_id") or str(len(self.store))
+            self.store[doc_id] = {"id": doc_id, "vector": vector, "text": document.page_content,
+                                  "metadata": document.metadata}
+            ids.append(doc_id)
+        return ids
+
+    def similarity_search(self, query: str, k: int = 4, filter=None, created_after=None, created_before=None,
+                          **kwargs) -> List[Document]:
+        return super().similarity_search(
+            query, k=k, filter=self._filter(filter, created_after, created_before), **kwargs
+        )
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, filter=None, created_after=None,
+                                    created_before=None, **kwargs) -> List[Document]:
+        return super().similarity_search_by_vector(
+            embedding, k=k, filter=self._filter(filter, created_after, created_before), **kwargs
+        )
+
+
+# === Wiring ===
+
+def _patch_llm_modules(llm: FakeLLM) -> List[str]:
+    patched = []
+    for name, module in list(sys.modules.items()):
+        if not name.startswith(("AIFlow", "backend")) or module is None:
+            continue
+        for attr, fake in (("completion", llm.completion), ("acompletion", llm.acompletion)):
+            if getattr(module, attr, None) is getattr(litellm, attr):
+                setattr(module, attr, fake)
+                patched.append(f"{name}.{attr}")
+    return patched
+
+
+def install(llm: Optional[FakeLLM] = None, db_latency_ms: float = 0.0,
+            embeddings: Optional[Embeddings] = None) -> SimpleNamespace:
+    """
+    Point memory_manager at in-memory Supabase, vector store and embeddings,
+    and every loaded AIFlow module at the fake LLM. Returns the stand-ins.
+    """
+    import AIFlow.memory.memory_manager as memory_manager
+    from AIFlow.memory.embedding_service import EmbeddingService
+
+    llm = llm or FakeLLM()
+    _patch_llm_modules(llm)
+    litellm.completion, litellm.acompletion = llm.completion, llm.acompletion
+
+    db = InMemorySupabase(db_latency_ms)
+    async_db = AsyncInMemorySupabase(db_latency_ms, tables=db.tables)
+    async_db.lock, async_db._indexes = db.lock, db._indexes
+    embedder = embeddings or HashEmbeddings()
+    service = EmbeddingService(embedder, model_name=f"bench-{type(embedder).__name__}")
+    store = InMemoryVectorStore(embedding=service)
+
+    memory_manager._supabase = db
+    memory_manager._async_supabase = async_db
+    memory_manager._embeddings = service
+    memory_manager._vector_store = store
+    return SimpleNamespace(llm=llm, db=db, async_db=async_db, embeddings=service, vector_store=store)
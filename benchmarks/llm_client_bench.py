@@ -0,0 +1,72 @@
+"""
+Tail latency of AIFlow.tools.llm_client against the fake provider.
+
+Sends --calls generator requests, --concurrency at a time, to a FakeLLM
+where --stall-rate of calls take --stall-ms, optionally with the primary
+model failing --error-rate of the time. Runs once without and once with
+hedged requests and reports p50/p99, calls made per model and failures.
+No network or API keys are needed.
+
+    python -m benchmarks.llm_client_bench [--calls 400] [--concurrency 8]
+        [--llm-latency-ms 200] [--stall-rate 0.03] [--stall-ms 3000] [--error-rate 0]
+"""
+import argparse
+import asyncio
+import time
+
+
+async def run(args, hedge: bool) -> dict:
+    from AIFlow.tools import llm_client
+    from benchmarks.harness import FakeLLM, install
+    from benchmarks.therapy_bench import latency_stats
+
+    config = llm_client.ROLES[llm_client.GENERATOR]
+    llm_client.ROLES[llm_client.GENERATOR] = llm_client.RoleConfig(**{**vars(config), "hedge": hedge})
+    llm_client._model_stats.clear()
+    llm = FakeLLM(
+        latency_ms=args.llm_latency_ms, jitter=args.llm_jitter, stall_rate=args.stall_rate,
+        stall_ms=args.stall_ms, models={config.model: {"error_rate": args.error_rate}}, seed=args.seed,
+    )
+    install(llm)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, failures = [], 0
+
+    async def call(i: int) -> None:
+        nonlocal failures
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await llm_client.acomplete(llm_client.GENERATOR, [{"role": "user", "content": f"Hello ({i})"}])
+            except llm_client.LLMUnavailable:
+                failures += 1
+                return
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(call(i) for i in range(args.calls)))
+    llm_client.ROLES[llm_client.GENERATOR] = config
+    return {**latency_stats(latencies), "failures": failures, "model_calls": dict(llm.model_calls)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0)
+    parser.add_argument("--llm-jitter", type=float, default=0.2)
+    parser.add_argument("--stall-rate", type=float, default=0.03)
+    parser.add_argument("--stall-ms", type=float, default=3000.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="failure rate of the primary model")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{args.calls} calls, {args.concurrency} at a time, llm {args.llm_latency_ms} ms, "
+          f"{args.stall_rate:.0%} stalls of {args.stall_ms} ms, primary errors {args.error_rate:.0%}")
+    for hedge in (False, True):
+        result = asyncio.run(run(args, hedge))
+        print(f"{'hedged' if hedge else 'unhedged':<10} p50 {result['p50_ms']:>8.1f} ms  p99 {result['p99_ms']:>8.1f} ms"
+              f"  failures {result['failures']}  calls {result['model_calls']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Long-term memory search cost as a user's history grows.
+
+For each history length, loads one user's journal (--per-day memories a
+day, dated back from today) into a LocalVectorStore in a temporary
+directory, using HashEmbeddings and the fake LLM of benchmarks.harness for
+the digests, and times search_long_term_memory:
+
+    flat        one search over the whole history (LONG_TERM_RECENT_DAYS=0),
+                as before time-aware retrieval
+    tiered      recent months first, older ones only when those fall short
+    compacted   tiered, after a compaction pass has folded every month older
+                than LONG_TERM_COMPACT_AFTER_DAYS into a digest
+
+and reports the searchable documents, p50/p99 per query and how many
+searches needed the older tier.
+
+    python -m benchmarks.memory_growth_bench [--years 1,2,4,8] [--per-day 3] [--queries 200]
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import random
+import shutil
+import tempfile
+import time
+
+TOPICS = [
+    "work deadline stress boss", "slept badly tired morning", "argument with my sister", "went running felt better",
+    "anxious about money rent", "therapy homework breathing", "lonely weekend at home", "proud of finishing project",
+]
+
+
+def load_history(mm, user_id: str, years: int, per_day: int, rng: random.Random) -> int:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    contents, metadatas = [], []
+    for day in range(int(years * 365)):
+        for i in range(per_day):
+            timestamp = now - datetime.timedelta(days=day, hours=i * 24 / per_day)
+            contents.append(f"{rng.choice(TOPICS)} {rng.choice(TOPICS)} day {day} entry {i}")
+            metadatas.append({"type": "journal", "timestamp": timestamp.isoformat()})
+    mm.save_batch_to_long_term_memory(user_id, contents, metadatas)
+    return len(contents)
+
+
+def time_searches(mm, store, user_id: str, queries, k: int) -> dict:
+    from benchmarks.therapy_bench import latency_stats
+
+    searches = []
+    search = store.similarity_search_by_vector_with_embeddings
+
+    def counted(*args, **kwargs):
+        searches.append(1)
+        return search(*args, **kwargs)
+
+    store.similarity_search_by_vector_with_embeddings = counted
+    latencies, widened = [], 0
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            mm.search_long_term_memory(user_id, queries[0], k=k)  # warm up
+            for query in queries:
+                searches.clear()
+                started = time.perf_counter()
+                mm.search_long_term_memory(user_id, query, k=k)
+                latencies.append((time.perf_counter() - started) * 1000)
+                widened += len(searches) > 1
+    finally:
+        del store.similarity_search_by_vector_with_embeddings
+    return {**latency_stats(latencies), "widened": widened}
+
+
+def main():
+    from benchmarks.harness import FakeLLM, install
+    from benchmarks.therapy_bench import git_commit
+    import AIFlow.memory.memory_manager as mm
+    from AIFlow.memory import compaction
+    from AIFlow.memory.local_vector_store import LocalVectorStore
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--years", default="1,2,4,8", help="comma-separated history lengths")
+    parser.add_argument("--per-day", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    services = install(FakeLLM())
+    recent_days = mm.LONG_TERM_RECENT_DAYS
+    results = []
+    for years in [float(y) for y in args.years.split(",")]:
+        rng = random.Random(args.seed)
+        root = tempfile.mkdtemp(prefix="memory_growth_")
+        try:
+            store = mm._vector_store = LocalVectorStore(services.embeddings, root)
+            user_id = "bench-user"
+            loaded = load_history(mm, user_id, years, args.per_day, rng)
+            queries = [rng.choice(TOPICS) for _ in range(args.queries)]
+            row = {"years": years, "documents": loaded}
+
+            mm.LONG_TERM_RECENT_DAYS = 0
+            row["flat"] = time_searches(mm, store, user_id, queries, args.k)
+            mm.LONG_TERM_RECENT_DAYS = recent_days
+            row["tiered"] = time_searches(mm, store, user_id, queries, args.k)
+            with contextlib.redirect_stdout(io.StringIO()):
+                compaction.compact_long_term_memory(max_periods=10_000)
+            row["searchable_after_compaction"] = len(store._shard(user_id).docs)
+            row["compacted"] = time_searches(mm, store, user_id, queries, args.k)
+        finally:
+            mm.LONG_TERM_RECENT_DAYS = recent_days
+            shutil.rmtree(root, ignore_errors=True)
+        results.append(row)
+        print(f"{years:g} years: {loaded:,} documents, {row['searchable_after_compaction']:,} after compaction")
+        for name in ("flat", "tiered", "compacted"):
+            stats = row[name]
+            print(f"  {name:<10} p50 {stats['p50_ms']:>7.2f} ms  p99 {stats['p99_ms']:>7.2f} ms"
+                  f"  older tier {stats['widened']}/{stats['count']}")
+
+    if args.output:
+        report = {"meta": {"commit": git_commit(), "args": vars(args)}, "results": results}
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
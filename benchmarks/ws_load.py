@@ -0,0 +1,411 @@
+"""
+Websocket load generator for /chat/ws/chat.
+
+Opens --sessions concurrent authenticated sessions and replays the
+multi-turn conversations of a JSONL corpus (one {"id", "turns": [...]}
+per line, benchmarks/data/conversations.jsonl by default), waiting
+--think-time seconds (+/- --think-jitter) between a reply and the next
+message. Each conversation is one connection with its own thread_id.
+Access tokens are minted locally with JWT_SECRET, so verify_jwt accepts
+them.
+
+Reports connect and turn latency percentiles (and time to the first
+token frame with --stream), errors by kind, and event loop lag: the
+client's own, to tell when the generator rather than the server is the
+bottleneck, and the server's, from event_loop_lag_seconds on /metrics.
+
+Against a running server:
+
+    python -m benchmarks.ws_load run --url ws://127.0.0.1:8000/chat/ws/chat --sessions 200
+
+or against a local server backed by the stand-ins in benchmarks/harness.py
+(fake LLM, in-memory Supabase), started separately or with --spawn:
+
+    python -m benchmarks.ws_load serve --port 8765 --llm-latency-ms 300
+    python -m benchmarks.ws_load run --spawn --sessions 200 --duration 60 [--stream]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from typing import Dict, List, Optional
+
+import dotenv
+import jwt
+import websockets
+
+from benchmarks.therapy_bench import git_commit, percentile
+
+dotenv.load_dotenv()
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "data", "conversations.jsonl")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Used by both sides when JWT_SECRET is unset, so a local stand-in server
+# and the generator agree without any configuration.
+LOCAL_JWT_SECRET = "ws-load-local-secret"
+
+
+def jwt_secret() -> str:
+    return os.environ.setdefault("JWT_SECRET", LOCAL_JWT_SECRET)
+
+
+def mint_token(user_id: str, secret: str, algorithm: str = "HS256", ttl: int = 3600) -> str:
+    """An access token shaped like Supabase's, signed with secret."""
+    now = int(time.time())
+    claims = {
+        "sub": user_id,
+        "email": f"{user_id}@example.com",
+        "aud": "authenticated",
+        "role": "authenticated",
+        "iat": now - 1,
+        "exp": now + ttl,
+    }
+    return jwt.encode(claims, secret, algorithm=algorithm)
+
+
+def load_corpus(path: str) -> List[Dict]:
+    with open(path, encoding="utf-8") as f:
+        conversations = [json.loads(line) for line in f if line.strip()]
+    return [conversation for conversation in conversations if conversation.get("turns")]
+
+
+def stats(values_ms: List[float]) -> Dict:
+    return {
+        "count": len(values_ms),
+        "p50_ms": percentile(values_ms, 0.5),
+        "p90_ms": percentile(values_ms, 0.9),
+        "p99_ms": percentile(values_ms, 0.99),
+        "max_ms": max(values_ms) if values_ms else None,
+    }
+
+
+class Results:
+    def __init__(self):
+        self.connect_ms: List[float] = []
+        self.turn_ms: List[float] = []
+        self.first_token_ms: List[float] = []
+        self.client_lag_ms: List[float] = []
+        self.errors: Dict[str, int] = {}
+        self.error_samples: List[str] = []
+        self.conversations = 0
+
+    def error(self, kind: str, detail: str = "") -> None:
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+        sample = f"{kind}: {detail}"[:200]
+        if detail and len(self.error_samples) < 5 and sample not in self.error_samples:
+            self.error_samples.append(sample)
+
+
+# === Sessions ===
+
+async def run_turn(ws, text: str, args, results: Results) -> bool:
+    """Send one message and wait for its reply; False ends the conversation."""
+    started = time.perf_counter()
+    first_token = None
+    try:
+        await ws.send(json.dumps({"input": text}))
+        while True:
+            frame = json.loads(await asyncio.wait_for(ws.recv(), args.timeout))
+            if "error" in frame:
+                results.error("error_frame", str(frame["error"]))
+                return False
+            kind = frame.get("type")
+            if kind == "token":
+                if first_token is None:
+                    first_token = time.perf_counter()
+                    results.first_token_ms.append((first_token - started) * 1000)
+                continue
+            if kind == "queued":
+                continue
+            if kind in ("backpressure", "cancelled"):
+                # The message was dropped; the conversation goes on.
+                results.error(f"{kind}:{frame.get('reason')}")
+                return True
+            results.turn_ms.append((time.perf_counter() - started) * 1000)
+            return True
+    except asyncio.TimeoutError:
+        results.error("timeout", text)
+    except websockets.ConnectionClosed as e:
+        results.error(f"closed:{e.rcvd.code if e.rcvd else 'none'}", e.rcvd.reason if e.rcvd else "")
+    return False
+
+
+def think_time(rng: random.Random, args) -> float:
+    return max(0.0, args.think_time * (1 + rng.uniform(-args.think_jitter, args.think_jitter)))
+
+
+async def run_session(index: int, args, corpus: List[Dict], results: Results, deadline: Optional[float]) -> None:
+    """One simulated user replaying conversations from the corpus, starting at a different one each."""
+    user_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"ws-load/{index}"))
+    token = mint_token(user_id, jwt_secret(), args.jwt_algorithm)
+    rng = random.Random(args.seed + index)
+    await asyncio.sleep(args.ramp_up * index / args.sessions)
+    done = 0
+    while (time.monotonic() < deadline) if deadline else done < args.conversations:
+        conversation = corpus[(index + done) % len(corpus)]
+        done += 1
+        started = time.perf_counter()
+        try:
+            ws = await websockets.connect(args.url, open_timeout=args.timeout, max_size=None)
+        except (OSError, asyncio.TimeoutError, websockets.InvalidHandshake) as e:
+            results.error("connect", f"{type(e).__name__}: {e}")
+            await asyncio.sleep(1)
+            continue
+        results.connect_ms.append((time.perf_counter() - started) * 1000)
+        async with ws:
+            thread_id = f"load-{conversation['id']}-{index}-{done}"
+            await ws.send(json.dumps({"access_token": token, "thread_id": thread_id, "stream": args.stream}))
+            for turn, text in enumerate(conversation["turns"]):
+                if turn:
+                    await asyncio.sleep(think_time(rng, args))
+                if deadline and time.monotonic() >= deadline:
+                    break
+                if not await run_turn(ws, text, args, results):
+                    break
+            else:
+                results.conversations += 1
+
+
+async def probe_lag(samples: List[float], interval: float = 0.05) -> None:
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - start - interval) * 1000)
+
+
+# === Server-side event loop lag ===
+
+def metrics_url_for(ws_url: str) -> str:
+    parts = urllib.parse.urlsplit(ws_url)
+    scheme = "https" if parts.scheme == "wss" else "http"
+    return urllib.parse.urlunsplit((scheme, parts.netloc, "/metrics", "", ""))
+
+
+def lag_buckets(metrics_url: str) -> Optional[Dict[float, float]]:
+    """
+    Cumulative event_loop_lag_seconds buckets ({upper bound: count}) scraped
+    from /metrics; empty before the first sample, None if unreachable.
+    """
+    try:
+        with urllib.request.urlopen(metrics_url, timeout=5) as response:
+            text = response.read().decode()
+    except OSError:
+        return None
+    buckets = {}
+    for line in text.splitlines():
+        if line.startswith("event_loop_lag_seconds_bucket{"):
+            bound = line.split('le="', 1)[1].split('"', 1)[0]
+            buckets[float(bound)] = float(line.rsplit(" ", 1)[1])
+    return buckets
+
+
+def bucket_quantile(before: Dict[float, float], after: Dict[float, float], q: float) -> Optional[float]:
+    """Quantile (in ms) of the observations made between two scrapes, interpolated within buckets."""
+    bounds = sorted(after)
+    cumulative = [after[bound] - before.get(bound, 0) for bound in bounds]
+    if not cumulative or not cumulative[-1]:
+        return None
+    rank = q * cumulative[-1]
+    lower, below = 0.0, 0.0
+    for bound, count in zip(bounds, cumulative):
+        if count >= rank and count > below:
+            if bound == float("inf"):
+                return lower * 1000
+            return (lower + (bound - lower) * (rank - below) / (count - below)) * 1000
+        lower, below = bound, count
+    return None
+
+
+# === Local stand-in server ===
+
+def serve(args) -> None:
+    """Run the real app with the LLM, Supabase and embeddings replaced by benchmarks.harness."""
+    import uvicorn
+
+    # Settings are read at import time, so they go into the environment first.
+    jwt_secret()
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+    os.environ.setdefault("SUPABASE_KEY", "eyJhbGciOiJIUzI1NiJ9.e30.stand-in")
+    workdir = tempfile.mkdtemp(prefix="ws-load-")
+    os.environ["THERAPY_CLASSIFIER"] = args.classifier
+    os.environ["CHECKPOINTER"] = args.checkpointer
+    os.environ["CHECKPOINT_DB"] = os.path.join(workdir, "checkpoints.sqlite")
+
+    from backend.main import app
+    from benchmarks.harness import FakeLLM, install
+
+    install(FakeLLM(latency_ms=args.llm_latency_ms, jitter=args.llm_jitter), db_latency_ms=args.db_latency_ms)
+    print(f"Serving the stand-in backend on ws://{args.host}:{args.port}/chat/ws/chat")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+def spawn_server(args) -> subprocess.Popen:
+    """Start `serve` in a child process and wait until /ready answers."""
+    jwt_secret()
+    log_path = os.path.join(tempfile.mkdtemp(prefix="ws-load-"), "server.log")
+    command = [
+        sys.executable, "-m", "benchmarks.ws_load", "serve", "--host", "127.0.0.1", "--port", str(args.port),
+        "--llm-latency-ms", str(args.llm_latency_ms), "--llm-jitter", str(args.llm_jitter),
+        "--db-latency-ms", str(args.db_latency_ms), "--classifier", args.classifier,
+        "--checkpointer", args.checkpointer,
+    ]
+    with open(log_path, "w") as log:
+        process = subprocess.Popen(command, cwd=REPO_ROOT, stdout=log, stderr=subprocess.STDOUT)
+    print(f"Started stand-in server (pid {process.pid}), log in {log_path}")
+    ready_url = f"http://127.0.0.1:{args.port}/ready"
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Stand-in server exited with {process.returncode}, see {log_path}")
+        try:
+            with urllib.request.urlopen(ready_url, timeout=1) as response:
+                if response.status == 200:
+                    return process
+        except OSError:
+            pass
+        time.sleep(0.25)
+    process.terminate()
+    raise RuntimeError(f"Stand-in server not ready after 120 s, see {log_path}")
+
+
+# === Load run ===
+
+async def run_load(args, corpus: List[Dict]) -> Dict:
+    results = Results()
+    metrics_url = args.metrics_url or metrics_url_for(args.url)
+    before = await asyncio.to_thread(lag_buckets, metrics_url)
+    lag_task = asyncio.create_task(probe_lag(results.client_lag_ms))
+    deadline = time.monotonic() + args.duration if args.duration else None
+    started = time.perf_counter()
+    await asyncio.gather(*(run_session(i, args, corpus, results, deadline) for i in range(args.sessions)))
+    elapsed = time.perf_counter() - started
+    lag_task.cancel()
+    after = await asyncio.to_thread(lag_buckets, metrics_url)
+
+    turn_errors = sum(count for kind, count in results.errors.items() if kind != "connect")
+    attempts = len(results.turn_ms) + turn_errors
+    connects = len(results.connect_ms) + results.errors.get("connect", 0)
+    server_lag = None
+    if before is not None and after:
+        server_lag = {f"p{int(q * 100)}_ms": bucket_quantile(before, after, q) for q in (0.5, 0.99)}
+    return {
+        "sessions": args.sessions,
+        "seconds": round(elapsed, 3),
+        "turns": len(results.turn_ms),
+        "turns_per_sec": round(len(results.turn_ms) / elapsed, 2) if elapsed else None,
+        "conversations_completed": results.conversations,
+        "turn_error_rate": round(turn_errors / attempts, 4) if attempts else None,
+        "connect_error_rate": round(results.errors.get("connect", 0) / connects, 4) if connects else None,
+        "errors": results.errors,
+        "error_samples": results.error_samples,
+        "connect": stats(results.connect_ms),
+        "turn": stats(results.turn_ms),
+        "first_token": stats(results.first_token_ms) if args.stream else None,
+        "client_event_loop_lag": stats(results.client_lag_ms),
+        "server_event_loop_lag": server_lag,
+    }
+
+
+def _ms(value) -> str:
+    return f"{value:.1f}" if value is not None else "-"
+
+
+def print_report(report: Dict) -> None:
+    print(
+        f"{report['sessions']} sessions, {report['turns']} turns in {report['seconds']:.1f} s "
+        f"({report['turns_per_sec']} turns/s), {report['conversations_completed']} conversations completed"
+    )
+    print(f"turn errors {report['turn_error_rate']}, connect errors {report['connect_error_rate']}  {report['errors']}")
+    for sample in report["error_samples"]:
+        print(f"    {sample}")
+    rows = [("connect", report["connect"]), ("turn", report["turn"]), ("first token", report["first_token"]),
+            ("client loop lag", report["client_event_loop_lag"])]
+    for name, row in rows:
+        if row:
+            print(f"{name:<16} p50 {_ms(row['p50_ms']):>8} ms  p90 {_ms(row['p90_ms']):>8} ms  "
+                  f"p99 {_ms(row['p99_ms']):>8} ms  max {_ms(row['max_ms']):>8} ms")
+    server_lag = report["server_event_loop_lag"]
+    if server_lag:
+        print(f"{'server loop lag':<16} p50 {_ms(server_lag['p50_ms']):>8} ms  p99 {_ms(server_lag['p99_ms']):>8} ms")
+    else:
+        print("server loop lag  unavailable (no event_loop_lag_seconds on /metrics)")
+
+
+def run(args) -> None:
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        raise SystemExit(f"No conversations in {args.corpus}")
+    server = None
+    if args.spawn:
+        args.url = f"ws://127.0.0.1:{args.port}/chat/ws/chat"
+        server = spawn_server(args)
+    try:
+        report = asyncio.run(run_load(args, corpus))
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=30)
+    print_report(report)
+    if args.output:
+        meta = {"commit": git_commit(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "args": vars(args)}
+        with open(args.output, "w") as f:
+            json.dump({"meta": meta, **report}, f, indent=2)
+        print(f"wrote {args.output}")
+    if report["turn_error_rate"] is None or report["turn_error_rate"] > args.max_error_rate:
+        sys.exit(1)
+
+
+def add_backend_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--llm-jitter", type=float, default=0.2, help="latency jitter as a fraction")
+    parser.add_argument("--db-latency-ms", type=float, default=2.0)
+    parser.add_argument("--classifier", choices=["parallel", "combined", "local"], default="parallel")
+    parser.add_argument("--checkpointer", choices=["sqlite", "memory", "none"], default="sqlite")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="run the app against the in-memory stand-ins")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    add_backend_arguments(serve_parser)
+
+    run_parser = commands.add_parser("run", help="replay the corpus against a server")
+    run_parser.add_argument("--url", default="ws://127.0.0.1:8000/chat/ws/chat")
+    run_parser.add_argument("--spawn", action="store_true", help="start a stand-in server on --port first")
+    run_parser.add_argument("--sessions", type=int, default=50, help="concurrent websocket sessions")
+    run_parser.add_argument("--conversations", type=int, default=1, help="conversations per session")
+    run_parser.add_argument("--duration", type=float, default=0.0,
+                            help="keep replaying for this many seconds instead of --conversations")
+    run_parser.add_argument("--ramp-up", type=float, default=5.0, help="seconds over which sessions start")
+    run_parser.add_argument("--think-time", type=float, default=2.0, help="seconds between a reply and the next message")
+    run_parser.add_argument("--think-jitter", type=float, default=0.5, help="think time jitter as a fraction")
+    run_parser.add_argument("--stream", action="store_true", help="ask for token frames")
+    run_parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for a connection or reply")
+    run_parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    run_parser.add_argument("--jwt-algorithm", default=os.getenv("JWT_ALGORITHM", "HS256"))
+    run_parser.add_argument("--metrics-url", help="defaults to /metrics on the websocket host")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--max-error-rate", type=float, default=0.01, help="exit 1 above this turn error rate")
+    run_parser.add_argument("--output", help="write the report as JSON")
+    add_backend_arguments(run_parser)
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        serve(args)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
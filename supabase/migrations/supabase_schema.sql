@@ -12,6 +12,7 @@ create table if not exists profiles (
 create table if not exists memory_logs (
   id uuid primary key default gen_random_uuid(),
   user_id uuid not null references auth.users(id) on delete cascade,
+  thread_id text not null default 'default',
   role text check (role in ('user', 'assistant')) not null,
   content text not null,
   timestamp timestamptz default current_timestamp,
@@ -22,35 +23,31 @@ create table if not exists memory_logs (
   attack text
 );
 
+-- Conversations are scoped per (user_id, thread_id); adds the column to existing tables
+alter table memory_logs add column if not exists thread_id text not null default 'default';
+
+-- === Rolling Conversation Summaries ===
+-- One per (user_id, thread_id): a summary of the messages before window_start_id,
+-- the oldest memory_logs message still sent verbatim in the prompt.
+create table if not exists thread_summaries (
+  user_id uuid not null references auth.users(id) on delete cascade,
+  thread_id text not null default 'default',
+  summary text not null,
+  window_start_id uuid,
+  updated_at timestamptz default now(),
+  primary key (user_id, thread_id)
+);
+
 -- === Long-Term Memory with Vector Embeddings ===
 create table if not exists documents (
   id uuid primary key default gen_random_uuid(),
   user_id uuid not null references auth.users(id) on delete cascade,
   content text not null,
   metadata jsonb,
-  embedding vector(1536)  -- Adjust dimension for your embedding model
+  embedding vector(384),  -- all-MiniLM-L6-v2; see EMBEDDING_MODEL
+  created_at timestamptz not null default now()
 );
 
--- === RPC Function for Vector Search ===
-create or replace function match_documents (
-  filter jsonb,
-  query_embedding vector
-)
-returns table (
-  id uuid,
-  content text,
-  metadata jsonb,
-  similarity float
-)
-language sql stable
-as $$
-  select
-    id,
-    content,
-    metadata,
-    1 - (embedding <#> query_embedding) as similarity
-  from documents
-  where metadata->>'user_id' = user_id::text
-  order by embedding <#> query_embedding
-  limit 3;
-$$;
\ No newline at end of file
+-- Indexes and the match_documents RPC: supabase_schema_002_documents_vector_index.sql
+-- Archive and compaction RPCs: supabase_schema_003_documents_compaction.sql
+-- History pagination indexes and RPCs: supabase_schema_004_history_pagination.sql
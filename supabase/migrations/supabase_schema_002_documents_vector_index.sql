@@ -0,0 +1,64 @@
+-- === Long-Term Memory: sized vectors, HNSW index, per-user match_documents ===
+-- Runs after supabase_schema.sql. Requires pgvector >= 0.8 (iterative index scans).
+
+-- all-MiniLM-L6-v2 embeddings have 384 dimensions; change this (and the
+-- function below) together with EMBEDDING_MODEL. Rows of another size could
+-- never have been matched by the model's queries, so they are dropped.
+delete from documents where vector_dims(embedding) <> 384;
+alter table documents alter column embedding type vector(384);
+
+-- When a memory was saved, for time-window searches (backfilled from the
+-- timestamp the app has always written into metadata).
+alter table documents add column if not exists created_at timestamptz not null default now();
+update documents
+  set created_at = (metadata->>'timestamp')::timestamptz
+  where metadata ? 'timestamp';
+
+-- Approximate nearest neighbours by cosine distance (the embeddings are not
+-- normalised by the database, so <=> rather than <#>).
+create index if not exists documents_embedding_hnsw_idx
+  on documents using hnsw (embedding vector_cosine_ops);
+-- Exact per-user scans when a user has few documents, and time windows.
+create index if not exists documents_user_id_created_at_idx
+  on documents (user_id, created_at);
+
+-- === RPC Function for Vector Search ===
+-- The old signature took a JSONB filter it never applied.
+drop function if exists match_documents (jsonb, vector);
+
+create or replace function match_documents (
+  query_embedding vector(384),
+  match_user_id uuid,
+  match_count int default 3,
+  created_after timestamptz default null,
+  created_before timestamptz default null
+)
+returns table (
+  id uuid,
+  content text,
+  metadata jsonb,
+  similarity float
+)
+language sql stable
+-- Keep scanning the HNSW index until match_count rows pass the user_id and
+-- time filters, instead of filtering a fixed ef_search candidate list.
+set hnsw.iterative_scan = relaxed_order
+as $$
+  with nearest as materialized (
+    select
+      id,
+      content,
+      metadata,
+      embedding <=> query_embedding as distance
+    from documents
+    where user_id = match_user_id
+      and (created_after is null or created_at >= created_after)
+      and (created_before is null or created_at < created_before)
+    order by embedding <=> query_embedding
+    limit least(match_count, 100)
+  )
+  -- relaxed_order may return neighbours slightly out of order.
+  select id, content, metadata, 1 - distance as similarity
+  from nearest
+  order by distance;
+$$;
@@ -0,0 +1,68 @@
+-- === Long-Term Memory: monthly buckets and compaction ===
+-- Runs after supabase_schema_002_documents_vector_index.sql.
+--
+-- Memories older than LONG_TERM_COMPACT_AFTER_DAYS are summarised into one
+-- digest document per user and month (metadata->>'type' = 'digest') by
+-- AIFlow.memory.compaction, and the originals are moved to documents_archive.
+-- The searchable table then holds the recent months in full plus one digest
+-- per older month.
+
+create table if not exists documents_archive (
+  like documents including defaults,
+  archived_at timestamptz not null default now(),
+  primary key (id)
+);
+
+create index if not exists documents_archive_user_id_created_at_idx
+  on documents_archive (user_id, created_at);
+
+-- Finds the rows compaction still has to visit without scanning every user.
+create index if not exists documents_created_at_raw_idx
+  on documents (created_at)
+  where coalesce(metadata->>'type', '') <> 'digest';
+
+-- (user, month) buckets with memories neither saved nor seen again since
+-- older_than, oldest first.
+create or replace function compactable_periods (
+  older_than timestamptz,
+  max_periods int default 100
+)
+returns table (
+  user_id uuid,
+  period text
+)
+language sql stable
+as $$
+  select d.user_id, to_char(d.created_at at time zone 'UTC', 'YYYY-MM') as period
+  from documents d
+  where d.created_at < older_than
+    and coalesce(d.metadata->>'type', '') <> 'digest'
+    and coalesce((d.metadata->>'last_seen')::timestamptz, d.created_at) < older_than
+  group by 1, 2
+  order by 2, 1
+  limit max_periods;
+$$;
+
+-- Moves a user's documents into documents_archive in one transaction.
+create or replace function archive_documents (
+  archive_user_id uuid,
+  doc_ids uuid[]
+)
+returns bigint
+language plpgsql
+as $$
+declare
+  moved bigint;
+begin
+  with removed as (
+    delete from documents
+    where user_id = archive_user_id and id = any(doc_ids)
+    returning id, user_id, content, metadata, embedding, created_at
+  )
+  insert into documents_archive (id, user_id, content, metadata, embedding, created_at)
+  select id, user_id, content, metadata, embedding, created_at from removed
+  on conflict (id) do nothing;
+  get diagnostics moved = row_count;
+  return moved;
+end;
+$$;
@@ -0,0 +1,86 @@
+-- === Conversation history: keyset pagination and export ===
+-- Runs after supabase_schema_003_documents_compaction.sql.
+--
+-- History pages and exports walk a user's rows in (timestamp, id) order from
+-- a cursor (the last row of the previous page) instead of an OFFSET, so every
+-- page costs one short index range scan however deep into the history it is.
+
+-- The app always writes a timestamp; rows from before it did sort first.
+update memory_logs set timestamp = 'epoch' where timestamp is null;
+alter table memory_logs alter column timestamp set not null;
+
+create index if not exists memory_logs_user_id_timestamp_idx
+  on memory_logs (user_id, timestamp, id);
+-- One conversation's history, and get_memory's last-N read.
+create index if not exists memory_logs_user_id_thread_id_timestamp_idx
+  on memory_logs (user_id, thread_id, timestamp, id);
+
+-- A page of a user's memory_logs after the (cursor_timestamp, cursor_id) row,
+-- oldest first or newest first, optionally for one thread.
+create or replace function memory_logs_page (
+  page_user_id uuid,
+  page_size int default 50,
+  cursor_timestamp timestamptz default null,
+  cursor_id uuid default null,
+  newest_first boolean default false,
+  page_thread_id text default null
+)
+returns setof memory_logs
+language plpgsql stable
+as $$
+begin
+  if newest_first then
+    return query
+      select * from memory_logs m
+      where m.user_id = page_user_id
+        and (page_thread_id is null or m.thread_id = page_thread_id)
+        and (cursor_timestamp is null or (m.timestamp, m.id) < (cursor_timestamp, cursor_id))
+      order by m.timestamp desc, m.id desc
+      limit least(page_size, 1000);
+  else
+    return query
+      select * from memory_logs m
+      where m.user_id = page_user_id
+        and (page_thread_id is null or m.thread_id = page_thread_id)
+        and (cursor_timestamp is null or (m.timestamp, m.id) > (cursor_timestamp, cursor_id))
+      order by m.timestamp, m.id
+      limit least(page_size, 1000);
+  end if;
+end;
+$$;
+
+-- A page of a user's long-term memory documents (or archived ones) after the
+-- (cursor_created_at, cursor_id) row, oldest first, without embeddings.
+create or replace function documents_page (
+  page_user_id uuid,
+  page_size int default 100,
+  cursor_created_at timestamptz default null,
+  cursor_id uuid default null,
+  archived boolean default false
+)
+returns table (
+  id uuid,
+  content text,
+  metadata jsonb,
+  created_at timestamptz
+)
+language plpgsql stable
+as $$
+begin
+  if archived then
+    return query
+      select d.id, d.content, d.metadata, d.created_at from documents_archive d
+      where d.user_id = page_user_id
+        and (cursor_created_at is null or (d.created_at, d.id) > (cursor_created_at, cursor_id))
+      order by d.created_at, d.id
+      limit least(page_size, 1000);
+  else
+    return query
+      select d.id, d.content, d.metadata, d.created_at from documents d
+      where d.user_id = page_user_id
+        and (cursor_created_at is null or (d.created_at, d.id) > (cursor_created_at, cursor_id))
+      order by d.created_at, d.id
+      limit least(page_size, 1000);
+  end if;
+end;
+$$;
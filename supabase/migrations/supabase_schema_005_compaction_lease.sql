@@ -0,0 +1,41 @@
+-- === Long-Term Memory: one compaction pass at a time ===
+-- Runs after supabase_schema_004_history_pagination.sql.
+--
+-- Every API worker runs the compaction loop (and cron may run the CLI), so a
+-- pass first takes a lease on compaction: two passes over the same month
+-- would each write a digest. A lease expires on its own, so a worker that
+-- dies mid-pass only holds compaction up until lease_seconds have passed.
+
+create table if not exists leases (
+  name text primary key,
+  holder text not null,
+  expires_at timestamptz not null
+);
+
+-- Takes the lease, or renews it for its holder. False while someone else
+-- holds it.
+create or replace function acquire_lease (
+  lease_name text,
+  lease_holder text,
+  lease_seconds double precision
+)
+returns boolean
+language sql
+as $$
+  insert into leases as l (name, holder, expires_at)
+  values (lease_name, lease_holder, now() + make_interval(secs => lease_seconds))
+  on conflict (name) do update
+    set holder = excluded.holder, expires_at = excluded.expires_at
+    where l.holder = excluded.holder or l.expires_at < now()
+  returning true;
+$$;
+
+create or replace function release_lease (
+  lease_name text,
+  lease_holder text
+)
+returns void
+language sql
+as $$
+  delete from leases where name = lease_name and holder = lease_holder;
+$$;
@@ -0,0 +1,51 @@
+-- === Long-Term Memory: match_documents can return the stored embeddings ===
+-- Runs after supabase_schema_005_compaction_lease.sql.
+--
+-- Searches rank their candidates by maximal marginal relevance, which needs
+-- the candidates' embeddings; returning the stored ones saves embedding every
+-- candidate's text again. Only callers that ask for them (with_embeddings)
+-- pay for sending them.
+
+-- The return type changes, so the old function has to go first.
+drop function if exists match_documents (vector, uuid, int, timestamptz, timestamptz);
+
+create or replace function match_documents (
+  query_embedding vector(384),
+  match_user_id uuid,
+  match_count int default 3,
+  created_after timestamptz default null,
+  created_before timestamptz default null,
+  with_embeddings boolean default false
+)
+returns table (
+  id uuid,
+  content text,
+  metadata jsonb,
+  similarity float,
+  embedding vector(384)
+)
+language sql stable
+-- Keep scanning the HNSW index until match_count rows pass the user_id and
+-- time filters, instead of filtering a fixed ef_search candidate list.
+set hnsw.iterative_scan = relaxed_order
+as $$
+  with nearest as materialized (
+    select
+      d.id,
+      d.content,
+      d.metadata,
+      d.embedding,
+      d.embedding <=> query_embedding as distance
+    from documents d
+    where d.user_id = match_user_id
+      and (created_after is null or d.created_at >= created_after)
+      and (created_before is null or d.created_at < created_before)
+    order by d.embedding <=> query_embedding
+    limit least(match_count, 100)
+  )
+  -- relaxed_order may return neighbours slightly out of order.
+  select n.id, n.content, n.metadata, 1 - n.distance as similarity,
+         case when with_embeddings then n.embedding end as embedding
+  from nearest n
+  order by n.distance;
+$$;
@@ -0,0 +1,147 @@
+"""
+SqliteCheckpointSaver under a real LangGraph graph: a thread must resume
+with its full state after old checkpoints are pruned, pending writes must
+survive, no kept checkpoint may lose a blob, and the async reads must return
+what the sync ones do.
+
+    python -m unittest discover tests
+"""
+import asyncio
+import operator
+import os
+import tempfile
+import unittest
+from typing import Annotated, List, TypedDict
+
+from langgraph.checkpoint.base import ERROR
+from langgraph.graph import END, START, StateGraph
+
+from AIFlow.memory.checkpointer import SqliteCheckpointSaver
+
+KEEP = 3
+TURNS = 11
+# Each turn checkpoints its input, then once after START and each of the two
+# nodes.
+CHECKPOINTS_PER_TURN = 4
+
+
+class State(TypedDict):
+    turns: Annotated[List[str], operator.add]
+    replies: Annotated[List[str], operator.add]
+
+
+def reply(state: State) -> dict:
+    return {"replies": [state["turns"][-1].upper()]}
+
+
+def settle(state: State) -> dict:
+    return {}
+
+
+def build_graph(checkpointer):
+    builder = StateGraph(State)
+    builder.add_node("reply", reply)
+    builder.add_node("settle", settle)
+    builder.add_edge(START, "reply")
+    builder.add_edge("reply", "settle")
+    builder.add_edge("settle", END)
+    return builder.compile(checkpointer=checkpointer)
+
+
+def turn_input(i: int) -> dict:
+    return {"turns": [f"turn {i}"]}
+
+
+class SqliteCheckpointSaverTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.saver = SqliteCheckpointSaver(os.path.join(self.tmp.name, "checkpoints.sqlite"), keep=KEEP)
+        self.graph = build_graph(self.saver)
+        self.config = {"configurable": {"thread_id": "user:thread"}}
+
+    def tearDown(self):
+        self.saver.conn.close()
+        self.tmp.cleanup()
+
+    def run_turns(self, start: int, stop: int) -> None:
+        for i in range(start, stop):
+            self.graph.invoke(turn_input(i), self.config)
+
+    def expected_values(self, turns: int) -> dict:
+        return {
+            "turns": [f"turn {i}" for i in range(turns)],
+            "replies": [f"TURN {i}" for i in range(turns)],
+        }
+
+    def assert_blobs_present(self) -> None:
+        for item in self.saver.list(self.config):
+            for channel, version in item.checkpoint["channel_versions"].items():
+                row = self.saver.conn.execute(
+                    "SELECT 1 FROM checkpoint_blobs WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "AND channel = ? AND version = ?",
+                    ("user:thread", "", channel, str(version)),
+                ).fetchone()
+                self.assertIsNotNone(row, f"{item.config['configurable']['checkpoint_id']}: {channel}@{version}")
+
+    def test_resumes_after_pruning(self):
+        self.run_turns(0, TURNS)
+        self.assertEqual(self.graph.get_state(self.config).values, self.expected_values(TURNS))
+        # Pruning runs at each turn's input checkpoint, which leaves the
+        # newest KEEP and then the rest of that turn.
+        stats = self.saver.stats()
+        self.assertEqual(stats["checkpoints"], KEEP + CHECKPOINTS_PER_TURN - 1)
+        self.assertEqual(len(list(self.saver.list(self.config))), stats["checkpoints"])
+
+    def test_kept_checkpoints_keep_their_blobs(self):
+        for i in range(TURNS):
+            self.run_turns(i, i + 1)
+            self.assert_blobs_present()
+        # Every kept checkpoint, not only the newest, still loads in full.
+        for item in self.saver.list(self.config):
+            values = item.checkpoint["channel_values"]
+            self.assertGreaterEqual(len(values["turns"]), TURNS - 1)
+            self.assertGreaterEqual(len(values["replies"]), TURNS - 1)
+        # A thread that shares the file is untouched by another's pruning.
+        other = {"configurable": {"thread_id": "user:other"}}
+        self.graph.invoke(turn_input(0), other)
+        self.run_turns(TURNS, TURNS + 2)
+        self.assertEqual(self.graph.get_state(other).values, self.expected_values(1))
+
+    def test_pending_writes_survive(self):
+        self.run_turns(0, 2)
+        mid_turn = list(self.saver.list(self.config, limit=2))[1].config
+        graph_writes = self.saver.get_tuple(mid_turn).pending_writes
+        self.saver.put_writes(mid_turn, [("replies", ["first"])], "task-1")
+        # Regular writes are kept once per task; special ones are replaced.
+        self.saver.put_writes(mid_turn, [("replies", ["second"])], "task-1")
+        self.saver.put_writes(mid_turn, [(ERROR, "boom")], "task-2")
+        self.saver.put_writes(mid_turn, [(ERROR, "boom again")], "task-2")
+        expected = graph_writes + [("task-1", "replies", ["first"]), ("task-2", ERROR, "boom again")]
+        self.assertCountEqual(self.saver.get_tuple(mid_turn).pending_writes, expected)
+        # The next turn prunes, but mid_turn is still among the newest KEEP.
+        self.run_turns(2, 3)
+        self.assertCountEqual(self.saver.get_tuple(mid_turn).pending_writes, expected)
+        self.assertEqual(self.graph.get_state(self.config).values, self.expected_values(3))
+
+    def test_async_reads_match_sync(self):
+        async def run():
+            for i in range(TURNS):
+                await self.graph.ainvoke(turn_input(i), self.config)
+            listed = [item async for item in self.saver.alist(self.config)]
+            limited = [item async for item in self.saver.alist(self.config, before=listed[0].config, limit=2)]
+            latest = await self.saver.aget_tuple(self.config)
+            oldest = await self.saver.aget_tuple(listed[-1].config)
+            return listed, limited, latest, oldest
+
+        listed, limited, latest, oldest = asyncio.run(run())
+        expected = list(self.saver.list(self.config))
+        self.assertEqual(listed, expected)
+        self.assertEqual(limited, list(self.saver.list(self.config, before=expected[0].config, limit=2)))
+        self.assertEqual(latest, self.saver.get_tuple(self.config))
+        self.assertEqual(oldest, self.saver.get_tuple(expected[-1].config))
+        self.assertEqual(latest.checkpoint["channel_values"], self.expected_values(TURNS))
+        self.assertEqual(len(expected), KEEP + CHECKPOINTS_PER_TURN - 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
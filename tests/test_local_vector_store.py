@@ -0,0 +1,74 @@
+"""
+LocalVectorStore shards shared by several processes, and left behind by a
+write that crashed part way.
+
+    python -m unittest discover tests
+"""
+import multiprocessing
+import tempfile
+import unittest
+
+import numpy as np
+from langchain_core.documents import Document
+
+from AIFlow.memory.local_vector_store import LocalVectorStore
+
+
+def vector(j):
+    v = np.zeros(8)
+    v[j % 8], v[(j + 1) % 8] = 1, j / 1000
+    return (v / np.linalg.norm(v)).tolist()
+
+
+def add(root, first, count):
+    store = LocalVectorStore(None, root)
+    for j in range(first, first + count):
+        store.add_vectors([vector(j)], [Document(page_content=f"doc {j}", metadata={"user_id": "u", "j": j})])
+
+
+class LocalVectorStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def assertAligned(self, count):
+        shard = LocalVectorStore(None, self.root)._shard("u")
+        self.assertEqual(len(shard.docs), count)
+        for row, doc in zip(shard.matrix, shard.docs):
+            np.testing.assert_allclose(row, vector(doc["metadata"]["j"]), rtol=1e-6)
+
+    def test_processes_sharing_a_directory(self):
+        reader = LocalVectorStore(None, self.root)
+        workers = [multiprocessing.Process(target=add, args=(self.root, w * 1000, 50)) for w in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertAligned(200)
+        [(doc, _)] = reader.similarity_search_by_vector_with_relevance_scores(vector(3007), k=1, filter={"user_id": "u"})
+        self.assertEqual(doc.metadata["j"], 3007)
+
+    def test_append_after_a_crash(self):
+        add(self.root, 0, 10)
+        shard = LocalVectorStore(None, self.root)._shard("u")
+        # Vectors written, their documents not, the last line cut short.
+        with open(shard.vectors_path, "ab") as f:
+            f.write(np.ones(8 * 3, dtype=np.float32).tobytes())
+        with open(shard.docs_path, "ab") as f:
+            f.write(b'{"id": "x", "cont')
+        self.assertAligned(10)
+        add(self.root, 10, 5)
+        self.assertAligned(15)
+
+    def test_ids_already_stored_are_skipped(self):
+        store = LocalVectorStore(None, self.root)
+        docs = [Document(page_content=f"doc {j}", metadata={"user_id": "u", "j": j}) for j in range(4)]
+        ids = [f"id{j}" for j in range(4)]
+        store.add_vectors([vector(j) for j in range(2)], docs[:2], ids[:2])
+        store.add_vectors([vector(j) for j in range(4)], docs, ids)
+        store.add_vectors([vector(3), vector(3)], [docs[3], docs[3]], [ids[3], ids[3]])
+        self.assertEqual([doc["id"] for doc in store._shard("u").docs], ids)
+        self.assertAligned(4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+"""
+Differential tests for the PII guardrail: the trigger-gated GuardrailEngine
+must flag exactly what its patterns flag when run over the whole text, and
+everything the original detect_pii regexes it kept verbatim flagged.
+
+    python -m unittest discover tests
+"""
+import random
+import re
+import unittest
+
+from AIFlow.guardrails.pii_detection import PII_PATTERNS, detect_pii, pii_guardrails
+from benchmarks.guardrails_bench import LEGACY_PII
+
+# The ssn, phone and zip patterns are unchanged; the email and card ones
+# were rewritten to be linear-time.
+UNCHANGED = LEGACY_PII[:3]
+ALPHABET = "0123456789 -@._ab"
+
+
+def full_scan(text: str) -> bool:
+    return any(re.search(pattern, text) for pattern, _ in PII_PATTERNS.values())
+
+
+def legacy_detect_pii(text: str) -> bool:
+    return any(re.search(pattern, text) for pattern in LEGACY_PII)
+
+
+class PIIDetectionTest(unittest.TestCase):
+    def test_digits_inside_an_email_window(self):
+        for text in ["call @5551234567", "ping @123-45-6789 asap", "x@12345", "a.b@ex.com 12345", "12345@x.com"]:
+            with self.subTest(text=text):
+                self.assertTrue(legacy_detect_pii(text))
+                self.assertTrue(detect_pii(text))
+
+    def test_matches_patterns_over_the_whole_text(self):
+        rng = random.Random(0)
+        for _ in range(20000):
+            text = "".join(rng.choice(ALPHABET) for _ in range(rng.randint(1, 40)))
+            self.assertEqual(detect_pii(text), full_scan(text), repr(text))
+
+    def test_covers_legacy_matches(self):
+        # A gate's patterns run as one alternation, so a hit can be reported
+        # under another label (a card number over a phone number) but never
+        # missed.
+        rng = random.Random(1)
+        for _ in range(20000):
+            text = "".join(rng.choice(ALPHABET) for _ in range(rng.randint(1, 40)))
+            matches = pii_guardrails.scan(text)
+            self.assertEqual(detect_pii(text), bool(matches))
+            for pattern in UNCHANGED:
+                for legacy in re.finditer(pattern, text):
+                    self.assertTrue(
+                        any(m.start < legacy.end() and legacy.start() < m.end for m in matches),
+                        f"{pattern}: {text!r}",
+                    )
+
+
+if __name__ == "__main__":
+    unittest.main()
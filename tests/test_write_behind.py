@@ -0,0 +1,84 @@
+"""
+MemoryLogWriter must write around rows the database rejects instead of
+retrying them forever.
+
+    python -m unittest discover tests
+"""
+import threading
+import unittest
+
+from AIFlow.memory.write_behind import MemoryLogWriter
+
+
+class Rejected(Exception):
+    pass
+
+
+class FakeTable:
+    def __init__(self, bad_ids=(), transient_failures=0):
+        self.rows = []
+        self.bad_ids = set(bad_ids)
+        self.transient_failures = transient_failures
+        self.lock = threading.Lock()
+
+    def insert(self, rows):
+        with self.lock:
+            if self.transient_failures:
+                self.transient_failures -= 1
+                raise ConnectionError("connection reset")
+            if any(row["id"] in self.bad_ids for row in rows):
+                raise Rejected("check constraint violated")
+            self.rows.extend(rows)
+
+
+def make_rows(count):
+    return [{"id": str(i), "user_id": "u", "thread_id": "t"} for i in range(count)]
+
+
+class MemoryLogWriterTest(unittest.TestCase):
+    def writer(self, table, dead, **kwargs):
+        return MemoryLogWriter(
+            table.insert,
+            batch_size=16,
+            flush_interval=0.01,
+            max_backoff=0.01,
+            is_permanent=lambda e: isinstance(e, Rejected),
+            dead_letter=lambda rows, e: dead.extend(rows),
+            **kwargs,
+        )
+
+    def test_rejected_rows_are_dead_lettered(self):
+        table, dead = FakeTable(bad_ids={"3", "40"}), []
+        writer = self.writer(table, dead)
+        rows = make_rows(100)
+        for row in rows:
+            writer.submit(row)
+        self.assertTrue(writer.flush(timeout=10))
+        writer.close()
+        self.assertEqual([row["id"] for row in dead], ["3", "40"])
+        self.assertEqual(table.rows, [row for row in rows if row["id"] not in ("3", "40")])
+
+    def test_transient_errors_are_retried(self):
+        table, dead = FakeTable(transient_failures=3), []
+        writer = self.writer(table, dead)
+        rows = make_rows(20)
+        for row in rows:
+            writer.submit(row)
+        self.assertTrue(writer.flush(timeout=10))
+        writer.close()
+        self.assertEqual(dead, [])
+        self.assertEqual(table.rows, rows)
+
+    def test_gives_up_after_max_attempts(self):
+        table, dead = FakeTable(transient_failures=10 ** 6), []
+        writer = self.writer(table, dead, max_attempts=2)
+        rows = make_rows(4)
+        for row in rows:
+            writer.submit(row)
+        self.assertTrue(writer.flush(timeout=10))
+        writer.close()
+        self.assertEqual(dead, rows)
+
+
+if __name__ == "__main__":
+    unittest.main()